@@ -1,12 +1,163 @@
 import argparse
+import asyncio
+import json
+import sys
+import time
+import uuid
+from typing import Iterator, Optional, TextIO
+
 from langchain_core.messages import HumanMessage
+from agent.cascade import summarize_cascade
+from agent.checkpoint import (
+    acheckpointed_graph,
+    arun_or_resume,
+    checkpointed_graph,
+    run_or_resume,
+)
 from agent.graph import graph
+from agent.sources import cited_sources
+from agent.telemetry import NodeTimer, summarize_run
+
+
+def build_state(question: Optional[str], args: argparse.Namespace) -> Optional[dict]:
+    """Build the initial graph state for a question, None to resume without one."""
+    if question is None:
+        return None
+    return {
+        "messages": [HumanMessage(content=question)],
+        "initial_search_query_count": args.initial_queries,
+        "max_research_loops": args.max_loops,
+        "reasoning_model": args.reasoning_model,
+    }
+
+
+def run_config(args: argparse.Namespace, **configurable) -> dict:
+    """Build the runnable config of a run, with the latency budget of the arguments."""
+    if args.deadline_ms:
+        configurable["deadline_ms"] = args.deadline_ms
+    if args.no_answer_cache:
+        configurable["bypass_answer_cache"] = True
+    return {"configurable": configurable}
+
+
+def checkpoint_thread_id(args: argparse.Namespace) -> str:
+    """Get the thread id of a checkpointed run: the one to `--resume`, or a fresh one."""
+    return args.resume or f"cli-{uuid.uuid4().hex[:16]}"
+
+
+def read_questions(stream: TextIO) -> Iterator[dict]:
+    """Read questions from JSONL lines.
+
+    Each line is either an object with a `question` (and optional `id`) key, a JSON
+    string or plain text. Questions without an id are numbered by their line.
+    """
+    for line_number, line in enumerate(stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            item = json.loads(line)
+        except json.JSONDecodeError:
+            item = line
+        if not isinstance(item, dict):
+            item = {"question": str(item)}
+        item.setdefault("id", line_number)
+        yield item
+
+
+def completed_ids(output_path: Optional[str]) -> set:
+    """Get the ids already answered in an existing output file, to resume a batch."""
+    if not output_path:
+        return set()
+    done = set()
+    try:
+        with open(output_path, encoding="utf-8") as file:
+            for line in file:
+                try:
+                    result = json.loads(line)
+                except json.JSONDecodeError:
+                    # Partially written line of an interrupted run
+                    continue
+                if "error" not in result:
+                    done.add(str(result["id"]))
+    except FileNotFoundError:
+        pass
+    return done
+
+
+async def research(item: dict, args: argparse.Namespace, runner=graph) -> dict:
+    """Research a single question and build its JSONL result.
+
+    With a checkpointed `runner`, the question is checkpointed under the thread id of
+    the batch, so `--resume` of the batch resumes it from its checkpoint.
+    """
+    timer = NodeTimer()
+    thread_id = (
+        f"{args.thread_id}-{item['id']}"
+        if args.checkpoint
+        else f"cli-{item['id']}-{uuid.uuid4()}"
+    )
+    config = {"callbacks": [timer], **run_config(args, thread_id=thread_id)}
+    start = time.perf_counter()
+    try:
+        if args.checkpoint:
+            state = await arun_or_resume(
+                runner, build_state(item["question"], args), config
+            )
+        else:
+            state = await runner.ainvoke(build_state(item["question"], args), config)
+    except Exception as exc:  # Report the failure and keep going with the batch
+        return {"id": item["id"], "question": item["question"], "error": repr(exc)}
+    answer = state["messages"][-1].content
+    return {
+        "id": item["id"],
+        "question": item["question"],
+        "answer": answer,
+        "cached": state.get("answer_cached", False),
+        "sources": cited_sources(answer, state.get("sources_gathered", [])),
+        "elapsed_ms": 1000 * (time.perf_counter() - start),
+        "node_timings": timer.summary(),
+        "telemetry": summarize_run(state.get("telemetry", [])),
+        "budget_decisions": state.get("budget_decisions", []),
+        "cascade": summarize_cascade(state.get("cascade_stats", {})),
+    }
+
+
+async def run_batch(args: argparse.Namespace) -> None:
+    """Research all questions of the batch concurrently, writing results as they finish."""
+    done = completed_ids(args.output)
+    source = sys.stdin if args.batch == "-" else open(args.batch, encoding="utf-8")
+    with source:
+        items = [item for item in read_questions(source) if str(item["id"]) not in done]
+    if done:
+        print(f"Resuming: skipping {len(done)} answered questions", file=sys.stderr)
+
+    output = open(args.output, "a", encoding="utf-8") if args.output else sys.stdout
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def run_one(item: dict, runner) -> None:
+        async with semaphore:
+            result = await research(item, args, runner)
+        output.write(json.dumps(result, ensure_ascii=False) + "\n")
+        output.flush()
+
+    try:
+        if args.checkpoint:
+            args.thread_id = checkpoint_thread_id(args)
+            print(f"Thread id: {args.thread_id}", file=sys.stderr)
+            async with acheckpointed_graph(args.checkpoint) as runner:
+                await asyncio.gather(*(run_one(item, runner) for item in items))
+        else:
+            await asyncio.gather(*(run_one(item, graph) for item in items))
+    finally:
+        if output is not sys.stdout:
+            output.close()
 
 
 def main() -> None:
     """Run the research agent from the command line."""
     parser = argparse.ArgumentParser(description="Run the LangGraph research agent")
-    parser.add_argument("question", help="Research question")
+    parser.add_argument("question", nargs="?", help="Research question")
     parser.add_argument(
         "--initial-queries",
         type=int,
@@ -24,20 +175,81 @@ def main() -> None:
         default="gemini-2.5-pro-preview-05-06",
         help="Model for the final answer",
     )
+    parser.add_argument(
+        "--deadline-ms",
+        type=int,
+        help="Latency budget of each run: fewer queries, loops or a faster answer "
+        "model are used to answer within it (default: research to full depth)",
+    )
+    parser.add_argument(
+        "--no-answer-cache",
+        action="store_true",
+        help="Research the question even if a fresh answer is cached",
+    )
+    parser.add_argument(
+        "--batch",
+        help="JSONL file of questions to research, or '-' to read them from stdin",
+    )
+    parser.add_argument(
+        "--output",
+        help="JSONL file the batch results are appended to (default: stdout). "
+        "Questions already answered in it are skipped, so an interrupted batch resumes.",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=8,
+        help="Maximum number of questions researched at the same time in batch mode",
+    )
+    parser.add_argument(
+        "--checkpoint",
+        metavar="PATH",
+        help="SQLite file checkpointing the runs under a fresh thread id, printed to "
+        "stderr, so an interrupted run can be resumed with --resume",
+    )
+    parser.add_argument(
+        "--resume",
+        metavar="THREAD_ID",
+        help="Thread id of the checkpointed run (or batch) to resume, or replay if it "
+        "finished. A different question starts a new turn of the thread",
+    )
+    parser.add_argument(
+        "--telemetry",
+        action="store_true",
+        help="Print the per-node latency and token usage of the run to stderr",
+    )
     args = parser.parse_args()
 
-    state = {
-        "messages": [HumanMessage(content=args.question)],
-        "initial_search_query_count": args.initial_queries,
-        "max_research_loops": args.max_loops,
-        "reasoning_model": args.reasoning_model,
-    }
+    if args.concurrency < 1:
+        parser.error("--concurrency must be at least 1")
+    if args.batch:
+        asyncio.run(run_batch(args))
+        return
+    if args.resume and not args.checkpoint:
+        parser.error("--resume requires --checkpoint")
+    if not args.question and not args.resume:
+        parser.error("a question, --resume or --batch is required")
 
-    result = graph.invoke(state)
+    if args.checkpoint:
+        thread_id = checkpoint_thread_id(args)
+        print(f"Thread id: {thread_id}", file=sys.stderr)
+        with checkpointed_graph(args.checkpoint) as runner:
+            result = run_or_resume(
+                runner,
+                build_state(args.question, args),
+                run_config(args, thread_id=thread_id),
+            )
+    else:
+        result = graph.invoke(build_state(args.question, args), run_config(args))
     messages = result.get("messages", [])
     if messages:
         print(messages[-1].content)
+    if args.telemetry:
+        print(
+            json.dumps(summarize_run(result.get("telemetry", [])), indent=2),
+            file=sys.stderr,
+        )
 
 
-if __name__ === "__main__":
+if __name__ == "__main__":
     main()
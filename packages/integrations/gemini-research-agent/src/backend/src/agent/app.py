@@ -1,11 +1,248 @@
 # mypy: disable - error - code = "no-untyped-def,misc"
+import asyncio
+import contextlib
+import json
 import pathlib
-from fastapi import FastAPI, Response
+import uuid
+from typing import Optional
+
+from fastapi import FastAPI, HTTPException, Response
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
+from langchain_core.messages import HumanMessage
+
+from agent.checkpoint import (
+    acheckpointed_graph,
+    checkpoints_enabled,
+    continues_run,
+    is_finished,
+)
+from agent.codec import CODECS, EVENT_STREAM_MEDIA_TYPE, EventStreamEncoder
+from agent.graph import graph
+from agent.sources import citation_expander, cited_sources
+from agent.telemetry import metrics, summarize_run
 
 # Define the FastAPI app
 app = FastAPI()
 
+# The checkpointed graph of the streaming endpoint, opened on the first request
+_checkpoints = contextlib.AsyncExitStack()
+_checkpointed_graph = None
+_checkpointed_graph_lock = asyncio.Lock()
+app.router.add_event_handler("shutdown", _checkpoints.aclose)
+
+
+async def get_checkpointed_graph():
+    """Get the research graph persisting its runs in the SQLite checkpoint database.
+
+    Without `CHECKPOINT_PATH`, runs aren't checkpointed and the plain graph is returned.
+    """
+    global _checkpointed_graph
+    if not checkpoints_enabled():
+        return graph
+    async with _checkpointed_graph_lock:
+        if _checkpointed_graph is None:
+            _checkpointed_graph = await _checkpoints.enter_async_context(
+                acheckpointed_graph()
+            )
+    return _checkpointed_graph
+
+
+def format_sse(event: str, data) -> str:
+    """Format a Server-Sent Event with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def _chunk_text(chunk) -> str:
+    """Get the text of a streamed message chunk."""
+    if isinstance(chunk.content, str):
+        return chunk.content
+    return "".join(
+        part.get("text", "") if isinstance(part, dict) else str(part)
+        for part in chunk.content
+    )
+
+
+async def stream_research(
+    question: str, state: dict, config: dict, runner=graph, encode=format_sse
+):
+    """Run the research graph and yield its progress and answer as Server-Sent Events.
+
+    Emits `queries`, `web_research` (once per branch) and `reflection` events as the
+    nodes finish, then the answer of `finalize_answer` as `token` events with the short
+    urls already expanded, the complete `answer` and the per-node `telemetry` of the run.
+    Citations are expanded with the source registry of the graph state: branches are
+    streamed in the order they finish, but merged into the registry (and numbered)
+    in the order they were sent.
+
+    With a checkpointed `runner`, a finished run of the same question is replayed from
+    its checkpoint (a single `answer` event marked as replayed) and an interrupted one
+    resumes where it stopped; a new question starts a new turn of the thread.
+
+    Events are encoded by `encode(event, data)`, as Server-Sent Events by default or
+    e.g. with an `agent.codec.EventStreamEncoder`.
+    """
+    yield encode(
+        "start",
+        {"question": question, "thread_id": config["configurable"]["thread_id"]},
+    )
+
+    registry = {}
+    telemetry = []
+    if runner.checkpointer is not None:
+        snapshot = await runner.aget_state(config)
+        continued = continues_run(snapshot, state)
+        if continued and is_finished(snapshot):
+            content = snapshot.values["messages"][-1].content
+            yield encode(
+                "answer",
+                {
+                    "content": content,
+                    "sources": cited_sources(
+                        content, snapshot.values.get("sources_gathered", [])
+                    ),
+                    "replayed": True,
+                },
+            )
+            yield encode(
+                "telemetry", summarize_run(snapshot.values.get("telemetry", []))
+            )
+            yield encode("end", {})
+            return
+        registry = snapshot.values.get("source_registry") or {}
+        if continued:
+            # Resume from the last checkpoint, keeping the finished branches
+            state = None
+            telemetry.extend(snapshot.values.get("telemetry", []))
+
+    expander = None
+    async for mode, chunk in runner.astream(
+        state, config, stream_mode=["updates", "values", "messages"]
+    ):
+        if mode == "values":
+            # The registry as merged by the graph, with the sources of earlier turns
+            registry = chunk.get("source_registry") or {}
+            continue
+        if mode == "messages":
+            message, metadata = chunk
+            if metadata.get("langgraph_node") != "finalize_answer":
+                continue
+            if expander is None:
+                expander = citation_expander(registry)
+            text = expander.feed(_chunk_text(message))
+            if text:
+                yield encode("token", {"text": text})
+            continue
+
+        for node, update in chunk.items():
+            if not update:
+                continue
+            telemetry.extend(update.get("telemetry", []))
+            if node == "answer_cache" and update["answer_cached"]:
+                yield encode(
+                    "answer",
+                    {
+                        "content": update["messages"][-1].content,
+                        "sources": update["sources_gathered"],
+                        "cached": True,
+                    },
+                )
+            elif node == "generate_query":
+                yield encode("queries", {"queries": update["search_query"]})
+            elif node == "web_research" and "search_query" in update:
+                # Stragglers that gave up their search report no result
+                yield encode(
+                    "web_research",
+                    {
+                        "query": update["search_query"][0],
+                        "sources": len(update["source_registry"]["urls"]),
+                        "retrieval": update["retrieval_sources"][0]["source"],
+                    },
+                )
+            elif node == "reflection":
+                yield encode(
+                    "reflection",
+                    {
+                        "is_sufficient": update["is_sufficient"],
+                        "knowledge_gap": update["knowledge_gap"],
+                        "follow_up_queries": update["follow_up_queries"],
+                        "research_loop_count": update["research_loop_count"],
+                    },
+                )
+            elif node == "finalize_answer":
+                if expander is not None:
+                    text = expander.flush()
+                    if text:
+                        yield encode("token", {"text": text})
+                yield encode(
+                    "answer",
+                    {
+                        "content": update["messages"][-1].content,
+                        "sources": update["sources_gathered"],
+                        "cached": False,
+                    },
+                )
+    yield encode("telemetry", summarize_run(telemetry))
+    yield encode("end", {})
+
+
+@app.get("/research/stream")
+async def research_stream(
+    question: str,
+    initial_search_query_count: Optional[int] = None,
+    max_research_loops: Optional[int] = None,
+    reasoning_model: Optional[str] = None,
+    thread_id: Optional[str] = None,
+    deadline_ms: Optional[int] = None,
+    bypass_cache: bool = False,
+    codec: str = "json",
+):
+    """Stream a research run as Server-Sent Events, see `stream_research`.
+
+    With `CHECKPOINT_PATH` set, runs are checkpointed under the `thread_id` sent in the
+    `start` event. A client that reconnects with it and the same question gets the
+    finished answer replayed, or the interrupted run resumed, without recomputing the
+    finished steps; a different question starts a new turn of the thread. With
+    `codec=msgpack+zstd` the events are sent as a compressed binary stream instead, see
+    `agent.codec`.
+    """
+    if codec not in CODECS:
+        raise HTTPException(
+            status_code=400, detail=f"Unknown codec {codec!r}, expected one of {CODECS}"
+        )
+    state = {"messages": [HumanMessage(content=question)]}
+    if initial_search_query_count is not None:
+        state["initial_search_query_count"] = initial_search_query_count
+    if max_research_loops is not None:
+        state["max_research_loops"] = max_research_loops
+    if reasoning_model is not None:
+        state["reasoning_model"] = reasoning_model
+    config = {"configurable": {"thread_id": thread_id or str(uuid.uuid4())}}
+    if deadline_ms is not None:
+        config["configurable"]["deadline_ms"] = deadline_ms
+    if bypass_cache:
+        config["configurable"]["bypass_answer_cache"] = True
+    runner = await get_checkpointed_graph()
+    if codec == "msgpack+zstd":
+        return StreamingResponse(
+            stream_research(question, state, config, runner, EventStreamEncoder()),
+            media_type=EVENT_STREAM_MEDIA_TYPE,
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+    return StreamingResponse(
+        stream_research(question, state, config, runner),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Serve the node latency and token usage metrics in the Prometheus text format."""
+    return PlainTextResponse(
+        metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
 
 def create_frontend_router(build_dir="../frontend/dist"):
     """Creates a router to serve the React frontend.
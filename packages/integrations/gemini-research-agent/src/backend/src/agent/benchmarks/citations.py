@@ -0,0 +1,142 @@
+"""Micro-benchmark of the citation processing of grounded search responses.
+
+Builds synthetic grounding responses from 1 KB to 1 MB and times `get_citations`
+plus `insert_citation_markers` against the previous string-rebuilding implementation.
+
+Usage:
+    python -m agent.benchmarks.citations [--repeat 5] [--arabic]
+"""
+
+import argparse
+import random
+import time
+from types import SimpleNamespace
+from typing import Callable, List
+
+from agent.utils import get_citations, insert_citation_markers, resolve_urls
+
+SIZES = [1_000, 10_000, 100_000, 1_000_000]
+
+_ENGLISH_WORDS = "the market grew by percent in while analysts expect revenue".split()
+_ARABIC_WORDS = "نما السوق بنسبة في المئة خلال العام بينما يتوقع المحللون".split()
+
+
+def synthetic_response(size: int, arabic: bool = False, seed: int = 0):
+    """Build a grounded response of about `size` UTF-8 bytes with a support every ~200 bytes."""
+    rng = random.Random(seed)
+    words = _ARABIC_WORDS if arabic else _ENGLISH_WORDS
+    sentences = []
+    length = 0
+    while length < size:
+        sentence = " ".join(rng.choice(words) for _ in range(rng.randint(8, 30))) + ". "
+        sentences.append(sentence)
+        length += len(sentence.encode("utf-8"))
+    text = "".join(sentences)
+
+    chunk_count = max(5, min(200, size // 2_000))
+    chunks = [
+        SimpleNamespace(
+            web=SimpleNamespace(
+                uri=f"https://vertexaisearch.cloud.google.com/grounding-api-redirect/{i:040d}",
+                title=f"source{i}.com",
+            )
+        )
+        for i in range(chunk_count)
+    ]
+
+    supports = []
+    offset = 0
+    for sentence in sentences:
+        start = offset
+        offset += len(sentence.encode("utf-8"))
+        supports.append(
+            SimpleNamespace(
+                segment=SimpleNamespace(start_index=start, end_index=offset - 1),
+                grounding_chunk_indices=rng.sample(
+                    range(chunk_count), rng.randint(1, 3)
+                ),
+            )
+        )
+
+    metadata = SimpleNamespace(grounding_chunks=chunks, grounding_supports=supports)
+    return SimpleNamespace(
+        text=text, candidates=[SimpleNamespace(grounding_metadata=metadata)]
+    )
+
+
+def quadratic_insert_citation_markers(text, citations_list):
+    """Insert citation markers like the previous implementation, rebuilding the string once per citation."""
+    sorted_citations = sorted(
+        citations_list, key=lambda c: (c["end_index"], c["start_index"]), reverse=True
+    )
+    modified_text = text
+    for citation_info in sorted_citations:
+        end_idx = citation_info["end_index"]
+        marker_to_insert = ""
+        for segment in citation_info["segments"]:
+            marker_to_insert += f" [{segment['label']}]({segment['short_url']})"
+        modified_text = (
+            modified_text[:end_idx] + marker_to_insert + modified_text[end_idx:]
+        )
+    return modified_text
+
+
+def _best_time(func: Callable[[], object], repeat: int) -> float:
+    timings: List[float] = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def run(repeat: int = 5, arabic: bool = False) -> List[dict]:
+    """Time the citation processing for every size in `SIZES`."""
+    results = []
+    for size in SIZES:
+        response = synthetic_response(size, arabic=arabic)
+        chunks = response.candidates[0].grounding_metadata.grounding_chunks
+        resolved_urls = resolve_urls(chunks, 0)
+        citations = get_citations(response, resolved_urls)
+        results.append(
+            {
+                "size_bytes": size,
+                "citations": len(citations),
+                "get_citations_ms": 1000
+                * _best_time(lambda: get_citations(response, resolved_urls), repeat),
+                "insert_markers_ms": 1000
+                * _best_time(
+                    lambda: insert_citation_markers(response.text, citations), repeat
+                ),
+                "quadratic_insert_markers_ms": 1000
+                * _best_time(
+                    lambda: quadratic_insert_citation_markers(response.text, citations),
+                    repeat,
+                ),
+            }
+        )
+    return results
+
+
+def main() -> None:
+    """Print the citation processing benchmark as a table."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per measurement")
+    parser.add_argument(
+        "--arabic", action="store_true", help="Use Arabic (multi-byte) text"
+    )
+    args = parser.parse_args()
+
+    print(
+        f"{'size':>10} {'citations':>10} {'get_citations':>14} {'insert':>10} {'quadratic':>10}"
+    )
+    for row in run(repeat=args.repeat, arabic=args.arabic):
+        print(
+            f"{row['size_bytes']:>10} {row['citations']:>10} "
+            f"{row['get_citations_ms']:>12.2f}ms {row['insert_markers_ms']:>8.2f}ms "
+            f"{row['quadratic_insert_markers_ms']:>8.2f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
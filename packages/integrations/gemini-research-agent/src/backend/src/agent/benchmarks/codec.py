@@ -0,0 +1,220 @@
+"""Benchmark of the msgpack+zstd codec against JSON on multi-loop research runs.
+
+Runs the research graph against the stub Gemini backend (see `agent.benchmarks.stub`)
+for several initial query counts and research loops, then encodes every state
+snapshot of the runs (as checkpointed after each step) and their stream events with:
+
+- json: `json.dumps` of the state (messages via `langchain_core.load.dumpd`) and the
+  Server-Sent Events of `agent.app.format_sse`,
+- msgpack: the default checkpoint serializer of LangGraph (state only),
+- msgpack+zstd: `agent.codec.ZstdSerializer` and `agent.codec.EventStreamEncoder`,
+
+and reports the encoded size and the encode/decode time per run.
+
+Usage:
+    python -m agent.benchmarks.codec [--runs 4] [--repeat 5] [--scenarios 3x1,3x2,5x3]
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from typing import Callable, Dict, List, Tuple
+
+from langchain_core.load import dumpd
+from langchain_core.messages import HumanMessage
+from langgraph.checkpoint.memory import InMemorySaver
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+from agent.app import format_sse, stream_research
+from agent.benchmarks.stub import (
+    LatencyDistribution,
+    StubSettings,
+    install_stub_backend,
+)
+from agent.codec import EventStreamEncoder, ZstdSerializer, decode_event_stream
+from agent.graph import compile_graph
+
+_NO_LATENCY = LatencyDistribution("const", 0.0)
+
+
+def _scenario(value: str) -> Tuple[int, int]:
+    queries, loops = value.split("x")
+    return int(queries), int(loops)
+
+
+async def _research(runner, index: int, queries: int, loops: int):
+    """Run one research and collect its stream events and state snapshots."""
+    question = f"Benchmark question {index}"
+    state = {
+        "messages": [HumanMessage(content=question)],
+        "initial_search_query_count": queries,
+        "max_research_loops": loops,
+    }
+    config = {
+        "configurable": {
+            "thread_id": f"codec-{queries}x{loops}-{index}",
+            "search_cache_path": "",
+            "answer_cache_path": "",
+        }
+    }
+    events = [
+        event
+        async for event in stream_research(
+            question, state, config, runner, encode=lambda event, data: (event, data)
+        )
+    ]
+    snapshots = [
+        snapshot.values async for snapshot in runner.aget_state_history(config)
+    ]
+    return events, snapshots
+
+
+def _best_time(func: Callable[[], object], repeat: int) -> float:
+    timings: List[float] = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def _measure(encode, decode, items: list, repeat: int) -> Dict[str, float]:
+    encoded = [encode(item) for item in items]
+    return {
+        "bytes": sum(len(data) for data in encoded),
+        "encode_ms": 1000
+        * _best_time(lambda: [encode(item) for item in items], repeat),
+        "decode_ms": 1000
+        * _best_time(lambda: [decode(data) for data in encoded], repeat),
+    }
+
+
+def _measure_stream(events: list, repeat: int) -> Dict[str, Dict[str, float]]:
+    def sse_encode():
+        return [format_sse(event, data).encode("utf-8") for event, data in events]
+
+    def sse_decode(chunks):
+        return [
+            json.loads(line[len("data: ") :])
+            for line in b"".join(chunks).decode("utf-8").splitlines()
+            if line.startswith("data: ")
+        ]
+
+    def binary_encode():
+        encoder = EventStreamEncoder()
+        return [encoder(event, data) for event, data in events]
+
+    results = {}
+    for name, encode, decode in (
+        ("json", sse_encode, sse_decode),
+        (
+            "msgpack+zstd",
+            binary_encode,
+            lambda chunks: list(decode_event_stream(chunks)),
+        ),
+    ):
+        chunks = encode()
+        results[name] = {
+            "bytes": sum(map(len, chunks)),
+            "encode_ms": 1000 * _best_time(encode, repeat),
+            "decode_ms": 1000 * _best_time(lambda: decode(chunks), repeat),
+        }
+    return results
+
+
+def run(scenarios: List[Tuple[int, int]], runs: int = 4, repeat: int = 5) -> List[dict]:
+    """Measure the codecs on `runs` research runs of every (queries, loops) scenario."""
+    install_stub_backend(
+        StubSettings(
+            query_latency=_NO_LATENCY,
+            search_latency=_NO_LATENCY,
+            reflection_latency=_NO_LATENCY,
+            answer_latency=_NO_LATENCY,
+            seed=0,
+        )
+    )
+    runner = compile_graph(checkpointer=InMemorySaver())
+    msgpack = JsonPlusSerializer()
+    zstd = ZstdSerializer(min_size=0)
+    state_codecs = {
+        "json": (
+            lambda values: json.dumps(values, default=dumpd, ensure_ascii=False).encode(
+                "utf-8"
+            ),
+            json.loads,
+        ),
+        "msgpack": (
+            lambda values: msgpack.dumps_typed(values)[1],
+            lambda data: msgpack.loads_typed(("msgpack", data)),
+        ),
+        "msgpack+zstd": (
+            lambda values: zstd.dumps_typed(values)[1],
+            lambda data: zstd.loads_typed(("msgpack+zstd", data)),
+        ),
+    }
+
+    results = []
+    for queries, loops in scenarios:
+        researched = [
+            asyncio.run(_research(runner, index, queries, loops))
+            for index in range(runs)
+        ]
+        snapshots = [
+            snapshot for _, run_snapshots in researched for snapshot in run_snapshots
+        ]
+        events = [event for run_events, _ in researched for event in run_events]
+
+        def per_run(measures: Dict[str, float]) -> Dict[str, float]:
+            return {key: value / runs for key, value in measures.items()}
+
+        results.append(
+            {
+                "scenario": f"{queries}x{loops}",
+                "snapshots_per_run": len(snapshots) / runs,
+                "events_per_run": len(events) / runs,
+                "state": {
+                    name: per_run(_measure(encode, decode, snapshots, repeat))
+                    for name, (encode, decode) in state_codecs.items()
+                },
+                "stream": {
+                    name: per_run(measures)
+                    for name, measures in _measure_stream(events, repeat).items()
+                },
+            }
+        )
+    return results
+
+
+def main() -> None:
+    """Print the codec benchmark as a table."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--scenarios",
+        type=lambda value: [_scenario(item) for item in value.split(",") if item],
+        default=[(3, 1), (3, 2), (5, 3)],
+        help="Initial queries x research loops, e.g. 3x1,5x3",
+    )
+    parser.add_argument(
+        "--runs", type=int, default=4, help="Research runs per scenario"
+    )
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per measurement")
+    args = parser.parse_args()
+
+    print(
+        f"{'scenario':>8} {'payload':>7} {'codec':>13} {'KiB/run':>9} {'ratio':>6} "
+        f"{'encode':>10} {'decode':>10}"
+    )
+    for row in run(args.scenarios, runs=args.runs, repeat=args.repeat):
+        for payload in ("state", "stream"):
+            baseline = row[payload]["json"]["bytes"]
+            for codec, measures in row[payload].items():
+                print(
+                    f"{row['scenario']:>8} {payload:>7} {codec:>13} "
+                    f"{measures['bytes'] / 1024:>9.1f} {measures['bytes'] / baseline:>6.2f} "
+                    f"{measures['encode_ms']:>8.2f}ms {measures['decode_ms']:>8.2f}ms"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""Cold-start benchmark of importing and compiling the research graph.
+
+Imports `agent.graph` in fresh interpreters with `python -X importtime` and without
+any Gemini credentials, then reports the median import time, the slowest imported
+modules and whether any Gemini SDK was imported eagerly. Fails when the median
+exceeds the cold-start budget or an SDK shows up, so it can guard worker startup.
+
+Usage:
+    python -m agent.benchmarks.import_time --runs 5 --budget-ms 1500
+"""
+
+import argparse
+import json
+import os
+import platform
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+from typing import Dict, List
+
+# Modules that must only be imported when the first Gemini client is built
+LAZY_MODULES = ("google.genai", "langchain_google_genai")
+
+_IMPORT_TIME_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)$")
+
+
+def profile_import(module: str) -> List[Dict]:
+    """Import `module` in a fresh interpreter and parse its `-X importtime` profile.
+
+    Returns:
+        list: One entry per imported module with its name, nesting depth and self and
+              cumulative import times in milliseconds, in import order.
+    """
+    env = {
+        name: value
+        for name, value in os.environ.items()
+        if not name.startswith("GEMINI_")
+    }
+    env["PYTHONPATH"] = os.pathsep.join(
+        filter(None, [*sys.path, env.get("PYTHONPATH")])
+    )
+    # Run outside the project so no `.env` file could be picked up
+    with tempfile.TemporaryDirectory() as directory:
+        process = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            cwd=directory,
+            env=env,
+            capture_output=True,
+            text=True,
+        )
+    if process.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{process.stderr}")
+    entries = []
+    for line in process.stderr.splitlines():
+        match = _IMPORT_TIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            entries.append(
+                {
+                    "module": name,
+                    "depth": len(indent) // 2,
+                    "self_ms": int(self_us) / 1000,
+                    "cumulative_ms": int(cumulative_us) / 1000,
+                }
+            )
+    return entries
+
+
+def total_ms(entries: List[Dict]) -> float:
+    """Get the time of the top-level imports of a profile, in milliseconds."""
+    return sum(entry["cumulative_ms"] for entry in entries if entry["depth"] == 0)
+
+
+def main() -> None:
+    """Profile cold imports of the graph and check them against the budget."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--module", default="agent.graph", help="Module to import")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters to run")
+    parser.add_argument(
+        "--budget-ms",
+        type=float,
+        default=1500,
+        help="Cold-start budget of the median import time",
+    )
+    parser.add_argument(
+        "--top", type=int, default=15, help="Number of slowest modules to list"
+    )
+    parser.add_argument("--save", help="Write the report to this JSON file")
+    args = parser.parse_args()
+
+    profiles = [profile_import(args.module) for _ in range(args.runs)]
+    totals = [total_ms(profile) for profile in profiles]
+    median = statistics.median(totals)
+    median_profile = profiles[totals.index(min(totals, key=lambda t: abs(t - median)))]
+    eager = sorted(
+        {
+            entry["module"]
+            for entry in median_profile
+            if entry["module"].startswith(LAZY_MODULES)
+        }
+    )
+
+    print(
+        f"import {args.module}: median {median:.0f}ms "
+        f"(min {min(totals):.0f}ms, max {max(totals):.0f}ms, budget {args.budget_ms:.0f}ms)"
+    )
+    for entry in sorted(
+        median_profile, key=lambda entry: entry["self_ms"], reverse=True
+    )[: args.top]:
+        print(
+            f"  {entry['module']:<50} self {entry['self_ms']:7.1f}ms "
+            f"cumulative {entry['cumulative_ms']:7.1f}ms"
+        )
+
+    if args.save:
+        with open(args.save, "w") as file:
+            json.dump(
+                {
+                    "python": platform.python_version(),
+                    "arguments": vars(args),
+                    "totals_ms": totals,
+                    "median_ms": median,
+                    "eager_modules": eager,
+                    "profile": median_profile,
+                },
+                file,
+                indent=2,
+            )
+
+    failures = []
+    if median > args.budget_ms:
+        failures.append(f"median import time {median:.0f}ms exceeds the budget")
+    if eager:
+        failures.append(f"eagerly imported {', '.join(eager)}")
+    for failure in failures:
+        print(f"FAIL {failure}")
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,275 @@
+r"""Offline benchmark of the research graph against the stub Gemini backend.
+
+Runs batches of concurrent research runs for every combination of initial query
+count and research loops, and reports p50/p95/p99 latencies per node and end to end,
+throughput and peak RSS. Results can be saved as a JSON baseline and compared with
+a previous baseline to spot regressions.
+
+The stub backend never calls Gemini, so no GEMINI_API_KEY is needed.
+
+Usage:
+    python -m agent.benchmarks.research_graph --runs 32 --concurrency 8 \
+        --queries 1,3 --loops 1,2 --save baseline.json
+    python -m agent.benchmarks.research_graph --compare baseline.json
+"""
+
+import argparse
+import asyncio
+import json
+import platform
+import resource
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List
+
+from langchain_core.messages import HumanMessage
+
+from agent.benchmarks.stub import (
+    LatencyDistribution,
+    StubSettings,
+    install_stub_backend,
+)
+from agent.graph import graph
+from agent.telemetry import NODES, NodeTimer
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    """Get the p50/p95/p99 of latency samples, in milliseconds."""
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+
+    def percentile(fraction: float) -> float:
+        return 1000 * ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+    return {
+        "count": len(ordered),
+        "p50_ms": percentile(0.50),
+        "p95_ms": percentile(0.95),
+        "p99_ms": percentile(0.99),
+    }
+
+
+def peak_rss_mb() -> float:
+    """Get the peak resident set size of this process, in MiB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _state(index: int, queries: int, loops: int) -> dict:
+    return {
+        "messages": [HumanMessage(content=f"Benchmark question {index}")],
+        "initial_search_query_count": queries,
+        "max_research_loops": loops,
+    }
+
+
+def _config(index: int, timer: NodeTimer) -> dict:
+    return {
+        "callbacks": [timer],
+        "configurable": {
+            "thread_id": f"benchmark-{index}",
+            # Measure the graph, not the caches
+            "search_cache_path": "",
+            "answer_cache_path": "",
+        },
+    }
+
+
+def run_scenario(
+    runs: int, concurrency: int, queries: int, loops: int, use_async: bool
+) -> Dict[str, Any]:
+    """Run `runs` research runs, `concurrency` at a time, and summarize their latencies."""
+    timer = NodeTimer()
+    end_to_end: List[float] = []
+
+    def run_sync(index: int) -> None:
+        start = time.perf_counter()
+        graph.invoke(_state(index, queries, loops), _config(index, timer))
+        end_to_end.append(time.perf_counter() - start)
+
+    async def run_async() -> None:
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def run_one(index: int) -> None:
+            async with semaphore:
+                start = time.perf_counter()
+                await graph.ainvoke(
+                    _state(index, queries, loops), _config(index, timer)
+                )
+                end_to_end.append(time.perf_counter() - start)
+
+        await asyncio.gather(*(run_one(index) for index in range(runs)))
+
+    start = time.perf_counter()
+    if use_async:
+        asyncio.run(run_async())
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            list(executor.map(run_sync, range(runs)))
+    elapsed = time.perf_counter() - start
+
+    return {
+        "name": f"q{queries}-l{loops}",
+        "initial_search_query_count": queries,
+        "max_research_loops": loops,
+        "runs": runs,
+        "concurrency": concurrency,
+        "elapsed_s": elapsed,
+        "throughput_runs_per_s": runs / elapsed if elapsed else 0.0,
+        "end_to_end": percentiles(end_to_end),
+        "nodes": {node: percentiles(timer.timings[node]) for node in NODES},
+    }
+
+
+def compare(
+    report: Dict[str, Any], baseline: Dict[str, Any], tolerance: float
+) -> List[str]:
+    """List the p95 latencies and throughputs that regressed by more than `tolerance`."""
+    regressions = []
+    baseline_scenarios = {
+        scenario["name"]: scenario for scenario in baseline["scenarios"]
+    }
+    for scenario in report["scenarios"]:
+        previous = baseline_scenarios.get(scenario["name"])
+        if previous is None:
+            continue
+        checks = [("end_to_end", scenario["end_to_end"], previous["end_to_end"])] + [
+            (node, scenario["nodes"][node], previous["nodes"].get(node, {}))
+            for node in NODES
+        ]
+        for label, current, before in checks:
+            if before.get("p95_ms") and current.get("p95_ms", 0) > before["p95_ms"] * (
+                1 + tolerance
+            ):
+                regressions.append(
+                    f"{scenario['name']} {label} p95 {before['p95_ms']:.1f}ms -> {current['p95_ms']:.1f}ms"
+                )
+        if scenario["throughput_runs_per_s"] < previous["throughput_runs_per_s"] * (
+            1 - tolerance
+        ):
+            regressions.append(
+                f"{scenario['name']} throughput {previous['throughput_runs_per_s']:.2f} -> "
+                f"{scenario['throughput_runs_per_s']:.2f} runs/s"
+            )
+    return regressions
+
+
+def _ints(value: str) -> List[int]:
+    return [int(item) for item in value.split(",") if item]
+
+
+def main() -> None:
+    """Run the benchmark matrix and print, save or compare the report."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--runs", type=int, default=16, help="Research runs per scenario"
+    )
+    parser.add_argument(
+        "--concurrency", type=int, default=8, help="Concurrent research runs"
+    )
+    parser.add_argument(
+        "--queries", type=_ints, default=[1, 3], help="Initial query counts, e.g. 1,3,5"
+    )
+    parser.add_argument(
+        "--loops", type=_ints, default=[1, 2], help="Max research loops, e.g. 1,2,3"
+    )
+    parser.add_argument(
+        "--async",
+        dest="use_async",
+        action="store_true",
+        help="Use graph.ainvoke on one event loop",
+    )
+    parser.add_argument(
+        "--query-latency",
+        default="lognormal:300:0.3",
+        help="Query generation latency spec",
+    )
+    parser.add_argument(
+        "--search-latency",
+        default="lognormal:2500:0.5",
+        help="Grounded search latency spec",
+    )
+    parser.add_argument(
+        "--reflection-latency",
+        default="lognormal:1500:0.4",
+        help="Reflection latency spec",
+    )
+    parser.add_argument(
+        "--answer-latency", default="lognormal:4000:0.4", help="Answer latency spec"
+    )
+    parser.add_argument(
+        "--latency-scale",
+        type=float,
+        default=1.0,
+        help="Multiply all latencies, 0 runs at full speed",
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the stub backend")
+    parser.add_argument("--save", help="Write the report to this JSON file")
+    parser.add_argument(
+        "--compare", help="Compare against a JSON baseline and fail on regressions"
+    )
+    parser.add_argument(
+        "--tolerance", type=float, default=0.10, help="Allowed relative regression"
+    )
+    args = parser.parse_args()
+
+    def latency(spec: str) -> LatencyDistribution:
+        distribution = LatencyDistribution.parse(spec)
+        distribution.a *= args.latency_scale
+        if distribution.kind == "uniform":
+            distribution.b *= args.latency_scale
+        return distribution
+
+    install_stub_backend(
+        StubSettings(
+            query_latency=latency(args.query_latency),
+            search_latency=latency(args.search_latency),
+            reflection_latency=latency(args.reflection_latency),
+            answer_latency=latency(args.answer_latency),
+            seed=args.seed,
+        )
+    )
+
+    report = {
+        "python": platform.python_version(),
+        "mode": "async" if args.use_async else "sync",
+        "arguments": vars(args),
+        "scenarios": [
+            run_scenario(args.runs, args.concurrency, queries, loops, args.use_async)
+            for queries in args.queries
+            for loops in args.loops
+        ],
+    }
+    report["peak_rss_mb"] = peak_rss_mb()
+
+    for scenario in report["scenarios"]:
+        e2e = scenario["end_to_end"]
+        print(
+            f"{scenario['name']:>8}: {scenario['throughput_runs_per_s']:.2f} runs/s, "
+            f"end to end p50 {e2e['p50_ms']:.0f}ms p95 {e2e['p95_ms']:.0f}ms p99 {e2e['p99_ms']:.0f}ms"
+        )
+        for node, stats in scenario["nodes"].items():
+            if stats:
+                print(
+                    f"{'':>10}{node:<16} n={stats['count']:<5} p50 {stats['p50_ms']:.0f}ms "
+                    f"p95 {stats['p95_ms']:.0f}ms p99 {stats['p99_ms']:.0f}ms"
+                )
+    print(f"peak RSS: {report['peak_rss_mb']:.1f} MiB")
+
+    if args.save:
+        with open(args.save, "w") as file:
+            json.dump(report, file, indent=2)
+    if args.compare:
+        with open(args.compare) as file:
+            regressions = compare(report, json.load(file), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,280 @@
+"""Local stand-ins for the Gemini clients, for offline benchmarks of the research graph.
+
+`StubGenaiClient` replaces `google.genai.Client` (grounded search) and `StubChatModel`
+replaces `ChatGoogleGenerativeAI`. Both sleep for a latency drawn from a configurable
+distribution and return synthetic but well-formed responses, including grounding
+metadata and usage metadata.
+"""
+
+import asyncio
+import random
+import re
+import threading
+import time
+from dataclasses import dataclass
+from types import SimpleNamespace
+from typing import Dict, Optional, Tuple
+
+from langchain_core.messages import AIMessage
+from langchain_core.runnables import RunnableLambda
+
+from agent.clients import registry
+from agent.tools_and_schemas import (
+    RatedReflection,
+    RatedSearchQueryList,
+    Reflection,
+    SearchQueryList,
+)
+
+_WORDS = (
+    "solar wind battery grid storage policy market growth capacity cost "
+    "efficiency hydrogen nuclear carbon emissions subsidy demand supply"
+).split()
+
+
+@dataclass
+class LatencyDistribution:
+    """A latency distribution in milliseconds.
+
+    Specs have the form `const:MS`, `uniform:LOW:HIGH` or `lognormal:MEDIAN:SIGMA`.
+    """
+
+    kind: str = "const"
+    a: float = 0.0
+    b: float = 0.0
+
+    @classmethod
+    def parse(cls, spec: str) -> "LatencyDistribution":
+        """Parse a latency spec such as `lognormal:800:0.5`."""
+        kind, *params = spec.split(":")
+        if kind not in ("const", "uniform", "lognormal"):
+            raise ValueError(f"Unknown latency distribution: {spec}")
+        values = [float(param) for param in params] + [0.0, 0.0]
+        return cls(kind, values[0], values[1])
+
+    def sample(self, rng: random.Random) -> float:
+        """Draw a latency, in seconds."""
+        if self.kind == "uniform":
+            milliseconds = rng.uniform(self.a, self.b)
+        elif self.kind == "lognormal":
+            milliseconds = self.a * rng.lognormvariate(0.0, self.b)
+        else:
+            milliseconds = self.a
+        return max(milliseconds, 0.0) / 1000
+
+
+@dataclass
+class StubSettings:
+    """Latencies and response shapes of the stub backend."""
+
+    query_latency: LatencyDistribution
+    search_latency: LatencyDistribution
+    reflection_latency: LatencyDistribution
+    answer_latency: LatencyDistribution
+    search_sentences: int = 12
+    grounding_chunks: int = 8
+    follow_up_queries: int = 2
+    # Range the confidence of the rated outputs of the cascade model is drawn from
+    confidence: Tuple[float, float] = (0.5, 1.0)
+    seed: Optional[int] = None
+
+
+class _Randomness:
+    """A thread-safe random source shared by all stub clients."""
+
+    def __init__(self, seed: Optional[int]) -> None:
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        method = getattr(self._rng, name)
+
+        def locked(*args, **kwargs):
+            with self._lock:
+                return method(*args, **kwargs)
+
+        return locked
+
+
+def _words(rng, count: int) -> str:
+    return " ".join(rng.choice(_WORDS) for _ in range(count))
+
+
+def _usage(prompt: str, output: str) -> Dict[str, int]:
+    input_tokens = len(prompt) // 4 + 1
+    output_tokens = len(output) // 4 + 1
+    return {
+        "input_tokens": input_tokens,
+        "output_tokens": output_tokens,
+        "total_tokens": input_tokens + output_tokens,
+    }
+
+
+class _StubModels:
+    def __init__(self, settings: StubSettings, rng: _Randomness) -> None:
+        self._settings = settings
+        self._rng = rng
+
+    def _response(self, contents: str):
+        settings = self._settings
+        rng = self._rng
+        sentences = [
+            f"{_words(rng, rng.randint(8, 24)).capitalize()}."
+            for _ in range(settings.search_sentences)
+        ]
+        text = " ".join(sentences)
+        chunks = [
+            SimpleNamespace(
+                web=SimpleNamespace(
+                    uri=f"https://vertexaisearch.cloud.google.com/grounding-api-redirect/{rng.getrandbits(64):016x}",
+                    title=f"{rng.choice(_WORDS)}{index}.com",
+                )
+            )
+            for index in range(settings.grounding_chunks)
+        ]
+        supports = []
+        offset = 0
+        for sentence in sentences:
+            end = offset + len(sentence.encode("utf-8"))
+            supports.append(
+                SimpleNamespace(
+                    segment=SimpleNamespace(start_index=offset, end_index=end),
+                    grounding_chunk_indices=rng.sample(
+                        range(settings.grounding_chunks),
+                        min(2, settings.grounding_chunks),
+                    ),
+                )
+            )
+            offset = end + 1
+        usage = _usage(contents, text)
+        return SimpleNamespace(
+            text=text,
+            candidates=[
+                SimpleNamespace(
+                    grounding_metadata=SimpleNamespace(
+                        grounding_chunks=chunks, grounding_supports=supports
+                    )
+                )
+            ],
+            usage_metadata=SimpleNamespace(
+                prompt_token_count=usage["input_tokens"],
+                candidates_token_count=usage["output_tokens"],
+                total_token_count=usage["total_tokens"],
+            ),
+        )
+
+    def generate_content(self, model: str, contents: str, config=None):
+        time.sleep(self._settings.search_latency.sample(self._rng))
+        return self._response(contents)
+
+
+class _StubAsyncModels(_StubModels):
+    async def generate_content(self, model: str, contents: str, config=None):
+        await asyncio.sleep(self._settings.search_latency.sample(self._rng))
+        return self._response(contents)
+
+
+class StubGenaiClient:
+    """Stand-in for `google.genai.Client`, returning synthetic grounded search results."""
+
+    def __init__(self, settings: StubSettings, rng: _Randomness, **kwargs) -> None:
+        """Create a client drawing its latencies and results from `settings` and `rng`."""
+        self.models = _StubModels(settings, rng)
+        self.aio = SimpleNamespace(models=_StubAsyncModels(settings, rng))
+
+
+class StubChatModel:
+    """Stand-in for `ChatGoogleGenerativeAI`, answering with synthetic structured output and text."""
+
+    def __init__(
+        self, settings: StubSettings, rng: _Randomness, model: str = "", **kwargs
+    ) -> None:
+        """Create a chat model drawing its latencies and outputs from `settings` and `rng`."""
+        self.model = model
+        self._settings = settings
+        self._rng = rng
+
+    def _structured(self, schema, prompt: str):
+        rng = self._rng
+        rating = {}
+        if schema in (RatedSearchQueryList, RatedReflection):
+            rating["confidence"] = rng.uniform(*self._settings.confidence)
+        if schema in (SearchQueryList, RatedSearchQueryList):
+            match = re.search(r"more than (\d+) queries", prompt)
+            count = int(match.group(1)) if match else 1
+            return schema(
+                query=[
+                    f"{_words(rng, 4)} {rng.getrandbits(32):08x}" for _ in range(count)
+                ],
+                rationale=_words(rng, 12),
+                **rating,
+            )
+        if schema in (Reflection, RatedReflection):
+            return schema(
+                is_sufficient=False,
+                knowledge_gap=_words(rng, 10),
+                follow_up_queries=[
+                    f"{_words(rng, 5)} {rng.getrandbits(32):08x}"
+                    for _ in range(self._settings.follow_up_queries)
+                ],
+                **rating,
+            )
+        raise ValueError(f"The stub backend has no output for {schema}")
+
+    def _latency(self, schema) -> float:
+        if schema in (SearchQueryList, RatedSearchQueryList):
+            return self._settings.query_latency.sample(self._rng)
+        if schema in (Reflection, RatedReflection):
+            return self._settings.reflection_latency.sample(self._rng)
+        return self._settings.answer_latency.sample(self._rng)
+
+    def with_structured_output(self, schema, **kwargs):
+        """Return a runnable producing synthetic instances of `schema`."""
+
+        def invoke(prompt):
+            time.sleep(self._latency(schema))
+            return self._structured(schema, str(prompt))
+
+        async def ainvoke(prompt):
+            await asyncio.sleep(self._latency(schema))
+            return self._structured(schema, str(prompt))
+
+        return RunnableLambda(invoke, afunc=ainvoke, name="StubStructuredOutput")
+
+    def _answer(self, prompt) -> AIMessage:
+        prompt = str(prompt)
+        # Cite some of the short urls (or citation tokens) of the summaries, like the
+        # real answer model does
+        citations = re.findall(
+            r"\[[^\]]+\]\(https://vertexaisearch\.cloud\.google\.com/id/[0-9-]+\)|\[S[0-9]+\]",
+            prompt,
+        )
+        text = " ".join(
+            f"{_words(self._rng, 15).capitalize()}. {citation}"
+            for citation in citations[:10]
+        ) or _words(self._rng, 30)
+        return AIMessage(content=text, usage_metadata=_usage(prompt, text))
+
+    def invoke(self, prompt, *args, **kwargs) -> AIMessage:
+        """Answer the prompt after the configured latency."""
+        time.sleep(self._latency(None))
+        return self._answer(prompt)
+
+    async def ainvoke(self, prompt, *args, **kwargs) -> AIMessage:
+        """Answer the prompt after the configured latency."""
+        await asyncio.sleep(self._latency(None))
+        return self._answer(prompt)
+
+
+def install_stub_backend(settings: StubSettings) -> None:
+    """Make the graph nodes use the stub clients instead of Gemini."""
+    rng = _Randomness(settings.seed)
+    registry.configure(
+        chat_model_factory=lambda **kwargs: StubChatModel(settings, rng, **kwargs),
+        genai_client_factory=lambda **kwargs: StubGenaiClient(settings, rng, **kwargs),
+    )
+
+
+def uninstall_stub_backend() -> None:
+    """Restore the Gemini clients."""
+    registry.configure()
@@ -0,0 +1,178 @@
+"""Latency budgets of research runs.
+
+With a `deadline_ms`, a run sizes itself to its deadline instead of to the fixed
+`number_of_initial_queries` and `max_research_loops`: the number of initial queries
+fanned out, whether another research loop fits and which model tier writes the
+answer are picked from the latencies recently observed for each node (and model) in
+this process, see `agent.telemetry.LatencyStats`. Until enough executions have been
+observed, conservative default latencies are assumed. Every choice is returned in
+the `budget_decisions` state key, with the estimates it was based on, to tune the
+deadlines against.
+"""
+
+import math
+import time
+from typing import Dict, Optional, Tuple
+
+from agent.configuration import Configuration
+from agent.telemetry import metrics
+
+# Planning quantile of the node latencies
+LATENCY_QUANTILE = 0.9
+
+# Executions of a node (and model) needed before its observed latencies are trusted
+MIN_SAMPLES = 5
+
+# Assumed latencies of the nodes before enough executions were observed, in seconds
+DEFAULT_LATENCY_S = {
+    "generate_query": 3.0,
+    "web_research": 10.0,
+    "reflection": 8.0,
+    "finalize_answer": 20.0,
+}
+
+
+def estimate_latency(
+    node: str, model: Optional[str] = None, q: float = LATENCY_QUANTILE
+) -> Tuple[float, str]:
+    """Estimate the `q` quantile of the latency of a node running `model`, in seconds.
+
+    Returns:
+        The estimate and where it comes from: "observed" or "default".
+    """
+    for key in (model, None) if model else (None,):
+        value, count = metrics.latencies.quantile(node, key, q)
+        if count >= MIN_SAMPLES:
+            return value, "observed"
+    return DEFAULT_LATENCY_S[node], "default"
+
+
+def wave_latency(size: int, configurable: Configuration) -> Tuple[float, str]:
+    """Estimate the latency of a wave of `size` parallel web research branches.
+
+    A wave lasts as long as its slowest branch: for n independent branches, the q
+    quantile of their maximum is the q ** (1/n) quantile of a single branch. Branches
+    beyond the concurrency limit of the run wait for a second round.
+    """
+    size = max(1, size)
+    limit = configurable.max_concurrent_requests
+    parallel = min(size, limit) if limit >= 1 else size
+    rounds = math.ceil(size / parallel)
+    latency, source = estimate_latency(
+        "web_research", q=LATENCY_QUANTILE ** (1 / parallel)
+    )
+    return rounds * latency, source
+
+
+def deadline_at(configurable: Configuration, now: Optional[float] = None) -> float:
+    """Get the wall clock time a run starting now has to answer by."""
+    return (now or time.time()) + configurable.deadline_ms / 1000
+
+
+def _answer_estimate(
+    model: str, available_s: float, configurable: Configuration
+) -> Tuple[float, str]:
+    """Estimate the answer latency, with the fast tier if the model doesn't fit the time left."""
+    latency, source = estimate_latency("finalize_answer", model)
+    if latency <= available_s or not configurable.fast_answer_model:
+        return latency, source
+    fast_latency, fast_source = estimate_latency(
+        "finalize_answer", configurable.fast_answer_model
+    )
+    return min(latency, fast_latency), fast_source
+
+
+def _milliseconds(estimates: Dict[str, float]) -> Dict[str, float]:
+    return {name: round(1000 * seconds) for name, seconds in estimates.items()}
+
+
+def plan_initial_queries(
+    requested: int, answer_model: str, deadline: float, configurable: Configuration
+) -> dict:
+    """Pick the largest number of initial queries, up to `requested`, whose research fits the deadline.
+
+    The time for generating the queries, one reflection and the answer is reserved
+    first; at least one query is always researched.
+    """
+    remaining = deadline - time.time()
+    generate, source = estimate_latency(
+        "generate_query", configurable.query_generator_model
+    )
+    reflect, _ = estimate_latency("reflection", configurable.reflection_model)
+    answer, _ = _answer_estimate(
+        answer_model,
+        remaining - generate - reflect - wave_latency(1, configurable)[0],
+        configurable,
+    )
+    available = remaining - generate - reflect - answer
+    count = 1
+    for size in range(max(1, requested), 0, -1):
+        if wave_latency(size, configurable)[0] <= available:
+            count = size
+            break
+    return {
+        "node": "generate_query",
+        "initial_queries": count,
+        "requested": requested,
+        "remaining_ms": round(1000 * remaining),
+        "estimated_ms": _milliseconds(
+            {
+                "generate_query": generate,
+                "web_research": wave_latency(count, configurable)[0],
+                "reflection": reflect,
+                "finalize_answer": answer,
+            }
+        ),
+        "source": source,
+    }
+
+
+def plan_next_loop(
+    follow_up_count: int,
+    answer_model: str,
+    deadline: float,
+    configurable: Configuration,
+) -> dict:
+    """Decide whether another research loop, and the answer after it, fit the deadline."""
+    remaining = deadline - time.time()
+    research, source = wave_latency(follow_up_count, configurable)
+    reflect, _ = estimate_latency("reflection", configurable.reflection_model)
+    answer, _ = _answer_estimate(
+        answer_model, remaining - research - reflect, configurable
+    )
+    return {
+        "node": "reflection",
+        "another_loop": research + reflect + answer <= remaining,
+        "remaining_ms": round(1000 * remaining),
+        "estimated_ms": _milliseconds(
+            {"web_research": research, "reflection": reflect, "finalize_answer": answer}
+        ),
+        "source": source,
+    }
+
+
+def choose_answer_model(
+    answer_model: str, deadline: float, configurable: Configuration
+) -> dict:
+    """Pick the answer model tier: `answer_model` if it fits the time left, else the fast tier."""
+    remaining = deadline - time.time()
+    latency, source = estimate_latency("finalize_answer", answer_model)
+    chosen = answer_model
+    if latency > remaining and configurable.fast_answer_model:
+        fast_latency, fast_source = estimate_latency(
+            "finalize_answer", configurable.fast_answer_model
+        )
+        if fast_latency <= latency:
+            chosen, latency, source = (
+                configurable.fast_answer_model,
+                fast_latency,
+                fast_source,
+            )
+    return {
+        "node": "finalize_answer",
+        "answer_model": chosen,
+        "requested": answer_model,
+        "remaining_ms": round(1000 * remaining),
+        "estimated_ms": _milliseconds({"finalize_answer": latency}),
+        "source": source,
+    }
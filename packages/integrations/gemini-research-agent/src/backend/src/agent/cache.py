@@ -0,0 +1,142 @@
+"""Persistent caches of web research results and answers."""
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+
+def normalize_text(text: str) -> str:
+    """Normalize free text for use in cache keys.
+
+    Lowercases the text and keeps only its word tokens, so that case, punctuation
+    and whitespace differences map to the same key.
+    """
+    return " ".join(re.findall(r"\w+", text.lower()))
+
+
+def make_cache_key(*parts: Any) -> str:
+    """Hash the JSON encoding of the given parts into a fixed-size cache key."""
+    encoded = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+class SqliteCache:
+    """Disk-backed key/value cache with TTL expiry and LRU eviction.
+
+    Values are stored as JSON. The database can be shared by several worker
+    processes; each thread uses its own connection.
+    """
+
+    def __init__(self, path: str) -> None:
+        """Open (and create, if needed) the cache database at `path`."""
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connection() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS cache (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+                """
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS cache_accessed_at ON cache (accessed_at)"
+            )
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def _record(self, hit: bool) -> None:
+        with self._stats_lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def get(self, key: str, ttl_seconds: float) -> Optional[Any]:
+        """Get a cached value if it is younger than `ttl_seconds`.
+
+        Returns:
+            The cached value, or None on a miss or an expired entry.
+        """
+        now = time.time()
+        with self._connection() as conn:
+            row = conn.execute(
+                "SELECT value, created_at FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or now - row[1] > ttl_seconds:
+                self._record(hit=False)
+                return None
+            conn.execute("UPDATE cache SET accessed_at = ? WHERE key = ?", (now, key))
+        self._record(hit=True)
+        return json.loads(row[0])
+
+    def set(self, key: str, value: Any, ttl_seconds: float, max_entries: int) -> None:
+        """Store a value, then drop expired entries and evict the least recently used ones.
+
+        Args:
+            key: The cache key.
+            value: A JSON serializable value.
+            ttl_seconds: Entries older than this are removed.
+            max_entries: Maximum number of entries kept in the cache.
+        """
+        now = time.time()
+        with self._connection() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), now, now),
+            )
+            conn.execute("DELETE FROM cache WHERE created_at < ?", (now - ttl_seconds,))
+            conn.execute(
+                """
+                DELETE FROM cache WHERE key IN (
+                    SELECT key FROM cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?
+                )
+                """,
+                (max(max_entries, 0),),
+            )
+
+    def stats(self) -> Dict[str, Any]:
+        """Report the hit rate of this process and the number of stored entries."""
+        with self._connection() as conn:
+            (entries,) = conn.execute("SELECT COUNT(*) FROM cache").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "path": self.path,
+            "entries": entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+_caches: Dict[str, SqliteCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_cache(path: str) -> SqliteCache:
+    """Get the process-wide cache instance stored at `path`."""
+    with _caches_lock:
+        cache = _caches.get(path)
+        if cache is None:
+            cache = _caches[path] = SqliteCache(path)
+        return cache
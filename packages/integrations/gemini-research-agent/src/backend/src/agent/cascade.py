@@ -0,0 +1,93 @@
+"""Cheap-first model cascade of the query generation, reflection and answer.
+
+With a `cascade_model`, `generate_query` and `reflection` first ask that faster,
+cheaper model, with a structured output that also rates its confidence. The result
+is only escalated to the configured model when it fails validation, its confidence
+is below `cascade_min_confidence` or, for the reflection, it finds a knowledge gap
+(the follow-up queries are then written by the stronger model). Runs whose last
+reflection was settled by the cheap model are answered by it as well.
+
+Each attempt is counted in the `cascade_stats` state key, together with the latency
+it saved: the observed median latency of the calls of the node to the escalation model
+minus the latency of the cheap call, or the wasted latency of the cheap call if it
+escalated. Accepted attempts are counted as unmeasured until enough calls to the
+escalation model were observed in this process.
+"""
+
+from typing import Any, Dict, Optional
+
+from langchain_core.exceptions import OutputParserException
+from pydantic import ValidationError
+
+from agent.budget import MIN_SAMPLES
+from agent.telemetry import metrics
+
+# Errors of a structured output call whose response didn't match the schema
+VALIDATION_ERRORS = (OutputParserException, ValidationError)
+
+STAGES = ("generate_query", "reflection", "finalize_answer")
+
+
+def escalation_reason(result: Any, min_confidence: float) -> Optional[str]:
+    """Check whether a structured output of the cheap model has to be escalated.
+
+    Returns:
+        Why it is escalated ("invalid", "low_confidence" or "knowledge_gap"), or None
+        if it is accepted.
+    """
+    if result is None or getattr(result, "query", True) == []:
+        return "invalid"
+    if getattr(result, "confidence", 1.0) < min_confidence:
+        return "low_confidence"
+    if getattr(result, "is_sufficient", True) is False:
+        return "knowledge_gap"
+    return None
+
+
+def cascade_stats(
+    stage: str, model: str, elapsed_s: float, reason: Optional[str]
+) -> Dict[str, float]:
+    """Count a cheap attempt of a stage, escalated for `reason` if given, and its saved latency.
+
+    Args:
+        stage: The node the attempt was made for.
+        model: The model the stage escalates to.
+        elapsed_s: The latency of the cheap call, in seconds.
+        reason: Why the attempt was escalated, None if it was accepted.
+    """
+    stats = {f"{stage}.attempts": 1}
+    if reason is None:
+        expected_s, count = metrics.call_latencies.quantile(stage, model, 0.5)
+        if count >= MIN_SAMPLES:
+            stats[f"{stage}.saved_ms"] = round(1000 * (expected_s - elapsed_s))
+        else:
+            stats[f"{stage}.unmeasured"] = 1
+    else:
+        stats[f"{stage}.escalations"] = 1
+        stats[f"{stage}.escalations.{reason}"] = 1
+        stats[f"{stage}.saved_ms"] = -round(1000 * elapsed_s)
+    return stats
+
+
+def summarize_cascade(stats: Dict[str, float]) -> Dict[str, Dict[str, Any]]:
+    """Get the attempts, escalation rate and saved latency of the cascade per stage."""
+    summary = {}
+    for stage in STAGES:
+        attempts = stats.get(f"{stage}.attempts", 0)
+        if not attempts:
+            continue
+        escalations = stats.get(f"{stage}.escalations", 0)
+        reasons = {
+            key.rsplit(".", 1)[1]: count
+            for key, count in stats.items()
+            if key.startswith(f"{stage}.escalations.")
+        }
+        summary[stage] = {
+            "attempts": attempts,
+            "escalations": escalations,
+            "escalation_rate": escalations / attempts,
+            "escalation_reasons": reasons,
+            "saved_ms": stats.get(f"{stage}.saved_ms", 0),
+            "unmeasured": stats.get(f"{stage}.unmeasured", 0),
+        }
+    return summary
@@ -0,0 +1,339 @@
+"""Record/replay of Gemini calls for deterministic offline runs of the research graph.
+
+A cassette is a directory of gzipped JSON interactions, each stored under the hash
+of its request (call kind, model, temperature, output schema and prompt). Recording
+wraps the real clients of the client registry; replay serves the recorded responses,
+either with their recorded latencies or as fast as possible.
+
+Set `GEMINI_CASSETTE` to a cassette directory (and `GEMINI_CASSETTE_MODE` to `record`,
+`replay` or `auto`) to enable it for the server or the CLI.
+"""
+
+import asyncio
+import gzip
+import json
+import os
+import tempfile
+import threading
+import time
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, Optional
+
+from google.genai import types
+from langchain_core.messages import AIMessage
+from langchain_core.runnables import RunnableLambda
+
+from agent.cache import make_cache_key
+from agent.clients import registry
+from agent.prompts import get_current_date
+
+MODES = ("record", "replay", "auto")
+LATENCIES = ("recorded", "none")
+
+
+class CassetteMiss(KeyError):
+    """Raised when replaying a request that isn't in the cassette."""
+
+
+class Cassette:
+    """A content-addressed store of recorded Gemini interactions."""
+
+    def __init__(
+        self, directory: str, mode: str = "replay", latency: str = "recorded"
+    ) -> None:
+        """Open the cassette stored in `directory`.
+
+        Args:
+            directory: The cassette directory, created when recording.
+            mode: `record` always calls Gemini and stores the response, `replay` only
+                  serves recorded responses, `auto` replays when possible and records otherwise.
+            latency: `recorded` replays with the recorded latencies, `none` as fast as possible.
+        """
+        if mode not in MODES:
+            raise ValueError(f"Unknown cassette mode {mode!r}, expected one of {MODES}")
+        if latency not in LATENCIES:
+            raise ValueError(
+                f"Unknown cassette latency {latency!r}, expected one of {LATENCIES}"
+            )
+        self.directory = directory
+        self.mode = mode
+        self.latency = latency
+        self.recorded = 0
+        self.replayed = 0
+        self._lock = threading.Lock()
+
+    def request_key(self, *parts: Any) -> str:
+        """Hash a request, ignoring the current date embedded in the prompts."""
+        return make_cache_key(
+            *(
+                part.replace(get_current_date(), "{current_date}")
+                if isinstance(part, str)
+                else part
+                for part in parts
+            )
+        )
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.json.gz")
+
+    def load(self, key: str) -> Optional[Dict[str, Any]]:
+        """Load a recorded interaction, or None if the cassette doesn't have it."""
+        try:
+            with gzip.open(self._path(key), "rt", encoding="utf-8") as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return None
+
+    def save(self, key: str, interaction: Dict[str, Any]) -> None:
+        """Store an interaction atomically, so concurrent writers never leave partial files."""
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        descriptor, temporary_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        with (
+            os.fdopen(descriptor, "wb") as raw,
+            gzip.open(raw, "wt", encoding="utf-8") as file,
+        ):
+            json.dump(interaction, file, ensure_ascii=False, separators=(",", ":"))
+        os.replace(temporary_path, path)
+        with self._lock:
+            self.recorded += 1
+
+    def _replayable(self, key: str) -> Optional[Dict[str, Any]]:
+        if self.mode == "record":
+            return None
+        interaction = self.load(key)
+        if interaction is None and self.mode == "replay":
+            raise CassetteMiss(f"No recorded interaction {key} in {self.directory}")
+        if interaction is not None:
+            with self._lock:
+                self.replayed += 1
+        return interaction
+
+    def _delay(self, interaction: Dict[str, Any]) -> float:
+        return interaction["latency_s"] if self.latency == "recorded" else 0.0
+
+    def call(
+        self,
+        key: str,
+        perform: Callable[[], Any],
+        encode: Callable[[Any], Any],
+        decode: Callable[[Any], Any],
+    ) -> Any:
+        """Replay the interaction `key`, or perform and record it."""
+        interaction = self._replayable(key)
+        if interaction is not None:
+            time.sleep(self._delay(interaction))
+            return decode(interaction["response"])
+        start = time.perf_counter()
+        response = perform()
+        self.save(
+            key,
+            {"latency_s": time.perf_counter() - start, "response": encode(response)},
+        )
+        return response
+
+    async def acall(
+        self,
+        key: str,
+        perform: Callable[[], Any],
+        encode: Callable[[Any], Any],
+        decode: Callable[[Any], Any],
+    ) -> Any:
+        """Async version of `call`, `perform` returns an awaitable."""
+        interaction = await asyncio.to_thread(self._replayable, key)
+        if interaction is not None:
+            await asyncio.sleep(self._delay(interaction))
+            return decode(interaction["response"])
+        start = time.perf_counter()
+        response = await perform()
+        await asyncio.to_thread(
+            self.save,
+            key,
+            {"latency_s": time.perf_counter() - start, "response": encode(response)},
+        )
+        return response
+
+
+def _encode_message(message: AIMessage) -> Dict[str, Any]:
+    return {"content": message.content, "usage_metadata": message.usage_metadata}
+
+
+def _decode_message(data: Dict[str, Any]) -> AIMessage:
+    return AIMessage(content=data["content"], usage_metadata=data["usage_metadata"])
+
+
+def _encode_generate_content(response: types.GenerateContentResponse) -> Any:
+    return response.model_dump(mode="json", exclude_none=True)
+
+
+def _decode_generate_content(data: Any) -> types.GenerateContentResponse:
+    return types.GenerateContentResponse.model_validate(data)
+
+
+class CassetteChatModel:
+    """Records or replays the calls the graph makes to a LangChain chat model."""
+
+    def __init__(
+        self,
+        cassette: Cassette,
+        factory: Callable[..., Any],
+        model: str,
+        temperature: float,
+        **kwargs: Any,
+    ) -> None:
+        """Wrap the chat model `factory` builds for `model` and `temperature`."""
+        self._cassette = cassette
+        self._model = model
+        self._temperature = temperature
+        # The real model is only built when a call has to be recorded
+        self._factory = lambda: factory(model=model, temperature=temperature, **kwargs)
+        self._inner = None
+
+    @property
+    def inner(self):
+        """The wrapped chat model."""
+        if self._inner is None:
+            self._inner = self._factory()
+        return self._inner
+
+    def with_structured_output(self, schema, **kwargs):
+        """Return a runnable recording or replaying structured output of `schema`."""
+
+        def key(prompt):
+            return self._cassette.request_key(
+                "structured",
+                self._model,
+                self._temperature,
+                schema.__name__,
+                str(prompt),
+            )
+
+        def invoke(prompt):
+            return self._cassette.call(
+                key(prompt),
+                lambda: self.inner.with_structured_output(schema, **kwargs).invoke(
+                    prompt
+                ),
+                lambda result: result.model_dump(mode="json"),
+                schema.model_validate,
+            )
+
+        async def ainvoke(prompt):
+            return await self._cassette.acall(
+                key(prompt),
+                lambda: self.inner.with_structured_output(schema, **kwargs).ainvoke(
+                    prompt
+                ),
+                lambda result: result.model_dump(mode="json"),
+                schema.model_validate,
+            )
+
+        return RunnableLambda(invoke, afunc=ainvoke, name="CassetteStructuredOutput")
+
+    def _key(self, prompt) -> str:
+        return self._cassette.request_key(
+            "chat", self._model, self._temperature, str(prompt)
+        )
+
+    def invoke(self, prompt, *args, **kwargs) -> AIMessage:
+        """Record or replay a plain chat completion."""
+        return self._cassette.call(
+            self._key(prompt),
+            lambda: self.inner.invoke(prompt, *args, **kwargs),
+            _encode_message,
+            _decode_message,
+        )
+
+    async def ainvoke(self, prompt, *args, **kwargs) -> AIMessage:
+        """Async version of `invoke`."""
+        return await self._cassette.acall(
+            self._key(prompt),
+            lambda: self.inner.ainvoke(prompt, *args, **kwargs),
+            _encode_message,
+            _decode_message,
+        )
+
+
+class _CassetteModels:
+    def __init__(self, cassette: Cassette, client: "CassetteGenaiClient") -> None:
+        self._cassette = cassette
+        self._client = client
+
+    def _key(self, model: str, contents: Any, config: Any) -> str:
+        return self._cassette.request_key("generate_content", model, config, contents)
+
+    def generate_content(self, model: str, contents: Any, config: Any = None):
+        return self._cassette.call(
+            self._key(model, contents, config),
+            lambda: self._client.inner.models.generate_content(
+                model=model, contents=contents, config=config
+            ),
+            _encode_generate_content,
+            _decode_generate_content,
+        )
+
+
+class _CassetteAsyncModels(_CassetteModels):
+    async def generate_content(self, model: str, contents: Any, config: Any = None):
+        return await self._cassette.acall(
+            self._key(model, contents, config),
+            lambda: self._client.inner.aio.models.generate_content(
+                model=model, contents=contents, config=config
+            ),
+            _encode_generate_content,
+            _decode_generate_content,
+        )
+
+
+class CassetteGenaiClient:
+    """Records or replays the grounded search calls made through a google genai client."""
+
+    def __init__(
+        self, cassette: Cassette, factory: Callable[..., Any], **kwargs: Any
+    ) -> None:
+        """Wrap the genai client `factory` builds from `kwargs`."""
+        self._factory = lambda: factory(**kwargs)
+        self._inner = None
+        self.models = _CassetteModels(cassette, self)
+        self.aio = SimpleNamespace(models=_CassetteAsyncModels(cassette, self))
+
+    @property
+    def inner(self):
+        """The wrapped genai client."""
+        if self._inner is None:
+            self._inner = self._factory()
+        return self._inner
+
+
+def install_cassette(
+    directory: str, mode: str = "replay", latency: str = "recorded"
+) -> Cassette:
+    """Route all Gemini calls of the graph through a cassette.
+
+    Returns:
+        The installed cassette, exposing the number of recorded and replayed interactions.
+    """
+    cassette = Cassette(directory, mode=mode, latency=latency)
+    chat_model_factory = registry.chat_model_factory
+    genai_client_factory = registry.genai_client_factory
+    registry.configure(
+        chat_model_factory=lambda **kwargs: CassetteChatModel(
+            cassette, chat_model_factory, **kwargs
+        ),
+        genai_client_factory=lambda **kwargs: CassetteGenaiClient(
+            cassette, genai_client_factory, **kwargs
+        ),
+    )
+    return cassette
+
+
+def install_cassette_from_env() -> Optional[Cassette]:
+    """Install the cassette configured by `GEMINI_CASSETTE`, if any."""
+    directory = os.getenv("GEMINI_CASSETTE")
+    if not directory:
+        return None
+    return install_cassette(
+        directory,
+        mode=os.getenv("GEMINI_CASSETTE_MODE", "replay"),
+        latency=os.getenv("GEMINI_CASSETTE_LATENCY", "recorded"),
+    )
@@ -0,0 +1,145 @@
+"""Persistent SQLite checkpoints of research runs.
+
+With a checkpointer, LangGraph saves the state after every step, including the
+writes of the `web_research` branches that already finished when a sibling branch
+failed. Invoking the graph again with the same thread id and question (or no new
+input) then resumes the run from there instead of repeating the finished searches and
+reflections, and a finished run can be served again straight from its last checkpoint.
+A different question starts a new turn of the thread.
+
+The LangGraph server picks up `create_checkpointer` through `langgraph.json`; the
+CLI (with `--checkpoint`) and the streaming endpoint (with `CHECKPOINT_PATH`) use
+`checkpointed_graph`/`acheckpointed_graph`.
+Checkpoints are stored as LangGraph's msgpack, compressed with zstd when
+`CHECKPOINT_CODEC` is `msgpack+zstd` (see `agent.codec`).
+"""
+
+import os
+import sqlite3
+from contextlib import asynccontextmanager, closing, contextmanager
+from typing import Any, AsyncIterator, Iterator, Optional
+
+from langchain_core.messages import convert_to_messages
+from langchain_core.runnables import RunnableConfig
+
+DEFAULT_CHECKPOINT_PATH = ".cache/checkpoints.sqlite3"
+
+CHECKPOINT_CODECS = ("msgpack", "msgpack+zstd")
+
+
+def checkpoint_path(path: Optional[str] = None) -> str:
+    """Get the checkpoint database path, `CHECKPOINT_PATH` by default."""
+    path = path or os.getenv("CHECKPOINT_PATH", DEFAULT_CHECKPOINT_PATH)
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    return path
+
+
+def checkpoints_enabled() -> bool:
+    """Check whether the streaming endpoint checkpoints its runs, i.e. `CHECKPOINT_PATH` is set."""
+    return bool(os.getenv("CHECKPOINT_PATH"))
+
+
+def checkpoint_serde(codec: Optional[str] = None):
+    """Get the checkpoint serializer of a codec, `CHECKPOINT_CODEC` by default.
+
+    Returns:
+        The serializer, or None for LangGraph's default (uncompressed msgpack).
+    """
+    codec = codec or os.getenv("CHECKPOINT_CODEC") or "msgpack"
+    if codec not in CHECKPOINT_CODECS:
+        raise ValueError(
+            f"Unknown checkpoint codec {codec!r}, expected one of {CHECKPOINT_CODECS}"
+        )
+    if codec == "msgpack":
+        return None
+    from agent.codec import ZstdSerializer
+
+    return ZstdSerializer()
+
+
+@asynccontextmanager
+async def create_checkpointer(path: Optional[str] = None) -> AsyncIterator[Any]:
+    """Open an async SQLite checkpointer, as referenced by `langgraph.json`."""
+    import aiosqlite
+    from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+
+    async with aiosqlite.connect(checkpoint_path(path)) as conn:
+        yield AsyncSqliteSaver(conn, serde=checkpoint_serde())
+
+
+@contextmanager
+def checkpointed_graph(path: Optional[str] = None) -> Iterator[Any]:
+    """Compile the research graph with a sync SQLite checkpointer, for `graph.invoke`."""
+    from langgraph.checkpoint.sqlite import SqliteSaver
+
+    from agent.graph import compile_graph
+
+    # Connections are shared by the threads of the graph, as in `SqliteSaver.from_conn_string`
+    with closing(
+        sqlite3.connect(checkpoint_path(path), check_same_thread=False)
+    ) as conn:
+        yield compile_graph(checkpointer=SqliteSaver(conn, serde=checkpoint_serde()))
+
+
+@asynccontextmanager
+async def acheckpointed_graph(path: Optional[str] = None) -> AsyncIterator[Any]:
+    """Compile the research graph with an async SQLite checkpointer, for `graph.ainvoke`."""
+    from agent.graph import compile_graph
+
+    async with create_checkpointer(path) as saver:
+        yield compile_graph(checkpointer=saver)
+
+
+def is_finished(snapshot) -> bool:
+    """Check whether a checkpointed run produced its answer."""
+    return bool(snapshot.values) and not snapshot.next
+
+
+def _question(messages: list) -> Optional[str]:
+    for message in reversed(convert_to_messages(messages)):
+        if message.type == "human":
+            return message.content
+    return None
+
+
+def continues_run(snapshot, state: Optional[dict]) -> bool:
+    """Check whether `state` continues the checkpointed run rather than starting a new turn.
+
+    That is the case without new input (`state` is None) or when it asks the question
+    the checkpointed run was started with.
+    """
+    if not snapshot.values:
+        return False
+    if state is None:
+        return True
+    return _question(state.get("messages", [])) == _question(
+        snapshot.values.get("messages", [])
+    )
+
+
+def run_or_resume(graph, state: Optional[dict], config: RunnableConfig) -> dict:
+    """Run the research for the thread of `config`, resuming or replaying a previous run.
+
+    Returns:
+        dict: The final state. A finished run of the same question (or of the last one,
+              if `state` is None) is returned as checkpointed and an interrupted one
+              resumes from its last checkpoint; any other question starts from `state`.
+    """
+    snapshot = graph.get_state(config)
+    if not continues_run(snapshot, state):
+        return graph.invoke(state, config)
+    if is_finished(snapshot):
+        return snapshot.values
+    return graph.invoke(None, config)
+
+
+async def arun_or_resume(graph, state: Optional[dict], config: RunnableConfig) -> dict:
+    """Async version of `run_or_resume`."""
+    snapshot = await graph.aget_state(config)
+    if not continues_run(snapshot, state):
+        return await graph.ainvoke(state, config)
+    if is_finished(snapshot):
+        return snapshot.values
+    return await graph.ainvoke(None, config)
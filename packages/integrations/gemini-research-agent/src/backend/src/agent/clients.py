@@ -0,0 +1,217 @@
+"""Pooled Gemini clients shared by the nodes of the research graph."""
+
+import asyncio
+import os
+import threading
+import weakref
+from typing import TYPE_CHECKING, Any, Callable, Dict, Hashable, List, Optional
+
+from dotenv import load_dotenv
+
+if TYPE_CHECKING:
+    from google.genai import Client
+    from langchain_google_genai import ChatGoogleGenerativeAI
+
+
+def _require_api_key(kwargs: Dict[str, Any]) -> None:
+    if kwargs.get("api_key") is None:
+        raise ValueError("GEMINI_API_KEY is not set")
+
+
+def create_chat_model(**kwargs: Any) -> "ChatGoogleGenerativeAI":
+    """Build a Gemini chat model, importing langchain_google_genai on first use."""
+    _require_api_key(kwargs)
+    from langchain_google_genai import ChatGoogleGenerativeAI
+
+    return ChatGoogleGenerativeAI(**kwargs)
+
+
+def create_genai_client(**kwargs: Any) -> "Client":
+    """Build a google genai client, importing google.genai on first use."""
+    _require_api_key(kwargs)
+    from google.genai import Client
+
+    return Client(**kwargs)
+
+
+def _count_pool_connections(transport: Any) -> Optional[int]:
+    """Count the open connections of an httpx transport, if it exposes its pool."""
+    pool = getattr(transport, "_pool", None)
+    connections = getattr(pool, "connections", None)
+    return len(connections) if connections is not None else None
+
+
+class ClientRegistry:
+    """Process-wide registry of warmed Gemini clients.
+
+    Clients are keyed by (model, temperature, max_retries) and reused across node
+    executions, so their HTTP connection pools and TLS sessions survive between calls.
+    Sync callers share one client per key across threads. Async callers get one client
+    per key and event loop, because async connection pools can't be shared between
+    loops; the clients of a loop are dropped together with the loop.
+
+    Nothing is set up at import time: the `.env` file and a cassette configured by
+    `GEMINI_CASSETTE` are loaded when the first client is requested, and the Gemini
+    SDKs are only imported (and the API key required) when a real client is built.
+    """
+
+    def __init__(self) -> None:
+        """Create an empty registry using the default Gemini client factories."""
+        self.chat_model_factory: Callable[..., Any] = create_chat_model
+        self.genai_client_factory: Callable[..., Any] = create_genai_client
+        self.cassette = None
+        self._environment_loaded = False
+        self._configured = False
+        self._environment_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._shared: Dict[Hashable, Any] = {}
+        # Event loop -> clients of that loop
+        self._per_loop: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+        self._created: Dict[Hashable, int] = {}
+        self._reused: Dict[Hashable, int] = {}
+
+    def configure(
+        self,
+        chat_model_factory: Optional[Callable[..., Any]] = None,
+        genai_client_factory: Optional[Callable[..., Any]] = None,
+    ) -> None:
+        """Replace the factories used to build clients and drop all cached clients.
+
+        Used to inject stub or recording clients, e.g. by the offline benchmarks.
+        Passing None restores the default Gemini client. Explicitly configured
+        factories take precedence over the cassette configured by the environment.
+        """
+        with self._lock:
+            self._configured = True
+            self.chat_model_factory = chat_model_factory or create_chat_model
+            self.genai_client_factory = genai_client_factory or create_genai_client
+            self._shared.clear()
+            self._per_loop.clear()
+            self._created.clear()
+            self._reused.clear()
+
+    def _load_environment(self) -> None:
+        """Load `.env` and install the cassette of the environment, once per process."""
+        if self._environment_loaded:
+            return
+        with self._environment_lock:
+            if self._environment_loaded:
+                return
+            load_dotenv()
+            if not self._configured:
+                from agent.cassette import install_cassette_from_env
+
+                self.cassette = install_cassette_from_env()
+            self._environment_loaded = True
+
+    def _clients_for_current_loop(self) -> Dict[Hashable, Any]:
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return self._shared
+        return self._per_loop.setdefault(loop, {})
+
+    def _get_or_create(self, key: Hashable, factory) -> Any:
+        self._load_environment()
+        with self._lock:
+            clients = self._clients_for_current_loop()
+            client = clients.get(key)
+            if client is not None:
+                self._reused[key] = self._reused.get(key, 0) + 1
+                return client
+            client = factory()
+            clients[key] = client
+            self._created[key] = self._created.get(key, 0) + 1
+            self._reused.setdefault(key, 0)
+            return client
+
+    def get_chat_model(
+        self, model: str, temperature: float, max_retries: int = 2
+    ) -> "ChatGoogleGenerativeAI":
+        """Get a shared LangChain chat model for the given settings."""
+        return self._get_or_create(
+            ("chat", model, temperature, max_retries),
+            lambda: self.chat_model_factory(
+                model=model,
+                temperature=temperature,
+                max_retries=max_retries,
+                api_key=os.getenv("GEMINI_API_KEY"),
+            ),
+        )
+
+    def get_genai_client(self) -> "Client":
+        """Get a shared google genai client, used for the Google Search tool."""
+        return self._get_or_create(
+            ("genai",),
+            lambda: self.genai_client_factory(api_key=os.getenv("GEMINI_API_KEY")),
+        )
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """Report reuse counts and connection pool sizes per client key.
+
+        Returns:
+            list: One dictionary per key with the number of created and reused
+                  clients and the connections currently held by their sync and async pools.
+        """
+        with self._lock:
+            client_sets = [self._shared, *self._per_loop.values()]
+            report = []
+            for key, created in self._created.items():
+                sync_connections = 0
+                async_connections = 0
+                for clients in client_sets:
+                    client = clients.get(key)
+                    if client is None:
+                        continue
+                    genai_client = getattr(client, "client", client)
+                    api_client = getattr(genai_client, "_api_client", None)
+                    sync_connections += (
+                        _count_pool_connections(
+                            getattr(
+                                getattr(api_client, "_httpx_client", None),
+                                "_transport",
+                                None,
+                            )
+                        )
+                        or 0
+                    )
+                    async_connections += (
+                        _count_pool_connections(
+                            getattr(
+                                getattr(api_client, "_async_httpx_client", None),
+                                "_transport",
+                                None,
+                            )
+                        )
+                        or 0
+                    )
+                report.append(
+                    {
+                        "key": list(key),
+                        "created": created,
+                        "reused": self._reused.get(key, 0),
+                        "sync_connections": sync_connections,
+                        "async_connections": async_connections,
+                    }
+                )
+            return report
+
+
+registry = ClientRegistry()
+
+
+def get_chat_model(
+    model: str, temperature: float, max_retries: int = 2
+) -> "ChatGoogleGenerativeAI":
+    """Get a shared LangChain chat model from the process-wide registry."""
+    return registry.get_chat_model(model, temperature, max_retries)
+
+
+def get_genai_client() -> "Client":
+    """Get the shared google genai client from the process-wide registry."""
+    return registry.get_genai_client()
+
+
+def client_stats() -> List[Dict[str, Any]]:
+    """Report client reuse and connection pool sizes of the process-wide registry."""
+    return registry.stats()
@@ -0,0 +1,156 @@
+"""Compact binary codec of research state snapshots and stream events.
+
+Research state holds long text lists (`web_research_result`) and nested source
+registries that are serialized on every checkpoint and streamed update. This module
+compresses them with zstd on top of msgpack:
+
+- `ZstdSerializer` wraps the checkpoint serializer of LangGraph (msgpack with
+  extension types for messages and pydantic models) and compresses its output, for
+  `CHECKPOINT_CODEC=msgpack+zstd` (see `agent.checkpoint`) and `encode_state`.
+- `EventStreamEncoder` encodes the events of `agent.app.stream_research` as
+  length-prefixed msgpack frames in a single zstd stream, flushed after every event,
+  for `/research/stream?codec=msgpack+zstd`. Compressing the whole stream lets every
+  event reuse the vocabulary of the previous ones. `decode_event_stream` reads it back.
+
+zstd comes from the optional `zstandard` package (`pip install ".[codec]"`), msgpack
+from `ormsgpack`, which LangGraph already depends on.
+"""
+
+import struct
+import threading
+from typing import Any, Iterable, Iterator, Optional, Tuple
+
+import ormsgpack
+from langgraph.checkpoint.serde.base import SerializerProtocol
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+CODECS = ("json", "msgpack+zstd")
+
+# Media type of the msgpack+zstd event stream
+EVENT_STREAM_MEDIA_TYPE = "application/x-msgpack+zstd"
+
+# zstd compression level, 3 is the zstd default
+DEFAULT_LEVEL = 3
+
+# Checkpoint blobs smaller than this are stored uncompressed
+MIN_COMPRESSED_SIZE = 256
+
+_SUFFIX = "+zstd"
+_FRAME_HEADER = struct.Struct(">I")
+
+
+def _zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError(
+            'The msgpack+zstd codec needs zstandard, install it with `pip install ".[codec]"`.'
+        ) from None
+    return zstandard
+
+
+class ZstdSerializer(SerializerProtocol):
+    """Checkpoint serializer that compresses the output of another serializer with zstd.
+
+    Compressed blobs are tagged with a `+zstd` suffix of their type, so checkpoints
+    written without compression can still be read.
+    """
+
+    def __init__(
+        self,
+        serde: Optional[SerializerProtocol] = None,
+        level: int = DEFAULT_LEVEL,
+        min_size: int = MIN_COMPRESSED_SIZE,
+    ) -> None:
+        """Compress the blobs of `serde` of at least `min_size` bytes at zstd `level`."""
+        self.serde = serde or JsonPlusSerializer()
+        self.level = level
+        self.min_size = min_size
+        self._zstd = _zstandard()
+        # zstd (de)compressors must not be shared between threads
+        self._local = threading.local()
+
+    def _codecs(self):
+        codecs = getattr(self._local, "codecs", None)
+        if codecs is None:
+            codecs = self._local.codecs = (
+                self._zstd.ZstdCompressor(level=self.level),
+                self._zstd.ZstdDecompressor(),
+            )
+        return codecs
+
+    def dumps_typed(self, obj: Any) -> Tuple[str, bytes]:
+        """Serialize an object to a `(type, bytes)` tuple, compressing large blobs."""
+        type_, data = self.serde.dumps_typed(obj)
+        if len(data) < self.min_size:
+            return type_, data
+        return type_ + _SUFFIX, self._codecs()[0].compress(data)
+
+    def loads_typed(self, data: Tuple[str, bytes]) -> Any:
+        """Deserialize a `(type, bytes)` tuple, compressed or not."""
+        type_, blob = data
+        if type_.endswith(_SUFFIX):
+            type_ = type_[: -len(_SUFFIX)]
+            blob = self._codecs()[1].decompress(blob)
+        return self.serde.loads_typed((type_, blob))
+
+
+_state_serializer = None
+
+
+def _state_serde() -> ZstdSerializer:
+    global _state_serializer
+    if _state_serializer is None:
+        _state_serializer = ZstdSerializer(min_size=0)
+    return _state_serializer
+
+
+def encode_state(values: dict) -> bytes:
+    """Encode a state snapshot (e.g. `graph.get_state(config).values`) as msgpack+zstd."""
+    return _state_serde().dumps_typed(values)[1]
+
+
+def decode_state(data: bytes) -> dict:
+    """Decode a state snapshot encoded by `encode_state`."""
+    return _state_serde().loads_typed(("msgpack" + _SUFFIX, data))
+
+
+class EventStreamEncoder:
+    """Encode stream events as length-prefixed msgpack frames of one zstd stream.
+
+    Every call returns the compressed bytes of one `{"event": ..., "data": ...}` frame,
+    flushed so that the client can decode the event as soon as it arrives.
+    """
+
+    def __init__(self, level: int = DEFAULT_LEVEL) -> None:
+        """Start a zstd stream compressed at `level`."""
+        zstd = _zstandard()
+        self._flush = zstd.COMPRESSOBJ_FLUSH_BLOCK
+        self._stream = zstd.ZstdCompressor(level=level).compressobj()
+
+    def __call__(self, event: str, data: Any) -> bytes:
+        """Encode one event."""
+        frame = ormsgpack.packb(
+            {"event": event, "data": data}, option=ormsgpack.OPT_NON_STR_KEYS
+        )
+        return self._stream.compress(
+            _FRAME_HEADER.pack(len(frame)) + frame
+        ) + self._stream.flush(self._flush)
+
+
+def decode_event_stream(chunks: Iterable[bytes]) -> Iterator[Tuple[str, Any]]:
+    """Decode the `(event, data)` pairs of a stream encoded by `EventStreamEncoder`."""
+    decompressor = _zstandard().ZstdDecompressor().decompressobj()
+    buffer = b""
+    for chunk in chunks:
+        buffer += decompressor.decompress(chunk)
+        while len(buffer) >= _FRAME_HEADER.size:
+            (length,) = _FRAME_HEADER.unpack_from(buffer)
+            end = _FRAME_HEADER.size + length
+            if len(buffer) < end:
+                break
+            frame = ormsgpack.unpackb(
+                buffer[_FRAME_HEADER.size : end], option=ormsgpack.OPT_NON_STR_KEYS
+            )
+            buffer = buffer[end:]
+            yield frame["event"], frame["data"]
@@ -0,0 +1,31 @@
+"""Token budget of the research summaries shown to the reflection model."""
+
+from typing import List
+
+from agent.state import OverallState
+
+# Rough number of characters per token of Gemini models for english text
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimate the number of tokens of a text without calling the tokenizer."""
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def research_summaries(state: OverallState) -> List[str]:
+    """Get the summaries to show to the reflection and answer models.
+
+    That is the running condensed summary (if any) followed by the web research
+    results that haven't been folded into it yet.
+    """
+    compacted = state.get("compacted_result_count") or 0
+    summaries = list(state.get("web_research_result", [])[compacted:])
+    if state.get("running_summary"):
+        summaries.insert(0, state["running_summary"])
+    return summaries
+
+
+def needs_compaction(summaries: List[str], token_budget: int) -> bool:
+    """Check whether the summaries exceed the token budget. A budget < 1 disables compaction."""
+    return token_budget > 0 and estimate_tokens("".join(summaries)) > token_budget
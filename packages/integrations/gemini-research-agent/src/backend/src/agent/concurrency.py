@@ -0,0 +1,58 @@
+"""Per-run concurrency limits of the async research graph."""
+
+import asyncio
+import weakref
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+
+from langchain_core.runnables import RunnableConfig
+
+from agent.configuration import RUN_CONTEXT_KEY
+
+# Semaphores only live while at least one node of the run holds or waits on them,
+# so finished runs don't leak entries and each semaphore stays on a single loop.
+_run_semaphores: "weakref.WeakValueDictionary[tuple[str, int], asyncio.Semaphore]" = (
+    weakref.WeakValueDictionary()
+)
+
+
+def get_run_key(config: Optional[RunnableConfig]) -> str:
+    """Get an identifier shared by every node of the same research run.
+
+    Nodes are handed the context of their run (see `agent.context`), whose id is
+    created by the first node of every invocation, so invocations sharing a thread
+    don't share their limits. Nodes running on their own fall back to the thread id
+    (or the run id in the metadata); local runs without either share a single
+    anonymous bucket.
+    """
+    config = config or {}
+    configurable = config.get("configurable") or {}
+    context = configurable.get(RUN_CONTEXT_KEY)
+    if context is not None:
+        return context.values["id"]
+    metadata = config.get("metadata") or {}
+    run_key = configurable.get("thread_id") or metadata.get("run_id")
+    return str(run_key) if run_key is not None else "anonymous"
+
+
+@asynccontextmanager
+async def run_concurrency_slot(
+    config: Optional[RunnableConfig], limit: int
+) -> AsyncIterator[None]:
+    """Hold one of the `limit` request slots of the current run while the block executes.
+
+    Args:
+        config: The runnable config of the calling node, used to identify the run.
+        limit: Maximum number of concurrent requests for the run. Values < 1 disable the limit.
+    """
+    if limit < 1:
+        yield
+        return
+
+    key = (get_run_key(config), limit)
+    semaphore = _run_semaphores.get(key)
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(limit)
+        _run_semaphores[key] = semaphore
+    async with semaphore:
+        yield
@@ -1,9 +1,14 @@
 import os
-from pydantic import BaseModel, Field
-from typing import Any, Optional
+from pydantic import BaseModel, Field, field_validator
+from typing import Any, Dict, Optional
 
 from langchain_core.runnables import RunnableConfig
 
+from agent.rate_limit import parse_rate_limits
+
+# Config key of the `agent.context.RunContext` handed to the nodes of a run
+RUN_CONTEXT_KEY = "run_context"
+
 
 class Configuration(BaseModel):
     """The configuration for the agent."""
@@ -39,14 +44,233 @@ class Configuration(BaseModel):
         metadata={"description": "The maximum number of research loops to perform."},
     )
 
+    summary_token_budget: int = Field(
+        default=0,
+        metadata={
+            "description": "Once the research summaries sent to the reflection and answer models exceed this estimated number of tokens (e.g. 8000), they are folded into a condensed running summary. Values < 1 disable compaction."
+        },
+    )
+
+    answer_token_budget: int = Field(
+        default=0,
+        metadata={
+            "description": "Once the research summaries sent to the answer model exceed this estimated number of tokens, only their passages most relevant to the research topic (BM25) that fit it are kept. Values < 1 disable pruning."
+        },
+    )
+
+    compaction_model: str = Field(
+        default="gemini-2.0-flash",
+        metadata={
+            "description": "The name of the language model to use for condensing the research summaries."
+        },
+    )
+
+    max_concurrent_requests: int = Field(
+        default=8,
+        metadata={
+            "description": "The maximum number of in-flight Gemini requests per research run when the graph runs asynchronously. Values < 1 disable the limit."
+        },
+    )
+
+    query_similarity_threshold: float = Field(
+        default=0.8,
+        metadata={
+            "description": "Search queries at least this similar (Jaccard similarity of their shingles) to a query already run in the session are dropped. Values above 1 disable the check."
+        },
+    )
+
+    search_cache_path: str = Field(
+        default="",
+        metadata={
+            "description": "The SQLite file caching processed web research results (e.g. .cache/web_research.sqlite3). An empty path disables the cache."
+        },
+    )
+
+    search_cache_ttl_seconds: int = Field(
+        default=6 * 60 * 60,
+        metadata={
+            "description": "The freshness window of cached web research results, in seconds."
+        },
+    )
+
+    search_cache_max_entries: int = Field(
+        default=10_000,
+        metadata={
+            "description": "The maximum number of cached web research results, least recently used ones are evicted first."
+        },
+    )
+
+    knowledge_store_path: str = Field(
+        default="",
+        metadata={
+            "description": "The SQLite file indexing the passages of gathered web research for local-first retrieval. Queries well covered by fresh passages are researched from it instead of Google Search. An empty path disables it."
+        },
+    )
+
+    knowledge_max_age_seconds: int = Field(
+        default=7 * 24 * 60 * 60,
+        metadata={
+            "description": "Only passages gathered this recently are used for local retrieval, in seconds."
+        },
+    )
+
+    knowledge_min_coverage: float = Field(
+        default=0.8,
+        metadata={
+            "description": "The fraction of the content words of a query the retrieved local passages have to contain for the query to be researched locally, from 0 to 1."
+        },
+    )
+
+    knowledge_max_passages: int = Field(
+        default=6,
+        metadata={
+            "description": "The number of best matching (BM25) local passages a query is researched from."
+        },
+    )
+
+    answer_cache_path: str = Field(
+        default="",
+        metadata={
+            "description": "The SQLite file caching final answers by normalized research topic and research settings (e.g. .cache/answers.sqlite3). An empty path disables the cache."
+        },
+    )
+
+    answer_cache_ttl_seconds: int = Field(
+        default=60 * 60,
+        metadata={"description": "The freshness window of cached answers, in seconds."},
+    )
+
+    answer_cache_max_entries: int = Field(
+        default=1_000,
+        metadata={
+            "description": "The maximum number of cached answers, least recently used ones are evicted first."
+        },
+    )
+
+    bypass_answer_cache: bool = Field(
+        default=False,
+        metadata={
+            "description": "Research the question even if a fresh answer is cached, replacing the cached answer."
+        },
+    )
+
+    rate_limits: Dict[str, Dict[str, int]] = Field(
+        default_factory=dict,
+        metadata={
+            "description": 'Per-model request and token budgets per minute, e.g. {"gemini-2.5-pro": {"rpm": 150, "tpm": 2000000}}. Also accepted as a JSON string. Models without an entry are not rate limited.'
+        },
+    )
+
+    rate_limit_path: str = Field(
+        default="",
+        metadata={
+            "description": "The SQLite file holding the rate limit buckets, to share the budgets between worker processes. An empty path keeps them in process."
+        },
+    )
+
+    adaptive_concurrency_max: int = Field(
+        default=0,
+        metadata={
+            "description": "The upper bound of the adaptive (AIMD) concurrency limit per model, which is halved on 429 responses and grows back on successful calls. Values < 1 disable it."
+        },
+    )
+
+    adaptive_latency_target_ms: int = Field(
+        default=0,
+        metadata={
+            "description": "Calls slower than this shrink the adaptive concurrency limit of their model, in milliseconds. Values < 1 only react to 429 responses."
+        },
+    )
+
+    wave_quorum: float = Field(
+        default=1.0,
+        metadata={
+            "description": "The fraction of the web research branches of a wave (rounded up) that has to return before reflection starts; the remaining branches are stragglers. 1 waits for every branch."
+        },
+    )
+
+    wave_deadline_ms: int = Field(
+        default=0,
+        metadata={
+            "description": "Branches still searching this long after their wave started are stragglers, in milliseconds. Values < 1 disable the deadline."
+        },
+    )
+
+    branch_timeout_ms: int = Field(
+        default=0,
+        metadata={
+            "description": "The timeout of the search of a single web research branch, in milliseconds. Values < 1 disable it."
+        },
+    )
+
+    hedge_after_ms: int = Field(
+        default=0,
+        metadata={
+            "description": "Send a duplicate search request when a branch hasn't been answered after this long and use the first response, in milliseconds. Values < 1 disable hedging."
+        },
+    )
+
+    straggler_policy: str = Field(
+        default="defer",
+        metadata={
+            "description": "What happens to the queries of stragglers: `defer` runs them in the next research loop, `cancel` drops them."
+        },
+    )
+
+    deadline_ms: int = Field(
+        default=0,
+        metadata={
+            "description": "The latency budget of a run, in milliseconds. The number of initial queries, whether another research loop fits and the answer model tier are picked to meet it from the observed node latencies. Values < 1 disable it and always research to the configured depth."
+        },
+    )
+
+    fast_answer_model: str = Field(
+        default="gemini-2.5-flash",
+        metadata={
+            "description": "The name of the faster language model to answer with when the answer model doesn't fit the remaining latency budget. An empty name disables the fallback."
+        },
+    )
+
+    cascade_model: str = Field(
+        default="",
+        metadata={
+            "description": "The name of a faster, cheaper language model tried first for query generation and reflection, escalating to the configured models on invalid output, low confidence or a knowledge gap. Runs settled by it are also answered by it. An empty name disables the cascade."
+        },
+    )
+
+    cascade_min_confidence: float = Field(
+        default=0.7,
+        metadata={
+            "description": "Results of the cascade model reporting a lower confidence (from 0 to 1) are escalated."
+        },
+    )
+
+    citation_tokens: bool = Field(
+        default=False,
+        metadata={
+            "description": "Cite sources with short run-scoped tokens like [S12] instead of short url links in the summaries shown to the reflection, compaction and answer models, saving prompt tokens. The tokens are expanded to links in the final answer."
+        },
+    )
+
+    @field_validator("rate_limits", mode="before")
+    @classmethod
+    def _parse_rate_limits(cls, value: Any) -> Dict[str, Dict[str, int]]:
+        return parse_rate_limits(value)
+
     @classmethod
     def from_runnable_config(
         cls, config: Optional[RunnableConfig] = None
     ) -> "Configuration":
-        """Create a Configuration instance from a RunnableConfig."""
+        """Create a Configuration instance from a RunnableConfig.
+
+        Nodes handed the context of their run get its configuration, resolved once.
+        """
         configurable = (
             config["configurable"] if config and "configurable" in config else {}
         )
+        context = configurable.get(RUN_CONTEXT_KEY)
+        if context is not None:
+            return context.configuration
 
         # Get raw values from environment or config
         raw_values: dict[str, Any] = {
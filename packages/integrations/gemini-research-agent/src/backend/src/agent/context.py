@@ -0,0 +1,171 @@
+"""Per-run context of the research graph, computed once when a run starts.
+
+Resolving the `Configuration` (which scans the environment and validates a pydantic
+model) and extracting the research topic from the whole message history would
+otherwise be repeated by every node. The first node of a run resolves them once into
+a `RunContext` kept in this process, and every other node is handed it through its
+config, where `Configuration.from_runnable_config` picks up the resolved configuration.
+
+Only small values are written to the `run_context` state key, which is copied into
+every `Send` payload and checkpoint: the id of the run, its date and the models and
+limits it runs with. A node of the run in another process (e.g. after a resume)
+rebuilds the context from them, its config and its state. Prompts are formatted where
+they are used.
+"""
+
+import hashlib
+import threading
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from langchain_core.runnables import RunnableConfig
+
+from agent.configuration import RUN_CONTEXT_KEY, Configuration
+from agent.prompts import (
+    answer_instructions,
+    get_current_date,
+    link_citation_instructions,
+    query_writer_instructions,
+    reflection_instructions,
+    summary_compaction_instructions,
+    token_citation_instructions,
+    web_searcher_instructions,
+)
+from agent.utils import get_research_topic
+
+# Number of run contexts kept resolved in this process
+MAX_CACHED_CONTEXTS = 1_024
+
+# Settings a run keeps even if it is resumed with another configuration
+PINNED_SETTINGS = (
+    "query_generator_model",
+    "reflection_model",
+    "answer_model",
+    "number_of_initial_queries",
+    "max_research_loops",
+    "deadline_ms",
+    "citation_tokens",
+)
+
+_PROMPTS = {
+    "query_writer": query_writer_instructions,
+    "web_searcher": web_searcher_instructions,
+    "reflection": reflection_instructions,
+    "summary_compaction": summary_compaction_instructions,
+    "answer": answer_instructions,
+}
+
+
+def prompts_digest() -> str:
+    """Get a digest of the prompt templates, which changes whenever one of them does."""
+    digest = hashlib.sha256()
+    for templates in (
+        _PROMPTS,
+        link_citation_instructions,
+        token_citation_instructions,
+    ):
+        for name, template in sorted(templates.items()):
+            digest.update(f"{name}\0{template}\0".encode())
+    return digest.hexdigest()
+
+
+class RunContext:
+    """The resolved configuration, research topic and date of a research run."""
+
+    def __init__(
+        self,
+        values: Dict[str, Any],
+        configuration: Configuration,
+        research_topic: Optional[str],
+    ) -> None:
+        """Wrap the state `values` of a run with its resolved configuration and topic."""
+        self.values = values
+        self.configuration = configuration
+        self.research_topic = research_topic
+        self.current_date: str = values["current_date"]
+
+    def prompt(self, name: str, **values: Any) -> str:
+        """Format a prompt of the run with the fields of the calling node."""
+        citations = (
+            token_citation_instructions
+            if self.configuration.citation_tokens
+            else link_citation_instructions
+        )
+        fields = {
+            "current_date": self.current_date,
+            "research_topic": self.research_topic,
+            "citation_instructions": citations.get(name, ""),
+            **values,
+        }
+        return _PROMPTS[name].format(**fields)
+
+
+_contexts: "OrderedDict[str, RunContext]" = OrderedDict()
+_contexts_lock = threading.Lock()
+
+
+def _research_topic(state: dict) -> Optional[str]:
+    # The web research branches only get their search query, not the messages
+    if "messages" not in state:
+        return None
+    return get_research_topic(state["messages"])
+
+
+def build_run_context(state: dict, config: Optional[RunnableConfig]) -> RunContext:
+    """Compute the context of a run starting from `state`."""
+    configuration = Configuration.from_runnable_config(config)
+    values = {
+        "id": uuid.uuid4().hex,
+        "current_date": get_current_date(),
+        **{name: getattr(configuration, name) for name in PINNED_SETTINGS},
+    }
+    context = RunContext(values, configuration, _research_topic(state))
+    _remember(context)
+    return context
+
+
+def _remember(context: RunContext) -> None:
+    with _contexts_lock:
+        _contexts[context.values["id"]] = context
+        _contexts.move_to_end(context.values["id"])
+        while len(_contexts) > MAX_CACHED_CONTEXTS:
+            _contexts.popitem(last=False)
+
+
+def load_run_context(state: dict, config: Optional[RunnableConfig]) -> RunContext:
+    """Get the `RunContext` of the `run_context` of a state, resolving it once per process."""
+    values = state["run_context"]
+    with _contexts_lock:
+        context = _contexts.get(values["id"])
+        if context is not None:
+            _contexts.move_to_end(values["id"])
+    if context is not None:
+        if context.research_topic is None and "messages" in state:
+            context.research_topic = _research_topic(state)
+        return context
+    configuration = Configuration.from_runnable_config(config).model_copy(
+        update={name: values[name] for name in PINNED_SETTINGS if name in values}
+    )
+    context = RunContext(values, configuration, _research_topic(state))
+    _remember(context)
+    return context
+
+
+def with_run_context(config: Optional[RunnableConfig], context: RunContext) -> dict:
+    """Hand a run context to a node through its config."""
+    config = config or {}
+    return {
+        **config,
+        "configurable": {**config.get("configurable", {}), RUN_CONTEXT_KEY: context},
+    }
+
+
+def get_run_context(state: dict, config: Optional[RunnableConfig]) -> RunContext:
+    """Get the context a node was handed, or compute it if the node runs on its own."""
+    context = ((config or {}).get("configurable") or {}).get(RUN_CONTEXT_KEY)
+    if context is not None:
+        return context
+    if state.get("run_context"):
+        return load_run_context(state, config)
+    return build_run_context(state, config)
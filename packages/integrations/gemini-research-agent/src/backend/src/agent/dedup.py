@@ -0,0 +1,73 @@
+"""Near-duplicate filtering of the search queries of a research run."""
+
+import logging
+from typing import FrozenSet, Iterable, List
+
+from agent.cache import normalize_text
+
+logger = logging.getLogger(__name__)
+
+
+def query_shingles(query: str, size: int = 3) -> FrozenSet[str]:
+    """Get the character shingles of the normalized tokens of a query.
+
+    Shingling each token on its own (with boundary markers) makes the signature
+    independent of word order while tolerating small inflection differences
+    such as "price" and "prices".
+    """
+    shingles = set()
+    for token in normalize_text(query).split():
+        padded = f"#{token}#"
+        if len(padded) <= size:
+            shingles.add(padded)
+            continue
+        shingles.update(padded[i : i + size] for i in range(len(padded) - size + 1))
+    return frozenset(shingles)
+
+
+def jaccard_similarity(left: FrozenSet[str], right: FrozenSet[str]) -> float:
+    """Get the Jaccard similarity of two shingle sets."""
+    if not left and not right:
+        return 1.0
+    return len(left & right) / len(left | right)
+
+
+def filter_similar_queries(
+    queries: Iterable[str], previous_queries: Iterable[str], threshold: float
+) -> List[str]:
+    """Drop queries that are near-duplicates of previous ones or of each other.
+
+    Research sessions only run a handful of queries, so the exact Jaccard similarity
+    of the shingle sets is cheap enough and avoids MinHash approximation errors.
+
+    Args:
+        queries: The candidate queries, in order of preference.
+        previous_queries: The queries already run in this research session.
+        threshold: Queries at least this similar to a kept or previous query are dropped.
+
+    Returns:
+        list: The queries to run, in their original order.
+    """
+    seen = [(query, query_shingles(query)) for query in previous_queries]
+    kept = []
+    for query in queries:
+        shingles = query_shingles(query)
+        duplicate_of, similarity = None, 0.0
+        for seen_query, seen_shingles in seen:
+            similarity = jaccard_similarity(shingles, seen_shingles)
+            if similarity >= threshold:
+                duplicate_of = seen_query
+                break
+        if duplicate_of is not None:
+            logger.info(
+                "Dropping query %r: %.2f similar to %r (threshold %.2f)",
+                query,
+                similarity,
+                duplicate_of,
+                threshold,
+            )
+            continue
+        logger.debug("Keeping query %r", query)
+        seen.append((query, shingles))
+        kept.append(query)
+    return kept
@@ -1,193 +1,971 @@
-import os
+import asyncio
+import contextlib
+import functools
+import inspect
+import time
+from typing import List, Optional, Tuple
 
-from agent.tools_and_schemas import SearchQueryList, Reflection
-from dotenv import load_dotenv
+from agent.tools_and_schemas import (
+    RatedReflection,
+    RatedSearchQueryList,
+    SearchQueryList,
+    Reflection,
+)
 from langchain_core.messages import AIMessage
 from langgraph.types import Send
 from langgraph.graph import StateGraph
 from langgraph.graph import START, END
-from langchain_core.runnables import RunnableConfig
-from google.genai import Client
+from langchain_core.runnables import RunnableConfig, RunnableLambda
 
 from agent.state import (
     OverallState,
     QueryGenerationState,
     ReflectionState,
+    ResearchLoopState,
     WebSearchState,
 )
+from agent.budget import (
+    choose_answer_model,
+    deadline_at,
+    plan_initial_queries,
+    plan_next_loop,
+)
+from agent.cascade import VALIDATION_ERRORS, cascade_stats, escalation_reason
+from agent.cache import get_cache, make_cache_key, normalize_text
+from agent.clients import get_chat_model, get_genai_client
+from agent.concurrency import run_concurrency_slot
+from agent.compaction import estimate_tokens, needs_compaction, research_summaries
 from agent.configuration import Configuration
-from agent.prompts import (
-    get_current_date,
-    query_writer_instructions,
-    web_searcher_instructions,
-    reflection_instructions,
-    answer_instructions,
+from agent.context import (
+    RunContext,
+    build_run_context,
+    get_run_context,
+    load_run_context,
+    prompts_digest,
+    with_run_context,
+)
+from agent.dedup import filter_similar_queries
+from agent.knowledge import (
+    combine_passages,
+    coverage,
+    get_knowledge_store,
+    query_terms,
+)
+from agent.pruning import prune_summaries
+from agent.quorum import (
+    arun_branch,
+    forget_waves,
+    join_wave,
+    quorum_enabled,
+    run_branch,
+    straggler_queries,
+)
+from agent.rate_limit import get_rate_limiter
+from agent.telemetry import current_metrics, instrument, record_genai_usage
+from agent.sources import (
+    citation_expander,
+    register_sources,
+    renumber_refs,
+    tokenize_citations,
 )
-from langchain_google_genai import ChatGoogleGenerativeAI
 from agent.utils import (
+    SHORT_URL_PREFIX,
     get_citations,
-    get_research_topic,
     insert_citation_markers,
     resolve_urls,
 )
 
-load_dotenv()
+# Importing this module has no side effects: `.env`, the cassette of the environment
+# and the Gemini clients are loaded lazily by the client registry on the first call,
+# so the graph compiles (e.g. in every server worker) without credentials.
+
+
+def _record_queueing(queued_at: float, model: str) -> float:
+    """Count a call of the current node to `model` and the time it waited for its slots.
+
+    Returns:
+        The time the call starts at, see `_record_call`.
+    """
+    node_metrics = current_metrics()
+    if node_metrics is not None:
+        node_metrics.add_call(time.perf_counter() - queued_at, model)
+    return time.perf_counter()
+
+
+def _record_call(called_at: float, model: str, result):
+    """Record the latency of a successful chat model call of the current node."""
+    node_metrics = current_metrics()
+    if node_metrics is not None:
+        node_metrics.observe_call(model, time.perf_counter() - called_at)
+    return result
+
+
+def _invoke_model(
+    runnable, prompt, model: str, configurable: Configuration, config: RunnableConfig
+):
+    """Invoke a model within the rate limits of `model`."""
+    limiter = get_rate_limiter(configurable.rate_limit_path)
+    queued_at = time.perf_counter()
+    with limiter.limit(model, prompt, configurable) as slot:
+        called_at = _record_queueing(queued_at, model)
+        return slot.record(_record_call(called_at, model, runnable.invoke(prompt)))
+
+
+async def _ainvoke_model(
+    runnable, prompt, model: str, configurable: Configuration, config: RunnableConfig
+):
+    """Async version of `_invoke_model`, also holding a concurrency slot of the run."""
+    limiter = get_rate_limiter(configurable.rate_limit_path)
+    queued_at = time.perf_counter()
+    async with run_concurrency_slot(config, configurable.max_concurrent_requests):
+        async with limiter.alimit(model, prompt, configurable) as slot:
+            called_at = _record_queueing(queued_at, model)
+            result = await runnable.ainvoke(prompt)
+            return slot.record(_record_call(called_at, model, result))
+
+
+def _generate_content(
+    request: dict, configurable: Configuration, config: RunnableConfig
+):
+    """Call `generate_content` of the genai client within the rate limits of the model."""
+    limiter = get_rate_limiter(configurable.rate_limit_path)
+    queued_at = time.perf_counter()
+    with limiter.limit(request["model"], request["contents"], configurable) as slot:
+        _record_queueing(queued_at, request["model"])
+        response = get_genai_client().models.generate_content(**request)
+    record_genai_usage(response)
+    return slot.record(response)
+
+
+async def _agenerate_content(
+    request: dict, configurable: Configuration, config: RunnableConfig
+):
+    """Async version of `_generate_content`, also holding a concurrency slot of the run."""
+    limiter = get_rate_limiter(configurable.rate_limit_path)
+    queued_at = time.perf_counter()
+    async with run_concurrency_slot(config, configurable.max_concurrent_requests):
+        async with limiter.alimit(
+            request["model"], request["contents"], configurable
+        ) as slot:
+            _record_queueing(queued_at, request["model"])
+            response = await get_genai_client().aio.models.generate_content(**request)
+    record_genai_usage(response)
+    return slot.record(response)
+
+
+def _cascade_attempt(
+    call: tuple, schema, temperature: float, configurable: Configuration
+):
+    """Build the cheap first attempt of a structured model call, if the cascade is enabled.
+
+    Args:
+        call: The structured model, prompt and model name the attempt escalates to.
+        schema: The structured output of the attempt, rating its confidence.
+
+    Returns:
+        The structured cascade model, the prompt and its model name, or None.
+    """
+    _, prompt, model = call
+    if not configurable.cascade_model or configurable.cascade_model == model:
+        return None
+    llm = get_chat_model(
+        model=configurable.cascade_model, temperature=temperature, max_retries=2
+    )
+    return llm.with_structured_output(schema), prompt, configurable.cascade_model
+
+
+def _settle_cascade(
+    stage: str, call: tuple, result, started: float, configurable: Configuration
+):
+    """Check the result of a cheap attempt and count it in the cascade stats.
+
+    Returns:
+        The accepted result (None if it has to be escalated to `call`) and the stats.
+    """
+    reason = escalation_reason(result, configurable.cascade_min_confidence)
+    node_metrics = current_metrics()
+    if node_metrics is not None:
+        node_metrics.annotate(
+            cascade="accepted" if reason is None else f"escalated:{reason}"
+        )
+        if reason is not None:
+            # The result of the node comes from the escalation model
+            node_metrics.set_model(call[2])
+    stats = cascade_stats(stage, call[2], time.perf_counter() - started, reason)
+    return (result if reason is None else None), stats
+
+
+def _invoke_cascade(
+    stage: str, call: tuple, cheap, configurable: Configuration, config: RunnableConfig
+):
+    """Invoke the cheap attempt of a structured call first, escalating to `call` if needed.
+
+    Returns:
+        The result and the cascade stats of the attempt, None without a cascade.
+    """
+    if cheap is None:
+        return _invoke_model(*call, configurable, config), None
+    started = time.perf_counter()
+    try:
+        result = _invoke_model(*cheap, configurable, config)
+    except VALIDATION_ERRORS:
+        result = None
+    result, stats = _settle_cascade(stage, call, result, started, configurable)
+    if result is None:
+        result = _invoke_model(*call, configurable, config)
+    return result, stats
+
+
+async def _ainvoke_cascade(
+    stage: str, call: tuple, cheap, configurable: Configuration, config: RunnableConfig
+):
+    """Async version of `_invoke_cascade`."""
+    if cheap is None:
+        return await _ainvoke_model(*call, configurable, config), None
+    started = time.perf_counter()
+    try:
+        result = await _ainvoke_model(*cheap, configurable, config)
+    except VALIDATION_ERRORS:
+        result = None
+    result, stats = _settle_cascade(stage, call, result, started, configurable)
+    if result is None:
+        result = await _ainvoke_model(*call, configurable, config)
+    return result, stats
+
+
+def _cascade_update(stats) -> OverallState:
+    return {"cascade_stats": stats} if stats is not None else {}
+
 
-if os.getenv("GEMINI_API_KEY") is None:
-    raise ValueError("GEMINI_API_KEY is not set")
+def _requested_answer_model(state: OverallState, configurable: Configuration) -> str:
+    return state.get("reasoning_model") or configurable.answer_model
 
-# Used for Google Search API
-genai_client = Client(api_key=os.getenv("GEMINI_API_KEY"))
+
+def _max_research_loops(state: OverallState, configurable: Configuration) -> int:
+    if state.get("max_research_loops") is not None:
+        return state["max_research_loops"]
+    return configurable.max_research_loops
+
+
+def _run_deadline(state: OverallState, configurable: Configuration) -> Optional[float]:
+    """Get the deadline of the current run, None if it was started without `deadline_ms`."""
+    if configurable.deadline_ms < 1:
+        return None
+    return state.get("deadline_at")
 
 
 # Nodes
-def generate_query(state: OverallState, config: RunnableConfig) -> QueryGenerationState:
-    """LangGraph node that generates search queries based on the User's question.
+def _answer_cache_key(state: OverallState, context: RunContext) -> str:
+    """Key an answer by its normalized research topic, the prompts and the settings shaping the research."""
+    configurable = context.configuration
+    initial_queries = state.get("initial_search_query_count")
+    return make_cache_key(
+        "answer",
+        normalize_text(context.research_topic),
+        prompts_digest(),
+        configurable.query_generator_model,
+        configurable.reflection_model,
+        _requested_answer_model(state, configurable),
+        initial_queries
+        if initial_queries is not None
+        else configurable.number_of_initial_queries,
+        _max_research_loops(state, configurable),
+        configurable.cascade_model,
+        configurable.deadline_ms,
+        configurable.summary_token_budget,
+        configurable.knowledge_store_path,
+        configurable.citation_tokens,
+        configurable.answer_token_budget,
+    )
+
+
+def _load_cached_answer(state: OverallState, context: RunContext) -> OverallState:
+    """Build the `answer_cache` state update: the cached answer and its sources, if fresh."""
+    configurable = context.configuration
+    if not configurable.answer_cache_path or configurable.bypass_answer_cache:
+        return {"answer_cached": False}
+    entry = get_cache(configurable.answer_cache_path).get(
+        _answer_cache_key(state, context), configurable.answer_cache_ttl_seconds
+    )
+    if entry is None:
+        return {"answer_cached": False}
+    return {
+        "messages": [AIMessage(content=entry["content"])],
+        "sources_gathered": entry["sources_gathered"],
+        "answer_cached": True,
+    }
+
+
+def _store_cached_answer(
+    update: OverallState, state: OverallState, context: RunContext
+) -> None:
+    """Store the answer of `finalize_answer` and the sources it cites in the answer cache."""
+    configurable = context.configuration
+    if not configurable.answer_cache_path:
+        return
+    get_cache(configurable.answer_cache_path).set(
+        _answer_cache_key(state, context),
+        {
+            "content": update["messages"][-1].content,
+            "sources_gathered": update["sources_gathered"],
+        },
+        ttl_seconds=configurable.answer_cache_ttl_seconds,
+        max_entries=configurable.answer_cache_max_entries,
+    )
+
+
+def _start_deadline(context: RunContext) -> OverallState:
+    """Start the latency budget of the run, clearing the deadline of an earlier run of the thread."""
+    configurable = context.configuration
+    if configurable.deadline_ms < 1:
+        return {"deadline_at": None}
+    return {"deadline_at": deadline_at(configurable)}
 
-    Uses Gemini 2.0 Flash to create an optimized search queries for web research based on
-    the User's question.
+
+def answer_cache(state: OverallState, config: RunnableConfig) -> OverallState:
+    """LangGraph node that starts a run and answers it from the answer cache, if possible.
+
+    Computes the context of the run (see `agent.context`) for the following nodes and
+    starts its latency budget, if any.
+    Questions with the same normalized research topic and research settings share an
+    answer; `bypass_answer_cache` researches them again.
 
     Args:
         state: Current graph state containing the User's question
-        config: Configuration for the runnable, including LLM provider settings
+        config: Configuration for the runnable, including the answer cache settings
 
     Returns:
-        Dictionary with state update, including search_query key containing the generated queries
+        Dictionary with state update, including run_context, deadline_at, answer_cached
+        and, on a hit, the cached messages and sources_gathered
+    """
+    context = build_run_context(state, config)
+    update = _load_cached_answer(state, context)
+    return {"run_context": context.values, **_start_deadline(context), **update}
+
+
+async def aanswer_cache(state: OverallState, config: RunnableConfig) -> OverallState:
+    """Async version of `answer_cache`."""
+    context = build_run_context(state, config)
+    update = await asyncio.to_thread(_load_cached_answer, state, context)
+    return {"run_context": context.values, **_start_deadline(context), **update}
+
+
+def route_answer_cache(state: OverallState) -> str:
+    """LangGraph routing function that ends the run on an answer cache hit."""
+    return END if state.get("answer_cached") else "generate_query"
+
+
+def _initial_query_budget(
+    state: OverallState, configurable: Configuration
+) -> OverallState:
+    """Cap the initial query count to the latency budget of the run.
+
+    Returns:
+        The state update recording the decision, empty without a deadline.
     """
-    configurable = Configuration.from_runnable_config(config)
+    deadline = _run_deadline(state, configurable)
+    if deadline is None:
+        return {}
+    requested = state.get("initial_search_query_count")
+    decision = plan_initial_queries(
+        requested if requested is not None else configurable.number_of_initial_queries,
+        _requested_answer_model(state, configurable),
+        deadline,
+        configurable,
+    )
+    state["initial_search_query_count"] = decision["initial_queries"]
+    return {"budget_decisions": [decision]}
+
+
+def _budgeted_queries(queries: list, state: OverallState, budget_update: dict) -> list:
+    """Drop the queries the model generated beyond the count fitting the latency budget."""
+    if not budget_update:
+        return queries
+    return queries[: state["initial_search_query_count"]]
+
+
+def _query_writer(state: OverallState, context: RunContext):
+    """Build the structured query writer model, its prompt and model name for `generate_query`."""
+    configurable = context.configuration
 
     # check for custom initial search query count
     if state.get("initial_search_query_count") is None:
         state["initial_search_query_count"] = configurable.number_of_initial_queries
 
     # init Gemini 2.0 Flash
-    llm = ChatGoogleGenerativeAI(
+    llm = get_chat_model(
         model=configurable.query_generator_model,
         temperature=1.0,
         max_retries=2,
-        api_key=os.getenv("GEMINI_API_KEY"),
     )
     structured_llm = llm.with_structured_output(SearchQueryList)
 
     # Format the prompt
-    current_date = get_current_date()
-    formatted_prompt = query_writer_instructions.format(
-        current_date=current_date,
-        research_topic=get_research_topic(state["messages"]),
-        number_queries=state["initial_search_query_count"],
+    formatted_prompt = context.prompt(
+        "query_writer", number_queries=state["initial_search_query_count"]
     )
-    # Generate the search queries
-    result = structured_llm.invoke(formatted_prompt)
-    return {"search_query": result.query}
+    return structured_llm, formatted_prompt, configurable.query_generator_model
 
 
-def continue_to_web_research(state: QueryGenerationState):
-    """LangGraph node that sends the search queries to the web research node.
+def generate_query(state: OverallState, config: RunnableConfig) -> QueryGenerationState:
+    """LangGraph node that generates search queries based on the User's question.
 
-    This is used to spawn n number of web research nodes, one for each search query.
+    Uses Gemini 2.0 Flash to create an optimized search queries for web research based on
+    the User's question.
+
+    Args:
+        state: Current graph state containing the User's question
+        config: Configuration for the runnable, including LLM provider settings
+
+    Returns:
+        Dictionary with state update, including search_query key containing the generated queries
     """
-    return [
-        Send("web_research", {"search_query": search_query, "id": int(idx)})
-        for idx, search_query in enumerate(state["search_query"])
-    ]
+    context = get_run_context(state, config)
+    configurable = context.configuration
+    budget_update = _initial_query_budget(state, configurable)
+    call = _query_writer(state, context)
+    # Generate the search queries, with the cascade model first if configured
+    cheap = _cascade_attempt(call, RatedSearchQueryList, 1.0, configurable)
+    result, stats = _invoke_cascade("generate_query", call, cheap, configurable, config)
+    return {
+        "search_query": _budgeted_queries(result.query, state, budget_update),
+        **budget_update,
+        **_cascade_update(stats),
+    }
 
 
-def web_research(state: WebSearchState, config: RunnableConfig) -> OverallState:
-    """LangGraph node that performs web research using the native Google Search API tool.
+async def agenerate_query(
+    state: OverallState, config: RunnableConfig
+) -> QueryGenerationState:
+    """Async version of `generate_query`."""
+    context = get_run_context(state, config)
+    configurable = context.configuration
+    budget_update = _initial_query_budget(state, configurable)
+    call = _query_writer(state, context)
+    cheap = _cascade_attempt(call, RatedSearchQueryList, 1.0, configurable)
+    result, stats = await _ainvoke_cascade(
+        "generate_query", call, cheap, configurable, config
+    )
+    return {
+        "search_query": _budgeted_queries(result.query, state, budget_update),
+        **budget_update,
+        **_cascade_update(stats),
+    }
 
-    Executes a web search using the native Google Search API tool in combination with Gemini 2.0 Flash.
 
-    Args:
-        state: Current graph state containing the search query and research loop count
-        config: Configuration for the runnable, including search API settings
+def continue_to_web_research(state: QueryGenerationState, config: RunnableConfig):
+    """LangGraph node that sends the search queries to the web research node.
 
-    Returns:
-        Dictionary with state update, including sources_gathered, research_loop_count, and web_research_results
+    This is used to spawn n number of web research nodes, one for each search query.
+    Near-duplicate queries are dropped before the fan-out.
     """
-    # Configure
-    configurable = Configuration.from_runnable_config(config)
-    formatted_prompt = web_searcher_instructions.format(
-        current_date=get_current_date(),
-        research_topic=state["search_query"],
+    configurable = get_run_context(state, config).configuration
+    search_queries = filter_similar_queries(
+        state["search_query"], [], configurable.query_similarity_threshold
     )
+    # Every branch, stragglers included, advances `next_query_id` by one, so branch ids
+    # (which prefix the short urls of their citations) are never reused in a thread
+    first_id = state.get("next_query_id") or 0
+    return [
+        Send(
+            "web_research",
+            {
+                "search_query": search_query,
+                "id": first_id + int(idx),
+                "wave": 0,
+                "wave_size": len(search_queries),
+                "run_context": state.get("run_context"),
+            },
+        )
+        for idx, search_query in enumerate(search_queries)
+    ]
 
-    # Uses the google genai client as the langchain client doesn't return grounding metadata
-    response = genai_client.models.generate_content(
-        model=configurable.query_generator_model,
-        contents=formatted_prompt,
-        config={
+
+def _web_search_request(state: WebSearchState, context: RunContext) -> dict:
+    """Build the keyword arguments of the grounded `generate_content` call for `web_research`."""
+    formatted_prompt = context.prompt(
+        "web_searcher", research_topic=state["search_query"]
+    )
+    return {
+        "model": context.configuration.query_generator_model,
+        "contents": formatted_prompt,
+        "config": {
             "tools": [{"google_search": {}}],
             "temperature": 0,
         },
-    )
+    }
+
+
+def _process_web_search_response(response, research_id: int) -> dict:
+    """Turn a grounded search response into a (cacheable) web research entry."""
     # resolve the urls to short urls for saving tokens and time
     resolved_urls = resolve_urls(
-        response.candidates[0].grounding_metadata.grounding_chunks, state["id"]
+        response.candidates[0].grounding_metadata.grounding_chunks, research_id
     )
     # Gets the citations and adds them to the generated text
     citations = get_citations(response, resolved_urls)
     modified_text = insert_citation_markers(response.text, citations)
-    sources_gathered = [item for citation in citations for item in citation["segments"]]
+    sources = register_sources(
+        segment for citation in citations for segment in citation["segments"]
+    )
 
     return {
-        "sources_gathered": sources_gathered,
+        "id": research_id,
+        "web_research_result": modified_text,
+        "sources": sources,
+        "resolved_urls": resolved_urls,
+    }
+
+
+def _reassign_research_id(entry: dict, research_id: int) -> dict:
+    """Rewrite the short urls of a cached entry to the id of the current branch.
+
+    Short urls embed the id of the branch that produced them, so a cached entry has
+    to be renumbered to not collide with the short urls of the other branches.
+    """
+    if entry["id"] == research_id:
+        return entry
+    old_prefix = f"{SHORT_URL_PREFIX}{entry['id']}-"
+    new_prefix = f"{SHORT_URL_PREFIX}{research_id}-"
+    return {
+        "id": research_id,
+        "web_research_result": entry["web_research_result"].replace(
+            old_prefix, new_prefix
+        ),
+        "sources": renumber_refs(
+            _entry_sources(entry), f"{entry['id']}-", f"{research_id}-"
+        ),
+        "resolved_urls": {
+            url: short_url.replace(old_prefix, new_prefix)
+            for url, short_url in entry["resolved_urls"].items()
+        },
+    }
+
+
+def _entry_sources(entry: dict) -> dict:
+    """Get the source registry fragment of a web research entry."""
+    if "sources" in entry:
+        return entry["sources"]
+    # Entries cached before the source registry list a segment per citation
+    return register_sources(entry["sources_gathered"])
+
+
+def _search_cache_key(state: WebSearchState, configurable: Configuration) -> str:
+    return make_cache_key(
+        "web_research",
+        configurable.query_generator_model,
+        normalize_text(state["search_query"]),
+    )
+
+
+def _load_cached_research(state: WebSearchState, configurable: Configuration):
+    """Get the cached web research entry of the query, if the cache holds a fresh one."""
+    if not configurable.search_cache_path:
+        return None
+    entry = get_cache(configurable.search_cache_path).get(
+        _search_cache_key(state, configurable), configurable.search_cache_ttl_seconds
+    )
+    return _reassign_research_id(entry, state["id"]) if entry is not None else None
+
+
+def _store_cached_research(
+    entry: dict, state: WebSearchState, configurable: Configuration
+) -> None:
+    """Store a freshly computed web research entry in the cache."""
+    if not configurable.search_cache_path:
+        return
+    get_cache(configurable.search_cache_path).set(
+        _search_cache_key(state, configurable),
+        entry,
+        ttl_seconds=configurable.search_cache_ttl_seconds,
+        max_entries=configurable.search_cache_max_entries,
+    )
+
+
+def _load_local_research(
+    state: WebSearchState, configurable: Configuration
+) -> Tuple[Optional[dict], dict]:
+    """Research the query from the fresh local passages covering it, if any (see `agent.knowledge`).
+
+    Returns:
+        The web research entry, None if the query has to be searched on the web, and
+        how it was retrieved.
+    """
+    if not configurable.knowledge_store_path:
+        return None, {"source": "web"}
+    passages = get_knowledge_store(configurable.knowledge_store_path).search(
+        state["search_query"],
+        configurable.knowledge_max_age_seconds,
+        configurable.knowledge_max_passages,
+    )
+    covered = round(coverage(query_terms(state["search_query"]), passages), 3)
+    if not passages or covered < configurable.knowledge_min_coverage:
+        return None, {"source": "web", "local_coverage": covered}
+    text, sources = combine_passages(passages, state["id"])
+    entry = {
+        "id": state["id"],
+        "web_research_result": text,
+        "sources": sources,
+        "resolved_urls": {},
+    }
+    return entry, {
+        "source": "local",
+        "local_coverage": covered,
+        "passages": len(passages),
+    }
+
+
+def _load_research(
+    state: WebSearchState, configurable: Configuration
+) -> Tuple[Optional[dict], dict]:
+    """Get the web research entry of the query from the search cache or the knowledge store.
+
+    Returns:
+        The entry, None if the query has to be searched on the web, and how it was
+        retrieved: its `source` ("cache", "local" or "web") and local coverage.
+    """
+    entry = _load_cached_research(state, configurable)
+    if entry is not None:
+        return entry, {"source": "cache"}
+    return _load_local_research(state, configurable)
+
+
+def _store_research(
+    entry: dict, state: WebSearchState, configurable: Configuration
+) -> None:
+    """Store a freshly searched web research entry in the cache and the knowledge store."""
+    _store_cached_research(entry, state, configurable)
+    if configurable.knowledge_store_path:
+        get_knowledge_store(configurable.knowledge_store_path).add(
+            state["search_query"], entry["web_research_result"], entry["sources"]
+        )
+
+
+def _web_research_update(
+    entry: dict, state: WebSearchState, configurable: Configuration, retrieval: dict
+) -> OverallState:
+    """Build the `web_research` state update from a web research entry and how it was retrieved."""
+    update = {
+        "source_registry": _entry_sources(entry),
         "search_query": [state["search_query"]],
-        "web_research_result": [modified_text],
+        "web_research_result": [entry["web_research_result"]],
+        "retrieval_sources": [{"query": state["search_query"], **retrieval}],
+        "next_query_id": 1,
     }
+    if configurable.search_cache_path:
+        cached = retrieval["source"] == "cache"
+        update["search_cache_stats"] = {"hits": int(cached), "misses": int(not cached)}
+    return update
 
 
-def reflection(state: OverallState, config: RunnableConfig) -> ReflectionState:
-    """LangGraph node that identifies knowledge gaps and generates potential follow-up queries.
+def _join_wave(
+    state: WebSearchState, configurable: Configuration, config: RunnableConfig
+):
+    """Join the wave of the branch, if any of the tail-latency controls is configured."""
+    if not quorum_enabled(configurable):
+        return contextlib.nullcontext()
+    return join_wave(
+        config, state.get("wave", 0), state.get("wave_size", 1), configurable
+    )
+
+
+def _straggler_update(
+    state: WebSearchState, configurable: Configuration
+) -> OverallState:
+    """Build the `web_research` state update of a branch that gave up its search."""
+    node_metrics = current_metrics()
+    if node_metrics is not None:
+        node_metrics.annotate(straggled=True)
+    deferred = configurable.straggler_policy == "defer"
+    return {
+        "deferred_queries": [
+            {"query": state["search_query"], "wave": state.get("wave", 0)}
+        ]
+        if deferred
+        else [],
+        "wave_stats": {"stragglers": 1},
+        "next_query_id": 1,
+    }
+
+
+def _branch_stats(outcome) -> dict:
+    """Count a branch that returned within its wave, and whether it was hedged."""
+    node_metrics = current_metrics()
+    if outcome.hedged and node_metrics is not None:
+        node_metrics.annotate(hedged=True)
+    return {"completed": 1, "hedged": int(outcome.hedged)}
 
-    Analyzes the current summary to identify areas for further research and generates
-    potential follow-up queries. Uses structured output to extract
-    the follow-up query in JSON format.
+
+def web_research(state: WebSearchState, config: RunnableConfig) -> OverallState:
+    """LangGraph node that performs web research using the native Google Search API tool.
+
+    Executes a web search using the native Google Search API tool in combination with Gemini 2.0 Flash.
+    Processed results are served from the persistent search cache while they are fresh,
+    and queries covered by fresh local passages from the knowledge store.
+    With a wave quorum, deadline or branch timeout, a slow search is given up (see `agent.quorum`).
 
     Args:
-        state: Current graph state containing the running summary and research topic
-        config: Configuration for the runnable, including LLM provider settings
+        state: Current graph state containing the search query and research loop count
+        config: Configuration for the runnable, including search API settings
 
     Returns:
-        Dictionary with state update, including search_query key containing the generated follow-up query
+        Dictionary with state update, including source_registry, search_query, and web_research_result
+    """
+    context = get_run_context(state, config)
+    configurable = context.configuration
+    with _join_wave(state, configurable, config) as wave:
+        entry, retrieval = _load_research(state, configurable)
+        if entry is not None:
+            if wave is not None:
+                wave.finish()
+            return _web_research_update(entry, state, configurable, retrieval)
+
+        # Uses the google genai client as the langchain client doesn't return grounding metadata
+        request = _web_search_request(state, context)
+        if wave is None:
+            response = _generate_content(request, configurable, config)
+        else:
+            outcome = run_branch(
+                wave,
+                lambda: _generate_content(request, configurable, config),
+                configurable,
+            )
+            if outcome.straggled:
+                return _straggler_update(state, configurable)
+            response = outcome.result
+    entry = _process_web_search_response(response, state["id"])
+    _store_research(entry, state, configurable)
+    update = _web_research_update(entry, state, configurable, retrieval)
+    if wave is not None:
+        update["wave_stats"] = _branch_stats(outcome)
+    return update
+
+
+async def aweb_research(state: WebSearchState, config: RunnableConfig) -> OverallState:
+    """Async version of `web_research`, cancelling the searches of stragglers."""
+    context = get_run_context(state, config)
+    configurable = context.configuration
+    with _join_wave(state, configurable, config) as wave:
+        entry, retrieval = await asyncio.to_thread(_load_research, state, configurable)
+        if entry is not None:
+            if wave is not None:
+                wave.finish()
+            return _web_research_update(entry, state, configurable, retrieval)
+
+        request = _web_search_request(state, context)
+        if wave is None:
+            response = await _agenerate_content(request, configurable, config)
+        else:
+            outcome = await arun_branch(
+                wave,
+                lambda: _agenerate_content(request, configurable, config),
+                configurable,
+            )
+            if outcome.straggled:
+                return _straggler_update(state, configurable)
+            response = outcome.result
+    entry = _process_web_search_response(response, state["id"])
+    await asyncio.to_thread(_store_research, entry, state, configurable)
+    update = _web_research_update(entry, state, configurable, retrieval)
+    if wave is not None:
+        update["wave_stats"] = _branch_stats(outcome)
+    return update
+
+
+def _tokenized_summaries(
+    state: OverallState, configurable: Configuration
+) -> Tuple[List[str], int]:
+    """Get the research summaries to show to a model, with citation tokens if configured.
+
+    Returns:
+        The summaries and the number of tokens the citation tokens save.
     """
-    configurable = Configuration.from_runnable_config(config)
+    summaries = research_summaries(state)
+    if not configurable.citation_tokens:
+        return summaries, 0
+    tokenized = [
+        tokenize_citations(summary, state.get("source_registry"))
+        for summary in summaries
+    ]
+    return tokenized, estimate_tokens("".join(summaries)) - estimate_tokens(
+        "".join(tokenized)
+    )
+
+
+def _count_saved_tokens(saved: int) -> None:
+    """Count the tokens citation tokens save in a prompt that is sent."""
+    node_metrics = current_metrics()
+    if node_metrics is not None and saved:
+        node_metrics.add_saved_tokens(saved)
+
+
+def _summaries(state: OverallState, configurable: Configuration) -> List[str]:
+    """Get the research summaries of a prompt that is sent, counting the tokens saved."""
+    summaries, saved = _tokenized_summaries(state, configurable)
+    _count_saved_tokens(saved)
+    return summaries
+
+
+def _reflection_model(state: OverallState, context: RunContext):
+    """Build the structured reflection model, its prompt and model name for `reflection`."""
+    configurable = context.configuration
     # Increment the research loop count and get the reasoning model
     state["research_loop_count"] = state.get("research_loop_count", 0) + 1
     reasoning_model = state.get("reasoning_model", configurable.reflection_model)
 
     # Format the prompt
-    current_date = get_current_date()
-    formatted_prompt = reflection_instructions.format(
-        current_date=current_date,
-        research_topic=get_research_topic(state["messages"]),
-        summaries="\n\n---\n\n".join(state["web_research_result"]),
+    formatted_prompt = context.prompt(
+        "reflection", summaries="\n\n---\n\n".join(_summaries(state, configurable))
     )
     # init Reasoning Model
-    llm = ChatGoogleGenerativeAI(
+    llm = get_chat_model(
         model=reasoning_model,
         temperature=1.0,
         max_retries=2,
-        api_key=os.getenv("GEMINI_API_KEY"),
     )
-    result = llm.with_structured_output(Reflection).invoke(formatted_prompt)
+    return llm.with_structured_output(Reflection), formatted_prompt, reasoning_model
 
-    return {
+
+def _compaction_model(state: OverallState, context: RunContext):
+    """Build the model and prompt condensing the research summaries, if they exceed the budget.
+
+    Returns:
+        The model, its prompt and model name, or None if the summaries fit the token budget.
+    """
+    configurable = context.configuration
+    summaries, saved = _tokenized_summaries(state, configurable)
+    if not needs_compaction(summaries, configurable.summary_token_budget):
+        return None
+    _count_saved_tokens(saved)
+
+    formatted_prompt = context.prompt(
+        "summary_compaction",
+        max_tokens=configurable.summary_token_budget // 2,
+        summaries="\n\n---\n\n".join(summaries),
+    )
+    llm = get_chat_model(
+        model=configurable.compaction_model,
+        temperature=0,
+        max_retries=2,
+    )
+    return llm, formatted_prompt, configurable.compaction_model
+
+
+def _reflection_update(
+    result: Reflection, state: OverallState, condensed=None, stats=None
+) -> ReflectionState:
+    """Turn the structured reflection (and condensed summary) into the `reflection` state update."""
+    update = {
+        **_cascade_update(stats),
         "is_sufficient": result.is_sufficient,
         "knowledge_gap": result.knowledge_gap,
         "follow_up_queries": result.follow_up_queries,
         "research_loop_count": state["research_loop_count"],
         "number_of_ran_queries": len(state["search_query"]),
     }
+    # Questions settled by the cascade model are also answered by it; the flag is reset
+    # without a cascade attempt, so a new turn of a thread doesn't inherit it
+    update["cascade_settled"] = (
+        stats is not None and "reflection.escalations" not in stats
+    )
+    if condensed is not None:
+        # Later loops and the answer only see the condensed summary plus newer results
+        update["running_summary"] = condensed.content
+        update["compacted_result_count"] = len(state["web_research_result"])
+    return update
+
+
+def _loop_budget(
+    update: ReflectionState, state: OverallState, configurable: Configuration
+) -> ReflectionState:
+    """Add whether another research loop fits the latency budget to the reflection update."""
+    deadline = _run_deadline(state, configurable)
+    if (
+        deadline is None
+        or update["is_sufficient"]
+        or update["research_loop_count"] >= _max_research_loops(state, configurable)
+    ):
+        return update
+    decision = plan_next_loop(
+        len(update["follow_up_queries"]),
+        _requested_answer_model(state, configurable),
+        deadline,
+        configurable,
+    )
+    decision["research_loop_count"] = update["research_loop_count"]
+    return {
+        **update,
+        "deadline_reached": not decision["another_loop"],
+        "budget_decisions": [decision],
+    }
+
+
+def reflection(state: OverallState, config: RunnableConfig) -> ReflectionState:
+    """LangGraph node that identifies knowledge gaps and generates potential follow-up queries.
+
+    Analyzes the current summary to identify areas for further research and generates
+    potential follow-up queries. Uses structured output to extract
+    the follow-up query in JSON format. Once the summaries exceed the token budget,
+    they are also folded into a condensed running summary. With a deadline, it also
+    decides whether another research loop fits the latency budget.
+
+    Args:
+        state: Current graph state containing the running summary and research topic
+        config: Configuration for the runnable, including LLM provider settings
+
+    Returns:
+        Dictionary with state update, including search_query key containing the generated follow-up query
+    """
+    context = get_run_context(state, config)
+    configurable = context.configuration
+    # Every branch of the last wave has returned
+    if quorum_enabled(configurable):
+        forget_waves(config)
+    call = _reflection_model(state, context)
+    cheap = _cascade_attempt(call, RatedReflection, 1.0, configurable)
+    compaction = _compaction_model(state, context)
+    result, stats = _invoke_cascade("reflection", call, cheap, configurable, config)
+    condensed = _invoke_model(*compaction, configurable, config) if compaction else None
+    return _loop_budget(
+        _reflection_update(result, state, condensed, stats), state, configurable
+    )
+
+
+async def areflection(state: OverallState, config: RunnableConfig) -> ReflectionState:
+    """Async version of `reflection`, condensing the summaries concurrently."""
+    context = get_run_context(state, config)
+    configurable = context.configuration
+    # Every branch of the last wave has returned
+    if quorum_enabled(configurable):
+        forget_waves(config)
+    call = _reflection_model(state, context)
+    cheap = _cascade_attempt(call, RatedReflection, 1.0, configurable)
+    compaction = _compaction_model(state, context)
+    if compaction is None:
+        result, stats = await _ainvoke_cascade(
+            "reflection", call, cheap, configurable, config
+        )
+        return _loop_budget(
+            _reflection_update(result, state, stats=stats), state, configurable
+        )
+    (result, stats), condensed = await asyncio.gather(
+        _ainvoke_cascade("reflection", call, cheap, configurable, config),
+        _ainvoke_model(*compaction, configurable, config),
+    )
+    return _loop_budget(
+        _reflection_update(result, state, condensed, stats), state, configurable
+    )
 
 
 def evaluate_research(
-    state: ReflectionState,
+    state: ResearchLoopState,
     config: RunnableConfig,
 ) -> OverallState:
     """LangGraph routing function that determines the next step in the research flow.
 
     Controls the research loop by deciding whether to continue gathering information
-    or to finalize the summary based on the configured maximum number of research loops.
+    or to finalize the summary based on the configured maximum number of research loops
+    and, with a deadline, the latency budget left.
 
     Args:
         state: Current graph state containing the research loop count
@@ -196,25 +974,121 @@ def evaluate_research(
     Returns:
         String literal indicating the next node to visit ("web_research" or "finalize_summary")
     """
-    configurable = Configuration.from_runnable_config(config)
-    max_research_loops = (
-        state.get("max_research_loops")
-        if state.get("max_research_loops") is not None
-        else configurable.max_research_loops
+    configurable = get_run_context(state, config).configuration
+    if (
+        state["is_sufficient"]
+        or state.get("deadline_reached")
+        or state["research_loop_count"] >= _max_research_loops(state, configurable)
+    ):
+        return "finalize_answer"
+
+    # Don't research paraphrases of queries that already ran in this session,
+    # but give the queries deferred by the stragglers of the last wave another chance
+    deferred_queries = straggler_queries(state)
+    follow_up_queries = deferred_queries + filter_similar_queries(
+        state["follow_up_queries"],
+        state.get("search_query", []) + deferred_queries,
+        configurable.query_similarity_threshold,
     )
-    if state["is_sufficient"] or state["research_loop_count"] >= max_research_loops:
+    if not follow_up_queries:
         return "finalize_answer"
+    return [
+        Send(
+            "web_research",
+            {
+                "search_query": follow_up_query,
+                "id": state["next_query_id"] + int(idx),
+                "wave": state["research_loop_count"],
+                "wave_size": len(follow_up_queries),
+                "run_context": state.get("run_context"),
+            },
+        )
+        for idx, follow_up_query in enumerate(follow_up_queries)
+    ]
+
+
+def _answer_tier(state: OverallState, configurable: Configuration):
+    """Pick the answer model, falling back to the fast tier if it doesn't fit the deadline.
+
+    Questions whose last reflection was settled by the cascade model are answered by it.
+
+    Returns:
+        The model name and the state update recording the decision, if the run has a deadline.
+    """
+    answer_model = _requested_answer_model(state, configurable)
+    if configurable.cascade_model and state.get("cascade_settled"):
+        answer_model = configurable.cascade_model
+    deadline = _run_deadline(state, configurable)
+    if deadline is None:
+        return answer_model, {}
+    decision = choose_answer_model(answer_model, deadline, configurable)
+    return decision["answer_model"], {"budget_decisions": [decision]}
+
+
+def _answer_cascade(state: OverallState, started: float, configurable: Configuration):
+    """Count the answer in the cascade stats, escalated if the reflection was."""
+    if not configurable.cascade_model:
+        return {}
+    answer_model = _requested_answer_model(state, configurable)
+    if state.get("cascade_settled"):
+        stats = cascade_stats(
+            "finalize_answer", answer_model, time.perf_counter() - started, None
+        )
     else:
-        return [
-            Send(
-                "web_research",
-                {
-                    "search_query": follow_up_query,
-                    "id": state["number_of_ran_queries"] + int(idx),
-                },
-            )
-            for idx, follow_up_query in enumerate(state["follow_up_queries"])
-        ]
+        stats = cascade_stats("finalize_answer", answer_model, 0, "reflection")
+    return {"cascade_stats": stats}
+
+
+def _answer_summaries(state: OverallState, context: RunContext):
+    """Get the summaries to show to the answer model, pruned to the answer token budget.
+
+    Returns:
+        The summaries and the state update recording the dropped passages, if pruning is enabled.
+    """
+    configurable = context.configuration
+    summaries = _summaries(state, configurable)
+    if configurable.answer_token_budget < 1:
+        return summaries, {}
+    summaries, dropped = prune_summaries(
+        summaries,
+        context.research_topic,
+        configurable.answer_token_budget,
+    )
+    node_metrics = current_metrics()
+    if node_metrics is not None and dropped:
+        node_metrics.annotate(
+            passages_pruned=len(dropped),
+            pruned_tokens=sum(passage["tokens"] for passage in dropped),
+        )
+    return summaries, {"pruned_passages": dropped}
+
+
+def _answer_model(state: OverallState, context: RunContext, reasoning_model: str):
+    """Build the answer model, its prompt, model name and pruning update for `finalize_answer`."""
+    summaries, pruning_update = _answer_summaries(state, context)
+
+    # Format the prompt
+    formatted_prompt = context.prompt("answer", summaries="\n---\n\n".join(summaries))
+
+    # init Reasoning Model, default to Gemini 2.5 Flash
+    llm = get_chat_model(
+        model=reasoning_model,
+        temperature=0,
+        max_retries=2,
+    )
+    return llm, formatted_prompt, reasoning_model, pruning_update
+
+
+def _answer_update(result, state: OverallState):
+    """Expand the short urls of the answer and collect the sources it cites."""
+    # Replace the short urls and citation tokens with the original urls and add all used urls to the sources_gathered
+    expander = citation_expander(state.get("source_registry"))
+    content = expander.expand(result.content)
+
+    return {
+        "messages": [AIMessage(content=content)],
+        "sources_gathered": expander.cited_sources,
+    }
 
 
 def finalize_answer(state: OverallState, config: RunnableConfig):
@@ -230,53 +1104,100 @@ def finalize_answer(state: OverallState, config: RunnableConfig):
     Returns:
         Dictionary with state update, including running_summary key containing the formatted final summary with sources
     """
-    configurable = Configuration.from_runnable_config(config)
-    reasoning_model = state.get("reasoning_model") or configurable.answer_model
-
-    # Format the prompt
-    current_date = get_current_date()
-    formatted_prompt = answer_instructions.format(
-        current_date=current_date,
-        research_topic=get_research_topic(state["messages"]),
-        summaries="\n---\n\n".join(state["web_research_result"]),
+    context = get_run_context(state, config)
+    configurable = context.configuration
+    answer_model, budget_update = _answer_tier(state, configurable)
+    llm, formatted_prompt, model, pruning_update = _answer_model(
+        state, context, answer_model
     )
+    started = time.perf_counter()
+    result = _invoke_model(llm, formatted_prompt, model, configurable, config)
+    update = {
+        **_answer_update(result, state),
+        **budget_update,
+        **pruning_update,
+        **_answer_cascade(state, started, configurable),
+    }
+    _store_cached_answer(update, state, context)
+    return update
 
-    # init Reasoning Model, default to Gemini 2.5 Flash
-    llm = ChatGoogleGenerativeAI(
-        model=reasoning_model,
-        temperature=0,
-        max_retries=2,
-        api_key=os.getenv("GEMINI_API_KEY"),
-    )
-    result = llm.invoke(formatted_prompt)
-
-    # Replace the short urls with the original urls and add all used urls to the sources_gathered
-    unique_sources = []
-    for source in state["sources_gathered"]:
-        if source["short_url"] in result.content:
-            result.content = result.content.replace(
-                source["short_url"], source["value"]
-            )
-            unique_sources.append(source)
 
-    return {
-        "messages": [AIMessage(content=result.content)],
-        "sources_gathered": unique_sources,
+async def afinalize_answer(state: OverallState, config: RunnableConfig):
+    """Async version of `finalize_answer`."""
+    context = get_run_context(state, config)
+    configurable = context.configuration
+    answer_model, budget_update = _answer_tier(state, configurable)
+    llm, formatted_prompt, model, pruning_update = _answer_model(
+        state, context, answer_model
+    )
+    started = time.perf_counter()
+    result = await _ainvoke_model(llm, formatted_prompt, model, configurable, config)
+    update = {
+        **_answer_update(result, state),
+        **budget_update,
+        **pruning_update,
+        **_answer_cascade(state, started, configurable),
     }
+    await asyncio.to_thread(_store_cached_answer, update, state, context)
+    return update
 
 
 # Create our Agent Graph
 builder = StateGraph(OverallState, config_schema=Configuration)
 
+
 # Define the nodes we will cycle between
-builder.add_node("generate_query", generate_query)
-builder.add_node("web_research", web_research)
-builder.add_node("reflection", reflection)
-builder.add_node("finalize_answer", finalize_answer)
+# Each node has a sync and an async implementation: `graph.invoke` runs the former,
+# `graph.ainvoke`/`graph.astream` (used by the LangGraph server) the latter.
+# Both are instrumented to report their latency and token usage, see `agent.telemetry`,
+# and handed the context computed by the first node of the run, see `agent.context`.
+def _handing_run_context(func):
+    def node_config(state, config):
+        if not state.get("run_context"):
+            return config
+        return with_run_context(config, load_run_context(state, config))
+
+    if inspect.iscoroutinefunction(func):
+
+        @functools.wraps(func)
+        async def async_wrapper(state, config):
+            return await func(state, node_config(state, config))
+
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(state, config):
+        return func(state, node_config(state, config))
+
+    return wrapper
+
+
+def _node(name: str, func, afunc, starts_run: bool = False) -> RunnableLambda:
+    if not starts_run:
+        func, afunc = _handing_run_context(func), _handing_run_context(afunc)
+    return RunnableLambda(instrument(name, func), instrument(name, afunc), name=name)
+
 
-# Set the entrypoint as `generate_query`
+builder.add_node(
+    "answer_cache",
+    _node("answer_cache", answer_cache, aanswer_cache, starts_run=True),
+)
+builder.add_node(
+    "generate_query", _node("generate_query", generate_query, agenerate_query)
+)
+builder.add_node("web_research", _node("web_research", web_research, aweb_research))
+builder.add_node("reflection", _node("reflection", reflection, areflection))
+builder.add_node(
+    "finalize_answer", _node("finalize_answer", finalize_answer, afinalize_answer)
+)
+
+# Set the entrypoint as `answer_cache`
 # This means that this node is the first one called
-builder.add_edge(START, "generate_query")
+builder.add_edge(START, "answer_cache")
+# Answer from the cache or research the question
+builder.add_conditional_edges(
+    "answer_cache", route_answer_cache, ["generate_query", END]
+)
 # Add conditional edge to continue with search queries in a parallel branch
 builder.add_conditional_edges(
     "generate_query", continue_to_web_research, ["web_research"]
@@ -290,4 +1211,11 @@ builder.add_conditional_edges(
 # Finalize the answer
 builder.add_edge("finalize_answer", END)
 
-graph = builder.compile(name="pro-search-agent")
+
+def compile_graph(checkpointer=None):
+    """Compile the research graph, optionally persisting its runs with `checkpointer`."""
+    return builder.compile(checkpointer=checkpointer, name="pro-search-agent")
+
+
+# The LangGraph server attaches its own checkpointer (see `langgraph.json`)
+graph = compile_graph()
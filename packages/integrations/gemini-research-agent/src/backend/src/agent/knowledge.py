@@ -0,0 +1,248 @@
+"""Local knowledge store of the web research gathered by earlier runs.
+
+Every processed web research result is split into passages (its paragraphs and list
+items) that
+are indexed with SQLite FTS5, together with the sources they cite and the time
+they were gathered. Before searching the web, `web_research` ranks the fresh
+passages against its query with BM25 and, when they cover enough of the query's
+terms, researches the query from them instead (see `Configuration.knowledge_*`).
+Queries that aren't covered locally, the gaps, still go to Google Search, and
+their results are indexed in turn.
+
+Passages keep the short url citations of the branch that gathered them;
+`combine_passages` renumbers them to the branch reusing them.
+"""
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Tuple
+
+from agent.cache import normalize_text
+from agent.utils import SHORT_URL_PREFIX
+
+# A short url and its ref ("<branch id>-<chunk index>")
+_SHORT_URL = re.compile(re.escape(SHORT_URL_PREFIX) + r"([0-9]+-[0-9]+)")
+
+# A markdown citation link, left out of the indexed text
+_CITATION_LINK = re.compile(r"\[[^\[\]]*\]\([^)]*\)")
+
+# Words too common to tell whether a passage covers a query
+STOPWORDS = frozenset(
+    "a an and are as at be by for from how in is it of on or that the this to "
+    "was what when where which who why will with".split()
+)
+
+
+def query_terms(text: str) -> List[str]:
+    """Get the distinct content words of a query, in order."""
+    terms = []
+    for word in normalize_text(text).split():
+        if word not in STOPWORDS and word not in terms:
+            terms.append(word)
+    return terms
+
+
+def coverage(terms: List[str], passages: List[Dict[str, Any]]) -> float:
+    """Get the fraction of the query terms found in the passages."""
+    if not terms:
+        return 0.0
+    words = set()
+    for passage in passages:
+        words.update(normalize_text(passage["plain"]).split())
+    return sum(term in words for term in terms) / len(terms)
+
+
+def split_passages(text: str) -> List[str]:
+    """Split a web research result into its paragraphs and list items."""
+    return [line.strip() for line in text.splitlines() if line.strip()]
+
+
+def _passage_sources(text: str, sources: Dict[str, Any]) -> Dict[str, Any]:
+    """Get the registry fragment of the sources cited by a passage."""
+    cited = {"urls": [], "labels": [], "refs": {}}
+    ids: Dict[int, int] = {}
+    for ref in _SHORT_URL.findall(text):
+        source_id = sources["refs"].get(ref)
+        if source_id is None:
+            continue
+        if source_id not in ids:
+            ids[source_id] = len(cited["urls"])
+            cited["urls"].append(sources["urls"][source_id])
+            cited["labels"].append(sources["labels"][source_id])
+        cited["refs"][ref] = ids[source_id]
+    return cited
+
+
+def combine_passages(
+    passages: List[Dict[str, Any]], research_id: int
+) -> Tuple[str, Dict[str, Any]]:
+    """Join passages into a web research result of the branch `research_id`.
+
+    Returns:
+        The text, with the short urls renumbered to the branch, and its source
+        registry fragment (see `agent.sources`).
+    """
+    urls: List[str] = []
+    labels: List[str] = []
+    refs: Dict[str, int] = {}
+    ids: Dict[str, int] = {}
+    texts = []
+    for passage in passages:
+        sources = passage["sources"]
+
+        def replace(match: re.Match) -> str:
+            source_id = sources["refs"].get(match.group(1))
+            if source_id is None:
+                return match.group()
+            url = sources["urls"][source_id]
+            if url not in ids:
+                ids[url] = len(urls)
+                urls.append(url)
+                labels.append(sources["labels"][source_id])
+                refs[f"{research_id}-{ids[url]}"] = ids[url]
+            return f"{SHORT_URL_PREFIX}{research_id}-{ids[url]}"
+
+        texts.append(_SHORT_URL.sub(replace, passage["text"]))
+    return "\n\n".join(texts), {"urls": urls, "labels": labels, "refs": refs}
+
+
+class KnowledgeStore:
+    """SQLite FTS5 index of web research passages, their sources and gathering time.
+
+    The database can be shared by several worker processes; each thread uses its own
+    connection. A passage gathered again only has its timestamp refreshed.
+    """
+
+    def __init__(self, path: str) -> None:
+        """Open (and create, if needed) the knowledge store database at `path`."""
+        self.path = path
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connection() as conn:
+            conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS passages (
+                    id INTEGER PRIMARY KEY,
+                    digest TEXT UNIQUE NOT NULL,
+                    query TEXT NOT NULL,
+                    text TEXT NOT NULL,
+                    plain TEXT NOT NULL,
+                    sources TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                );
+                CREATE VIRTUAL TABLE IF NOT EXISTS passages_fts USING fts5(
+                    plain, content='passages', content_rowid='id',
+                    tokenize='porter unicode61'
+                );
+                CREATE TRIGGER IF NOT EXISTS passages_insert AFTER INSERT ON passages
+                BEGIN
+                    INSERT INTO passages_fts (rowid, plain) VALUES (new.id, new.plain);
+                END;
+                CREATE TRIGGER IF NOT EXISTS passages_delete AFTER DELETE ON passages
+                BEGIN
+                    INSERT INTO passages_fts (passages_fts, rowid, plain)
+                    VALUES ('delete', old.id, old.plain);
+                END;
+                """
+            )
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def add(self, query: str, text: str, sources: Dict[str, Any]) -> int:
+        """Index the passages of a web research result.
+
+        Args:
+            query: The search query the result was gathered for.
+            text: The web research result, with its short url citations.
+            sources: The source registry fragment of the result.
+
+        Returns:
+            The number of passages indexed.
+        """
+        now = time.time()
+        rows = []
+        for passage in split_passages(text):
+            plain = _CITATION_LINK.sub("", passage)
+            if not normalize_text(plain):
+                continue
+            rows.append(
+                (
+                    hashlib.sha256(normalize_text(plain).encode("utf-8")).hexdigest(),
+                    query,
+                    passage,
+                    plain,
+                    json.dumps(_passage_sources(passage, sources), ensure_ascii=False),
+                    now,
+                )
+            )
+        with self._connection() as conn:
+            conn.executemany(
+                """
+                INSERT INTO passages (digest, query, text, plain, sources, created_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (digest) DO UPDATE SET created_at = excluded.created_at
+                """,
+                rows,
+            )
+        return len(rows)
+
+    def search(
+        self, query: str, max_age_seconds: float, limit: int
+    ) -> List[Dict[str, Any]]:
+        """Rank the passages gathered in the last `max_age_seconds` against a query with BM25.
+
+        Returns:
+            Up to `limit` passages, best first, with their `text`, `plain` text without
+            citations, `sources`, `created_at` and `score` (lower is better).
+        """
+        terms = query_terms(query)
+        if not terms or limit < 1:
+            return []
+        match = " OR ".join(f'"{term}"' for term in terms)
+        with self._connection() as conn:
+            rows = conn.execute(
+                """
+                SELECT passages.text, passages.plain, passages.sources,
+                       passages.created_at, bm25(passages_fts) AS score
+                FROM passages_fts JOIN passages ON passages.id = passages_fts.rowid
+                WHERE passages_fts MATCH ? AND passages.created_at >= ?
+                ORDER BY score LIMIT ?
+                """,
+                (match, time.time() - max_age_seconds, limit),
+            ).fetchall()
+        return [
+            {
+                "text": text,
+                "plain": plain,
+                "sources": json.loads(sources),
+                "created_at": created_at,
+                "score": score,
+            }
+            for text, plain, sources, created_at, score in rows
+        ]
+
+
+_stores: Dict[str, KnowledgeStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_knowledge_store(path: str) -> KnowledgeStore:
+    """Get the process-wide knowledge store at `path`."""
+    with _stores_lock:
+        store = _stores.get(path)
+        if store is None:
+            store = _stores[path] = KnowledgeStore(path)
+        return store
@@ -79,6 +79,19 @@ Summaries:
 {summaries}
 """
 
+summary_compaction_instructions = """Condense the research summaries below about "{research_topic}" into a single running summary.
+
+Instructions:
+- The current date is {current_date}.
+- Keep every fact, figure and date that is relevant to the research topic, drop repetitions and filler.
+- {citation_instructions}
+- Keep the summary under {max_tokens} tokens.
+- Only output the condensed summary.
+
+Summaries:
+{summaries}
+"""
+
 answer_instructions = """Generate a high-quality answer to the user's question based on the provided summaries.
 
 Instructions:
@@ -87,10 +100,22 @@ Instructions:
 - You have access to all the information gathered from the previous steps.
 - You have access to the user's question.
 - Generate a high-quality answer to the user's question based on the provided summaries and the user's question.
-- Include the sources you used from the Summaries in the answer correctly, use markdown format (e.g. [apnews](https://vertexaisearch.cloud.google.com/id/1-0)). THIS IS A MUST.
+- {citation_instructions}
 
 User Context:
 - {research_topic}
 
 Summaries:
 {summaries}"""
+
+# How the summary compaction and the answer cite their sources, with short url links
+# or with the citation tokens of `agent.sources` (see `citation_tokens`)
+link_citation_instructions = {
+    "summary_compaction": "Keep the citations of the facts you keep exactly as they appear, as markdown links (e.g. [apnews](https://vertexaisearch.cloud.google.com/id/1-0)). Never change or invent a link.",
+    "answer": "Include the sources you used from the Summaries in the answer correctly, use markdown format (e.g. [apnews](https://vertexaisearch.cloud.google.com/id/1-0)). THIS IS A MUST.",
+}
+
+token_citation_instructions = {
+    "summary_compaction": "Keep the citations of the facts you keep exactly as they appear, as source tokens (e.g. [S3]). Never change or invent a source token.",
+    "answer": "Include the sources you used from the Summaries in the answer correctly, cite them with their source tokens right after the facts they support (e.g. [S3]). THIS IS A MUST.",
+}
@@ -0,0 +1,114 @@
+"""Relevance pruning of the research summaries shown to the answer model.
+
+The answer model is the most expensive of a run, and its prompt holds every research
+summary, including passages about side tracks the research took. With an
+`answer_token_budget`, `finalize_answer` splits the summaries into passages (their
+paragraphs and list items), ranks them against the research topic with BM25 and keeps
+the best passages that fit the budget, in their original order. Passages keep their
+citations, so the answer cites the same sources. The dropped passages are returned in
+the `pruned_passages` state key.
+
+Ranking is local and lexical: it costs no model call and a few milliseconds even on
+long research.
+"""
+
+import math
+import re
+from collections import Counter
+from typing import Any, Dict, List, Tuple
+
+from agent.cache import normalize_text
+from agent.compaction import estimate_tokens
+from agent.knowledge import query_terms, split_passages
+
+# A markdown citation link or citation token, left out of the ranked text
+_CITATION = re.compile(r"\[[^\[\]]*\]\([^)]*\)|\[S[0-9]+\]")
+
+# BM25 term frequency saturation and length normalization
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Length of the text previews of the dropped passages
+PREVIEW_CHARS = 120
+
+
+def bm25_scores(terms: List[str], documents: List[List[str]]) -> List[float]:
+    """Score tokenized documents against query terms with Okapi BM25."""
+    if not documents:
+        return []
+    average_length = sum(map(len, documents)) / len(documents) or 1.0
+    frequencies = [Counter(document) for document in documents]
+    scores = [0.0] * len(documents)
+    for term in terms:
+        matching = sum(term in frequency for frequency in frequencies)
+        if not matching:
+            continue
+        idf = math.log((len(documents) - matching + 0.5) / (matching + 0.5) + 1.0)
+        for index, (document, frequency) in enumerate(zip(documents, frequencies)):
+            count = frequency[term]
+            if count:
+                scores[index] += (
+                    idf
+                    * count
+                    * (BM25_K1 + 1)
+                    / (
+                        count
+                        + BM25_K1
+                        * (1 - BM25_B + BM25_B * len(document) / average_length)
+                    )
+                )
+    return scores
+
+
+def prune_summaries(
+    summaries: List[str], topic: str, token_budget: int
+) -> Tuple[List[str], List[Dict[str, Any]]]:
+    """Keep the passages of the summaries most relevant to the topic within a token budget.
+
+    Summaries that fit the budget are returned unchanged. A budget < 1 disables pruning.
+
+    Returns:
+        The pruned summaries (summaries left without passages are omitted) and a record
+        of every dropped passage: the index of its `summary` and of the `passage` in it,
+        its BM25 `score`, estimated `tokens` and a `preview` of its text.
+    """
+    if token_budget < 1 or estimate_tokens("".join(summaries)) <= token_budget:
+        return summaries, []
+    passages = [
+        (summary_index, passage_index, passage)
+        for summary_index, summary in enumerate(summaries)
+        for passage_index, passage in enumerate(split_passages(summary))
+    ]
+    scores = bm25_scores(
+        query_terms(topic),
+        [
+            normalize_text(_CITATION.sub("", passage)).split()
+            for *_, passage in passages
+        ],
+    )
+    tokens = [estimate_tokens(passage) for *_, passage in passages]
+
+    # Best passages first, the earlier one on ties; the best is kept even if too long
+    kept = set()
+    used = 0
+    for index in sorted(range(len(passages)), key=lambda index: -scores[index]):
+        if not kept or used + tokens[index] <= token_budget:
+            kept.add(index)
+            used += tokens[index]
+
+    pruned: List[List[str]] = [[] for _ in summaries]
+    dropped = []
+    for index, (summary_index, passage_index, passage) in enumerate(passages):
+        if index in kept:
+            pruned[summary_index].append(passage)
+            continue
+        dropped.append(
+            {
+                "summary": summary_index,
+                "passage": passage_index,
+                "score": round(scores[index], 3),
+                "tokens": tokens[index],
+                "preview": passage[:PREVIEW_CHARS],
+            }
+        )
+    return ["\n\n".join(summary) for summary in pruned if summary], dropped
@@ -0,0 +1,222 @@
+"""Quorum-based waves of web research branches, for tail-latency control.
+
+LangGraph only runs `reflection` once every `web_research` branch of a wave (the
+branches fanned out together) has returned. To keep one slow search from setting
+the latency of the whole loop, the branches of a wave share a `Wave`: once a quorum
+of them has returned or the wave deadline has passed, the branches still searching
+give up and return as stragglers, so reflection starts right away. Each search can
+also be bounded by a per-branch timeout and hedged by a duplicate request when the
+first one is slow.
+"""
+
+import asyncio
+import concurrent.futures
+import contextvars
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Dict, Iterator
+
+from langchain_core.runnables import RunnableConfig
+
+from agent.concurrency import get_run_key
+
+# How often waiting branches check whether the wave was cut
+_POLL_SECONDS = 0.02
+
+
+class Wave:
+    """The branches of one research wave, with their quorum and deadline."""
+
+    def __init__(self, key: tuple, size: int, quorum: float, deadline_s: float) -> None:
+        """Start a wave of `size` branches, `quorum` of which have to return by the deadline."""
+        self.key = key
+        self.size = size
+        self.required = min(size, max(1, math.ceil(quorum * size)))
+        self.deadline = time.monotonic() + deadline_s if deadline_s > 0 else math.inf
+        self.returned = 0
+        self.left = 0
+        self._lock = threading.Lock()
+
+    def finish(self) -> None:
+        """Count a branch that returned its result."""
+        with self._lock:
+            self.returned += 1
+
+    def leave(self) -> None:
+        """Count a branch that is done, forgetting the wave once all of them are."""
+        with self._lock:
+            self.left += 1
+            if self.left < self.size:
+                return
+        with _waves_lock:
+            if _waves.get(self.key) is self:
+                del _waves[self.key]
+
+    def is_cut(self) -> bool:
+        """Check whether the remaining branches should stop waiting for their search."""
+        return self.returned >= self.required or time.monotonic() >= self.deadline
+
+
+# Waves live until all of their branches are done
+_waves: Dict[tuple, Wave] = {}
+_waves_lock = threading.Lock()
+
+
+@contextmanager
+def join_wave(
+    config: RunnableConfig, wave: int, size: int, configurable
+) -> Iterator[Wave]:
+    """Join the wave shared by the branches fanned out together in a research run."""
+    key = (get_run_key(config), wave)
+    with _waves_lock:
+        joined = _waves.get(key)
+        if joined is None:
+            joined = _waves[key] = Wave(
+                key,
+                size,
+                configurable.wave_quorum,
+                configurable.wave_deadline_ms / 1000,
+            )
+    try:
+        yield joined
+    finally:
+        joined.leave()
+
+
+def forget_waves(config: RunnableConfig) -> None:
+    """Forget the waves of a research run once its branches have all returned.
+
+    A wave is usually forgotten by its last branch, but when a run is resumed from a
+    checkpoint, the branches that had already returned don't join the wave again.
+    """
+    run_key = get_run_key(config)
+    with _waves_lock:
+        for key in [key for key in _waves if key[0] == run_key]:
+            del _waves[key]
+
+
+def quorum_enabled(configurable) -> bool:
+    """Check whether any of the tail-latency controls is configured."""
+    return (
+        configurable.wave_quorum < 1
+        or configurable.wave_deadline_ms > 0
+        or configurable.branch_timeout_ms > 0
+        or configurable.hedge_after_ms > 0
+    )
+
+
+class BranchOutcome:
+    """The result of a branch search, or None if the branch straggled."""
+
+    def __init__(self, result: Any = None, hedged: bool = False) -> None:
+        """Record the result of a branch and whether it was hedged."""
+        self.result = result
+        self.hedged = hedged
+
+    @property
+    def straggled(self) -> bool:
+        """Whether the branch gave up its search."""
+        return self.result is None
+
+
+def _limits(configurable):
+    started = time.monotonic()
+    timeout = configurable.branch_timeout_ms / 1000
+    hedge = configurable.hedge_after_ms / 1000
+    return (
+        started + timeout if timeout > 0 else math.inf,
+        started + hedge if hedge > 0 else math.inf,
+    )
+
+
+def _start_search(
+    context: contextvars.Context, search: Callable[[], Any]
+) -> concurrent.futures.Future:
+    """Run a sync search in a thread of its own.
+
+    Stragglers are abandoned, not interrupted: a shared pool of threads would queue new
+    searches behind them, and the branch timeout would cut searches that never started.
+    """
+    future: concurrent.futures.Future = concurrent.futures.Future()
+
+    def run() -> None:
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(context.run(search))
+        except BaseException as error:
+            future.set_exception(error)
+
+    threading.Thread(target=run, name="web-research", daemon=True).start()
+    return future
+
+
+def run_branch(wave: Wave, search: Callable[[], Any], configurable) -> BranchOutcome:
+    """Run the search of a branch unless the wave is cut or the branch times out first.
+
+    A straggling search keeps running in its thread, but its response is discarded.
+    """
+    timeout_at, hedge_at = _limits(configurable)
+    context = contextvars.copy_context()
+    attempts = [_start_search(context.copy(), search)]
+    while True:
+        for attempt in attempts:
+            if attempt.done() and attempt.exception() is None:
+                wave.finish()
+                return BranchOutcome(attempt.result(), hedged=len(attempts) > 1)
+        if all(attempt.done() for attempt in attempts):
+            raise attempts[0].exception()
+        now = time.monotonic()
+        if wave.is_cut() or now >= timeout_at:
+            return BranchOutcome()
+        if len(attempts) == 1 and now >= hedge_at:
+            attempts.append(_start_search(context.copy(), search))
+        concurrent.futures.wait(
+            attempts,
+            timeout=_POLL_SECONDS,
+            return_when=concurrent.futures.FIRST_COMPLETED,
+        )
+
+
+async def arun_branch(
+    wave: Wave, search: Callable[[], Awaitable[Any]], configurable
+) -> BranchOutcome:
+    """Async version of `run_branch`, cancelling the searches of a straggler."""
+    timeout_at, hedge_at = _limits(configurable)
+    attempts = [asyncio.ensure_future(search())]
+    try:
+        while True:
+            for attempt in attempts:
+                if attempt.done() and attempt.exception() is None:
+                    wave.finish()
+                    return BranchOutcome(attempt.result(), hedged=len(attempts) > 1)
+            if all(attempt.done() for attempt in attempts):
+                raise attempts[0].exception()
+            now = time.monotonic()
+            if wave.is_cut() or now >= timeout_at:
+                return BranchOutcome()
+            if len(attempts) == 1 and now >= hedge_at:
+                attempts.append(asyncio.ensure_future(search()))
+            await asyncio.wait(
+                attempts, timeout=_POLL_SECONDS, return_when=asyncio.FIRST_COMPLETED
+            )
+    finally:
+        for attempt in attempts:
+            attempt.cancel()
+
+
+def straggler_queries(state) -> list:
+    """Get the queries deferred by the stragglers of the wave that just finished.
+
+    The wave of the follow-up queries is numbered by the research loop count, so the
+    wave that just finished is the one before it. Queries that straggle again are
+    deferred again by their new wave.
+    """
+    wave = state["research_loop_count"] - 1
+    pending = []
+    for deferred in state.get("deferred_queries", []):
+        if deferred["wave"] == wave and deferred["query"] not in pending:
+            pending.append(deferred["query"])
+    return pending
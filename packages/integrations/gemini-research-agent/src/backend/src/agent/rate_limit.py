@@ -0,0 +1,371 @@
+"""Rate limiting and adaptive concurrency for the Gemini calls of the graph.
+
+Every model and search call first takes a request and its estimated tokens from the
+per-model token buckets (requests and tokens per minute). The buckets live in memory,
+or in a SQLite file when several worker processes share one quota. On top of that,
+each model has an AIMD concurrency limit: it grows by one slot per window of
+successful calls and is halved whenever Gemini answers with a 429, so throughput stays
+near the quota instead of collapsing into retry storms.
+"""
+
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+from agent.compaction import estimate_tokens
+
+# (bucket key, amount, capacity, refill per second)
+BucketRequest = Tuple[str, float, float, float]
+
+# How long async waiters sleep between checks for a free concurrency slot
+_POLL_SECONDS = 0.02
+
+
+def is_rate_limit_error(error: BaseException) -> bool:
+    """Check whether an error of the genai or LangChain clients is a 429 / quota error."""
+    for attribute in ("code", "status_code"):
+        if getattr(error, attribute, None) == 429:
+            return True
+    message = str(error)
+    return "429" in message or "RESOURCE_EXHAUSTED" in message
+
+
+def _refill(tokens: float, updated_at: float, capacity: float, rate: float, now: float):
+    return min(capacity, tokens + (now - updated_at) * rate)
+
+
+class MemoryBuckets:
+    """Token buckets shared by the threads and event loops of one process."""
+
+    def __init__(self) -> None:
+        """Create an empty set of buckets; new buckets start full."""
+        self._lock = threading.Lock()
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+
+    def take(self, requests: List[BucketRequest], now: float) -> float:
+        """Take from all buckets at once, or from none.
+
+        Returns:
+            0 if the amounts were taken, otherwise the seconds to wait before retrying.
+        """
+        with self._lock:
+            levels = {}
+            wait = 0.0
+            for key, amount, capacity, rate in requests:
+                tokens, updated_at = self._buckets.get(key, (capacity, now))
+                level = _refill(tokens, updated_at, capacity, rate, now)
+                levels[key] = level
+                # A single call larger than the whole budget waits for a full bucket
+                needed = min(amount, capacity)
+                if level < needed:
+                    wait = max(wait, (needed - level) / rate)
+            if wait > 0:
+                return wait
+            for key, amount, capacity, rate in requests:
+                self._buckets[key] = (levels[key] - min(amount, capacity), now)
+            return 0.0
+
+    def adjust(self, request: BucketRequest, now: float) -> None:
+        """Debit (or credit, for negative amounts) a bucket after the fact."""
+        key, amount, capacity, rate = request
+        with self._lock:
+            tokens, updated_at = self._buckets.get(key, (capacity, now))
+            level = _refill(tokens, updated_at, capacity, rate, now)
+            self._buckets[key] = (max(-capacity, level - amount), now)
+
+
+class SqliteBuckets:
+    """Token buckets stored in a SQLite file, shared by all worker processes using it."""
+
+    def __init__(self, path: str) -> None:
+        """Open (and create, if needed) the bucket database at `path`."""
+        self.path = path
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)"
+            )
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def _levels(self, conn, requests: List[BucketRequest], now: float):
+        levels = {}
+        for key, _, capacity, rate in requests:
+            row = conn.execute(
+                "SELECT tokens, updated_at FROM buckets WHERE key = ?", (key,)
+            ).fetchone()
+            tokens, updated_at = row if row else (capacity, now)
+            levels[key] = _refill(tokens, updated_at, capacity, rate, now)
+        return levels
+
+    def take(self, requests: List[BucketRequest], now: float) -> float:
+        """Take from all buckets at once, or from none, in one write transaction.
+
+        Returns:
+            0 if the amounts were taken, otherwise the seconds to wait before retrying.
+        """
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            levels = self._levels(conn, requests, now)
+            wait = 0.0
+            for key, amount, capacity, rate in requests:
+                needed = min(amount, capacity)
+                if levels[key] < needed:
+                    wait = max(wait, (needed - levels[key]) / rate)
+            if wait == 0:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO buckets (key, tokens, updated_at) VALUES (?, ?, ?)",
+                    [
+                        (key, levels[key] - min(amount, capacity), now)
+                        for key, amount, capacity, _ in requests
+                    ],
+                )
+            conn.execute("COMMIT")
+            return wait
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def adjust(self, request: BucketRequest, now: float) -> None:
+        """Debit (or credit, for negative amounts) a bucket after the fact."""
+        key, amount, capacity, _ = request
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            level = self._levels(conn, [request], now)[key]
+            conn.execute(
+                "INSERT OR REPLACE INTO buckets (key, tokens, updated_at) VALUES (?, ?, ?)",
+                (key, max(-capacity, level - amount), now),
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+
+class AdaptiveConcurrency:
+    """AIMD concurrency limit of the calls to one model.
+
+    The limit grows by 1/limit per successful call (about one slot per window of calls),
+    shrinks by 10% when a call is slower than the latency target and is halved on a 429.
+    """
+
+    def __init__(self, initial: int, maximum: int, latency_target_s: float) -> None:
+        """Start at `initial` concurrent calls, never exceeding `maximum`."""
+        self.maximum = max(1, maximum)
+        self.limit = float(min(max(1, initial), self.maximum))
+        self.latency_target_s = latency_target_s
+        self.in_flight = 0
+        self.throttled = 0
+        self._condition = threading.Condition()
+
+    def _try_acquire(self) -> bool:
+        if self.in_flight < int(self.limit):
+            self.in_flight += 1
+            return True
+        return False
+
+    def acquire(self) -> None:
+        """Block until a slot is free."""
+        with self._condition:
+            while not self._try_acquire():
+                self._condition.wait()
+
+    async def aacquire(self) -> None:
+        """Wait on the event loop until a slot is free."""
+        while True:
+            with self._condition:
+                if self._try_acquire():
+                    return
+            await asyncio.sleep(_POLL_SECONDS)
+
+    def release(self, latency_s: float, throttled: bool) -> None:
+        """Free a slot and adapt the limit to the outcome of the call."""
+        with self._condition:
+            self.in_flight -= 1
+            if throttled:
+                self.throttled += 1
+                self.limit = max(1.0, self.limit / 2)
+            elif self.latency_target_s and latency_s > self.latency_target_s:
+                self.limit = max(1.0, self.limit * 0.9)
+            else:
+                self.limit = min(float(self.maximum), self.limit + 1 / self.limit)
+            self._condition.notify_all()
+
+
+class RateLimitSlot:
+    """A granted call; reports the actual token usage back to the limiter."""
+
+    def __init__(
+        self, limiter: "RateLimiter", token_request: Optional[BucketRequest]
+    ) -> None:
+        """Hold a call of `limiter`, with the tokens it reserved in `token_request`."""
+        self._limiter = limiter
+        self._token_request = token_request
+
+    def record(self, result: Any) -> Any:
+        """Debit the difference between the actual and the estimated tokens of a call result.
+
+        Results without reported usage, such as structured outputs, are debited an
+        estimate of their output tokens on top of the prompt tokens reserved up front.
+        """
+        if self._token_request is None:
+            return result
+        key, estimated, capacity, rate = self._token_request
+        used = usage_tokens(result)
+        amount = used - estimated if used is not None else output_tokens(result)
+        self._limiter.buckets.adjust((key, amount, capacity, rate), time.time())
+        return result
+
+
+def usage_tokens(result: Any) -> Optional[int]:
+    """Get the total tokens of a LangChain message or genai response, if reported."""
+    usage = getattr(result, "usage_metadata", None)
+    if isinstance(usage, dict):
+        return usage.get("total_tokens")
+    return getattr(usage, "total_token_count", None)
+
+
+def output_tokens(result: Any) -> int:
+    """Estimate the output tokens of a call result, e.g. of a pydantic structured output."""
+    dump = getattr(result, "model_dump_json", None)
+    return estimate_tokens(dump() if dump is not None else str(result))
+
+
+class RateLimiter:
+    """Per-model rate limits (requests and tokens per minute) and AIMD concurrency."""
+
+    def __init__(self, buckets) -> None:
+        """Create a limiter keeping its rate limits in `buckets`."""
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._concurrency: Dict[str, AdaptiveConcurrency] = {}
+
+    def concurrency(self, model: str, configurable) -> Optional[AdaptiveConcurrency]:
+        """Get the adaptive concurrency limit of a model, None if it is disabled."""
+        if configurable.adaptive_concurrency_max < 1:
+            return None
+        with self._lock:
+            if model not in self._concurrency:
+                maximum = configurable.adaptive_concurrency_max
+                self._concurrency[model] = AdaptiveConcurrency(
+                    initial=max(1, maximum // 4),
+                    maximum=maximum,
+                    latency_target_s=configurable.adaptive_latency_target_ms / 1000,
+                )
+            return self._concurrency[model]
+
+    def _bucket_requests(
+        self, model: str, tokens: int, configurable
+    ) -> Tuple[List[BucketRequest], Optional[BucketRequest]]:
+        limits = configurable.rate_limits.get(model, {})
+        requests = []
+        token_request = None
+        if limits.get("rpm"):
+            requests.append((f"{model}:requests", 1, limits["rpm"], limits["rpm"] / 60))
+        if limits.get("tpm"):
+            token_request = (
+                f"{model}:tokens",
+                tokens,
+                limits["tpm"],
+                limits["tpm"] / 60,
+            )
+            requests.append(token_request)
+        return requests, token_request
+
+    @contextmanager
+    def limit(self, model: str, prompt: str, configurable) -> Iterator[RateLimitSlot]:
+        """Hold a rate limited slot for a call to `model` with the given prompt."""
+        requests, token_request = self._bucket_requests(
+            model, estimate_tokens(str(prompt)), configurable
+        )
+        while requests and (wait := self.buckets.take(requests, time.time())) > 0:
+            time.sleep(wait)
+        concurrency = self.concurrency(model, configurable)
+        if concurrency is not None:
+            concurrency.acquire()
+        start = time.perf_counter()
+        throttled = False
+        try:
+            yield RateLimitSlot(self, token_request)
+        except Exception as error:
+            throttled = is_rate_limit_error(error)
+            raise
+        finally:
+            if concurrency is not None:
+                concurrency.release(time.perf_counter() - start, throttled)
+
+    @asynccontextmanager
+    async def alimit(
+        self, model: str, prompt: str, configurable
+    ) -> AsyncIterator[RateLimitSlot]:
+        """Async version of `limit`."""
+        requests, token_request = self._bucket_requests(
+            model, estimate_tokens(str(prompt)), configurable
+        )
+        while requests:
+            wait = await asyncio.to_thread(self.buckets.take, requests, time.time())
+            if wait <= 0:
+                break
+            await asyncio.sleep(wait)
+        concurrency = self.concurrency(model, configurable)
+        if concurrency is not None:
+            await concurrency.aacquire()
+        start = time.perf_counter()
+        throttled = False
+        try:
+            yield RateLimitSlot(self, token_request)
+        except Exception as error:
+            throttled = is_rate_limit_error(error)
+            raise
+        finally:
+            if concurrency is not None:
+                concurrency.release(time.perf_counter() - start, throttled)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Report the current concurrency limit, in-flight calls and 429s per model."""
+        with self._lock:
+            return {
+                model: {
+                    "limit": concurrency.limit,
+                    "in_flight": concurrency.in_flight,
+                    "throttled": concurrency.throttled,
+                }
+                for model, concurrency in self._concurrency.items()
+            }
+
+
+_limiters: Dict[str, RateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(path: str = "") -> RateLimiter:
+    """Get the process-wide rate limiter, backed by the SQLite file at `path` if given."""
+    with _limiters_lock:
+        if path not in _limiters:
+            _limiters[path] = RateLimiter(
+                SqliteBuckets(path) if path else MemoryBuckets()
+            )
+        return _limiters[path]
+
+
+def parse_rate_limits(value: Any) -> Dict[str, Dict[str, int]]:
+    """Parse per-model rate limits given as a dict or as a JSON string (e.g. from the environment)."""
+    if isinstance(value, str):
+        return json.loads(value) if value.strip() else {}
+    return value or {}
@@ -0,0 +1,147 @@
+"""Compact, deduplicated registry of the sources gathered by a research run.
+
+Every web research branch cites the grounding chunks of its response through short
+urls (`SHORT_URL_PREFIX` + "<branch id>-<chunk index>", see `agent.utils.resolve_urls`).
+Instead of a segment dict per citation, a branch reports a registry fragment:
+
+    {"urls": [url, ...], "labels": [label, ...], "refs": {"<branch>-<chunk>": source id}}
+
+where a source id is the index of its url in `urls`. The `merge_source_registries`
+reducer interns the urls of each fragment into the registry of the run, so every url
+is stored once with a small integer id no matter how many branches and loops cite it,
+and the short urls of the branches resolve to those ids.
+
+With `citation_tokens`, the markdown short url links of the summaries shown to the
+models are replaced by the citation token of their source id (`[S12]`, a couple of
+tokens instead of ~20), and the answer cites the tokens; `citation_expander` turns
+both short urls and tokens of the final output back into links.
+"""
+
+import re
+from typing import Any, Dict, Iterable, List, Optional
+
+from agent.utils import SHORT_URL_PREFIX, ShortUrlExpander
+
+# A markdown link to a short url, as inserted by `agent.utils.insert_citation_markers`
+_SHORT_URL_LINK = re.compile(
+    r"\[[^\[\]]*\]\(" + re.escape(SHORT_URL_PREFIX) + r"([0-9]+-[0-9]+)\)"
+)
+
+
+def empty_registry() -> Dict[str, Any]:
+    """Create a source registry without sources."""
+    return {"urls": [], "labels": [], "refs": {}}
+
+
+def merge_source_registries(
+    left: Optional[Dict[str, Any]], right: Optional[Dict[str, Any]]
+) -> Dict[str, Any]:
+    """Reducer that interns the sources of `right` into the registry `left`.
+
+    Sources of `right` whose url is already registered reuse its id, the others are
+    appended; the refs of `right` are renumbered accordingly.
+    """
+    if not right or not right.get("urls"):
+        return left or empty_registry()
+    if not left or not left.get("urls"):
+        return right
+    urls = list(left["urls"])
+    labels = list(left["labels"])
+    ids = {url: source_id for source_id, url in enumerate(urls)}
+    renumbered = []
+    for url, label in zip(right["urls"], right["labels"]):
+        if url not in ids:
+            ids[url] = len(urls)
+            urls.append(url)
+            labels.append(label)
+        renumbered.append(ids[url])
+    refs = dict(left["refs"])
+    for ref, source_id in right["refs"].items():
+        refs[ref] = renumbered[source_id]
+    return {"urls": urls, "labels": labels, "refs": refs}
+
+
+def register_sources(segments: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    """Build the registry fragment of citation segments (`label`, `short_url`, `value`)."""
+    registry = empty_registry()
+    ids = {}
+    for segment in segments:
+        if not segment.get("short_url"):
+            continue
+        url = segment["value"]
+        if url not in ids:
+            ids[url] = len(registry["urls"])
+            registry["urls"].append(url)
+            registry["labels"].append(segment["label"])
+        registry["refs"][segment["short_url"][len(SHORT_URL_PREFIX) :]] = ids[url]
+    return registry
+
+
+def renumber_refs(
+    registry: Dict[str, Any], old_prefix: str, new_prefix: str
+) -> Dict[str, Any]:
+    """Move the refs of a registry fragment from one branch id prefix to another."""
+    refs = {}
+    for ref, source_id in registry["refs"].items():
+        if ref.startswith(old_prefix):
+            ref = new_prefix + ref[len(old_prefix) :]
+        refs[ref] = source_id
+    return {**registry, "refs": refs}
+
+
+def registry_sources(registry: Optional[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Get the source dicts (`label`, `short_url`, `value`) of every short url of a registry."""
+    if not registry:
+        return []
+    return [
+        {
+            "label": registry["labels"][source_id],
+            "short_url": f"{SHORT_URL_PREFIX}{ref}",
+            "value": registry["urls"][source_id],
+        }
+        for ref, source_id in registry["refs"].items()
+    ]
+
+
+def citation_token(source_id: int) -> str:
+    """Get the citation token of a source id."""
+    return f"[S{source_id}]"
+
+
+def tokenize_citations(text: str, registry: Optional[Dict[str, Any]]) -> str:
+    """Replace the short url links of a text with the citation tokens of their sources.
+
+    Links to short urls missing from the registry are kept.
+    """
+    refs = (registry or {}).get("refs") or {}
+
+    def replace(match: re.Match) -> str:
+        source_id = refs.get(match.group(1))
+        return match.group() if source_id is None else citation_token(source_id)
+
+    return _SHORT_URL_LINK.sub(replace, text)
+
+
+def citation_expander(registry: Optional[Dict[str, Any]]) -> ShortUrlExpander:
+    """Build the expander of the short urls and citation tokens of the final output.
+
+    Short urls are replaced by their original url, citation tokens by a markdown link.
+    """
+    sources = registry_sources(registry)
+    expansions = {}
+    for source_id, (url, label) in enumerate(
+        zip((registry or {}).get("urls", []), (registry or {}).get("labels", []))
+    ):
+        token = citation_token(source_id)
+        sources.append({"label": label, "short_url": token, "value": url})
+        expansions[token] = f"[{label}]({url})"
+    return ShortUrlExpander(sources, expansions)
+
+
+def cited_sources(answer: str, sources: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Get the unique sources whose url appears in the answer, in order of first appearance."""
+    unique = {}
+    for source in sources:
+        if source["value"] in answer and source["value"] not in unique:
+            unique[source["value"]] = source
+    return sorted(unique.values(), key=lambda source: answer.index(source["value"]))
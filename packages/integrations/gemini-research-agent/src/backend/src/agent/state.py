@@ -9,16 +9,42 @@ from typing_extensions import Annotated
 
 import operator
 
+from agent.sources import merge_source_registries
+
+
+def merge_counters(left: dict | None, right: dict | None) -> dict:
+    """Reducer that sums the counters reported by parallel branches."""
+    merged = dict(left or {})
+    for key, value in (right or {}).items():
+        merged[key] = merged.get(key, 0) + value
+    return merged
+
 
 class OverallState(TypedDict):
     messages: Annotated[list, add_messages]
     search_query: Annotated[list, operator.add]
     web_research_result: Annotated[list, operator.add]
     sources_gathered: Annotated[list, operator.add]
+    source_registry: Annotated[dict, merge_source_registries]
     initial_search_query_count: int
     max_research_loops: int
     research_loop_count: int
     reasoning_model: str
+    search_cache_stats: Annotated[dict, merge_counters]
+    running_summary: str
+    compacted_result_count: int
+    telemetry: Annotated[list, operator.add]
+    deferred_queries: Annotated[list, operator.add]
+    wave_stats: Annotated[dict, merge_counters]
+    deadline_at: float
+    budget_decisions: Annotated[list, operator.add]
+    cascade_stats: Annotated[dict, merge_counters]
+    cascade_settled: bool
+    answer_cached: bool
+    run_context: dict
+    next_query_id: Annotated[int, operator.add]
+    retrieval_sources: Annotated[list, operator.add]
+    pruned_passages: list
 
 
 class ReflectionState(TypedDict):
@@ -27,6 +53,14 @@ class ReflectionState(TypedDict):
     follow_up_queries: Annotated[list, operator.add]
     research_loop_count: int
     number_of_ran_queries: int
+    deadline_reached: bool
+
+
+class ResearchLoopState(OverallState, ReflectionState):
+    """The state `evaluate_research` reads: the overall state and the reflection verdict.
+
+    LangGraph only passes a routing function the keys of the schema it is annotated with.
+    """
 
 
 class Query(TypedDict):
@@ -36,11 +70,16 @@ class Query(TypedDict):
 
 class QueryGenerationState(TypedDict):
     search_query: list[Query]
+    run_context: dict
+    next_query_id: Annotated[int, operator.add]
 
 
 class WebSearchState(TypedDict):
     search_query: str
     id: str
+    wave: int
+    wave_size: int
+    run_context: dict
 
 
 @dataclass(kw_only=True)
@@ -0,0 +1,505 @@
+"""Latency and token usage telemetry of the research graph.
+
+Every node execution collects its wall time, the time its Gemini calls spent queued
+behind the concurrency and rate limits, the tokens those calls used, the grounding
+chunks of the search responses and the retries of the genai client. The records are
+returned in the `telemetry` state key (the per-run breakdown) and aggregated into
+process-wide histograms and counters, served in the Prometheus text format. The
+recent wall times per node and model also feed the latency budgets of `agent.budget`.
+"""
+
+import bisect
+import contextvars
+import functools
+import inspect
+import logging
+import math
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.messages import AIMessage
+from langchain_core.tracers.context import register_configure_hook
+
+NODES = (
+    "answer_cache",
+    "generate_query",
+    "web_research",
+    "reflection",
+    "finalize_answer",
+)
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+CHUNK_BUCKETS = (0, 1, 2, 5, 10, 20, 50)
+
+# Number of recent executions the latency quantiles are computed from
+LATENCY_WINDOW = 200
+
+
+class Histogram:
+    """A Prometheus histogram with one series per label value."""
+
+    def __init__(self, name: str, help_text: str, label: str, buckets: Sequence[float]):
+        """Create an empty histogram with the upper bounds `buckets`."""
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self.buckets = tuple(buckets)
+        self._series: Dict[str, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, label_value: str, value: float) -> None:
+        """Count a value in the series of `label_value`."""
+        counts, total = self._series.setdefault(
+            label_value, ([0] * (len(self.buckets) + 1), [0.0])
+        )
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        total[0] += value
+
+    def render(self) -> List[str]:
+        """Render the histogram in the Prometheus text format."""
+        lines = [
+            f"# HELP {self.name} {self.help_text}",
+            f"# TYPE {self.name} histogram",
+        ]
+        for label_value, (counts, total) in sorted(self._series.items()):
+            labels = f'{self.label}="{label_value}"'
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += count
+                lines.append(
+                    f'{self.name}_bucket{{{labels},le="{bound}"}} {cumulative}'
+                )
+            lines.append(f"{self.name}_sum{{{labels}}} {total[0]}")
+            lines.append(f"{self.name}_count{{{labels}}} {cumulative}")
+        return lines
+
+
+class Counter:
+    """A Prometheus counter with one series per combination of label values."""
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str]):
+        """Create an empty counter with the label names `labels`."""
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self._series: Dict[Tuple[str, ...], float] = defaultdict(float)
+
+    def inc(self, label_values: Tuple[str, ...], amount: float = 1) -> None:
+        """Add `amount` to the series of `label_values`."""
+        self._series[label_values] += amount
+
+    def render(self) -> List[str]:
+        """Render the counter in the Prometheus text format."""
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for label_values, value in sorted(self._series.items()):
+            labels = ",".join(
+                f'{label}="{value}"' for label, value in zip(self.labels, label_values)
+            )
+            lines.append(f"{self.name}{{{labels}}} {value}")
+        return lines
+
+
+class LatencyStats:
+    """Wall times of the recent successful executions per node, and per node and model."""
+
+    def __init__(self, window: int = LATENCY_WINDOW) -> None:
+        """Keep the last `window` wall times of every node and node and model."""
+        self.window = window
+        self._lock = threading.Lock()
+        self._samples: Dict[Tuple[str, Optional[str]], deque] = {}
+
+    def observe(self, node: str, model: Optional[str], seconds: float) -> None:
+        """Record the wall time of a successful execution of `node` with `model`."""
+        with self._lock:
+            for key in {(node, None), (node, model)}:
+                samples = self._samples.get(key)
+                if samples is None:
+                    samples = self._samples[key] = deque(maxlen=self.window)
+                samples.append(seconds)
+
+    def quantile(
+        self, node: str, model: Optional[str], q: float
+    ) -> Tuple[Optional[float], int]:
+        """Get the `q` quantile of the recent wall times of a node (with a model), in seconds.
+
+        Returns:
+            The quantile (None without samples) and the number of samples it is based on.
+        """
+        with self._lock:
+            samples = sorted(self._samples.get((node, model), ()))
+        if not samples:
+            return None, 0
+        index = min(len(samples) - 1, max(0, math.ceil(q * len(samples)) - 1))
+        return samples[index], len(samples)
+
+
+class MetricsRegistry:
+    """Process-wide aggregates of the node telemetry records."""
+
+    def __init__(self) -> None:
+        """Create the histograms and counters with no recorded executions."""
+        self._lock = threading.Lock()
+        self.node_seconds = Histogram(
+            "research_node_duration_seconds",
+            "Wall time of graph node executions.",
+            "node",
+            LATENCY_BUCKETS,
+        )
+        self.queue_seconds = Histogram(
+            "research_node_queue_seconds",
+            "Time the Gemini calls of a node waited for concurrency and rate limit slots.",
+            "node",
+            LATENCY_BUCKETS,
+        )
+        self.grounding_chunks = Histogram(
+            "research_grounding_chunks",
+            "Search grounding chunks per web research branch.",
+            "node",
+            CHUNK_BUCKETS,
+        )
+        self.executions = Counter(
+            "research_node_executions_total",
+            "Graph node executions.",
+            ("node", "status"),
+        )
+        self.tokens = Counter(
+            "research_node_tokens_total",
+            "Gemini tokens used by graph nodes.",
+            ("node", "direction"),
+        )
+        self.retries = Counter(
+            "research_node_retries_total",
+            "Retried Gemini requests of graph nodes.",
+            ("node",),
+        )
+        self.latencies = LatencyStats()
+        # Latencies of the single model calls of the nodes, without their queueing
+        self.call_latencies = LatencyStats()
+
+    def observe(self, record: Dict[str, Any], status: str = "ok") -> None:
+        """Add a node telemetry record to the aggregates."""
+        node = record["node"]
+        with self._lock:
+            self.node_seconds.observe(node, record["wall_ms"] / 1000)
+            self.queue_seconds.observe(node, record["queue_ms"] / 1000)
+            if record.get("grounding_chunks") is not None:
+                self.grounding_chunks.observe(node, record["grounding_chunks"])
+            self.executions.inc((node, status))
+            self.tokens.inc((node, "input"), record["input_tokens"])
+            self.tokens.inc((node, "output"), record["output_tokens"])
+            self.retries.inc((node,), record["retries"])
+        if status == "ok":
+            self.latencies.observe(node, record.get("model"), record["wall_ms"] / 1000)
+
+    def render(self) -> str:
+        """Render all metrics in the Prometheus text exposition format."""
+        with self._lock:
+            metrics = (
+                self.node_seconds,
+                self.queue_seconds,
+                self.grounding_chunks,
+                self.executions,
+                self.tokens,
+                self.retries,
+            )
+            return (
+                "\n".join(line for metric in metrics for line in metric.render()) + "\n"
+            )
+
+
+metrics = MetricsRegistry()
+
+
+class NodeMetrics(BaseCallbackHandler):
+    """Telemetry of one node execution, also collecting the token usage of its chat models."""
+
+    def __init__(self, node: str, branch: Optional[int] = None) -> None:
+        """Start the telemetry of an execution of `node` (in web research `branch`)."""
+        self.node = node
+        self.branch = branch
+        self.model: Optional[str] = None
+        self.calls = 0
+        self.queue_s = 0.0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.grounding_chunks: Optional[int] = None
+        self.retries = 0
+        self.citation_tokens_saved = 0
+        self.annotations: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def on_llm_end(self, response, **kwargs) -> None:
+        """Count the token usage reported by a chat model call."""
+        for generations in response.generations:
+            for generation in generations:
+                message = getattr(generation, "message", None)
+                if isinstance(message, AIMessage) and message.usage_metadata:
+                    self.add_tokens(
+                        message.usage_metadata.get("input_tokens", 0),
+                        message.usage_metadata.get("output_tokens", 0),
+                    )
+
+    def add_tokens(self, input_tokens: int, output_tokens: int) -> None:
+        """Count the tokens of a call."""
+        with self._lock:
+            self.input_tokens += input_tokens or 0
+            self.output_tokens += output_tokens or 0
+
+    def add_call(self, queue_s: float, model: Optional[str] = None) -> None:
+        """Count a Gemini call and the time it waited for its slot.
+
+        The model of the first call is recorded as the model of the node execution.
+        """
+        with self._lock:
+            self.model = self.model or model
+            self.calls += 1
+            self.queue_s += queue_s
+
+    def set_model(self, model: str) -> None:
+        """Record `model` as the model of the node execution, e.g. the escalation model of a cascade."""
+        with self._lock:
+            self.model = model
+
+    def observe_call(self, model: str, seconds: float) -> None:
+        """Record the latency of a successful call of the node to `model`."""
+        metrics.call_latencies.observe(self.node, model, seconds)
+
+    def add_saved_tokens(self, tokens: int) -> None:
+        """Count the prompt tokens saved by citation tokens, see `agent.sources`."""
+        with self._lock:
+            self.citation_tokens_saved += tokens
+
+    def annotate(self, **fields: Any) -> None:
+        """Add fields, such as the outcome of the node, to its record."""
+        with self._lock:
+            self.annotations.update(fields)
+
+    def add_retry(self) -> None:
+        """Count a retried request."""
+        with self._lock:
+            self.retries += 1
+
+    def record(self, wall_s: float) -> Dict[str, Any]:
+        """Build the telemetry record of the node execution."""
+        record = {
+            "node": self.node,
+            "wall_ms": 1000 * wall_s,
+            "queue_ms": 1000 * self.queue_s,
+            "calls": self.calls,
+            "input_tokens": self.input_tokens,
+            "output_tokens": self.output_tokens,
+            "retries": self.retries,
+        }
+        if self.branch is not None:
+            record["branch"] = self.branch
+        if self.model is not None:
+            record["model"] = self.model
+        if self.grounding_chunks is not None:
+            record["grounding_chunks"] = self.grounding_chunks
+        if self.citation_tokens_saved:
+            record["citation_tokens_saved"] = self.citation_tokens_saved
+        record.update(self.annotations)
+        return record
+
+
+# The metrics of the node execution running in the current context. LangChain adds
+# it as a callback handler to every chat model call made in that context.
+_current_metrics: contextvars.ContextVar[Optional[NodeMetrics]] = (
+    contextvars.ContextVar("research_node_metrics", default=None)
+)
+register_configure_hook(_current_metrics, inheritable=True)
+
+
+def current_metrics() -> Optional[NodeMetrics]:
+    """Get the metrics of the node execution running in the current context, if any."""
+    return _current_metrics.get()
+
+
+def record_genai_usage(response: Any) -> None:
+    """Count the tokens and grounding chunks of a google genai response."""
+    node_metrics = current_metrics()
+    if node_metrics is None:
+        return
+    usage = getattr(response, "usage_metadata", None)
+    if usage is not None:
+        node_metrics.add_tokens(
+            usage.prompt_token_count or 0, usage.candidates_token_count or 0
+        )
+    candidates = getattr(response, "candidates", None) or []
+    grounding_metadata = candidates[0].grounding_metadata if candidates else None
+    node_metrics.grounding_chunks = len(
+        getattr(grounding_metadata, "grounding_chunks", None) or []
+    )
+
+
+class _RetryCounter(logging.Filter):
+    """Count the retries the google genai client logs before sleeping, per node.
+
+    Only the retries logged by the `google_genai._api_client` logger are counted; the
+    retries a LangChain chat model makes on its own (`max_retries`) aren't.
+    """
+
+    def __init__(self, level: int) -> None:
+        super().__init__()
+        # Records below the level the logger had before are counted, but not emitted
+        self.level = level
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        node_metrics = current_metrics()
+        if node_metrics is not None and str(record.msg).startswith("Retrying"):
+            node_metrics.add_retry()
+        return record.levelno >= self.level
+
+
+_retry_counter_lock = threading.Lock()
+_retry_counter_installed = False
+
+
+def _install_retry_counter() -> None:
+    """Install the retry counter on the genai client logger, on the first node execution."""
+    global _retry_counter_installed
+    with _retry_counter_lock:
+        if _retry_counter_installed:
+            return
+        logger = logging.getLogger("google_genai._api_client")
+        logger.addFilter(_RetryCounter(logger.getEffectiveLevel()))
+        logger.setLevel(min(logger.getEffectiveLevel(), logging.INFO))
+        _retry_counter_installed = True
+
+
+def instrument(node: str, func: Callable) -> Callable:
+    """Wrap a sync or async graph node to collect its telemetry.
+
+    The record of each execution is added to the process-wide metrics and returned
+    in the `telemetry` key of the node's state update.
+    """
+
+    def start(state) -> NodeMetrics:
+        if not _retry_counter_installed:
+            _install_retry_counter()
+        branch = state.get("id") if node == "web_research" else None
+        return NodeMetrics(node, branch)
+
+    def finish(node_metrics: NodeMetrics, started: float, update):
+        record = node_metrics.record(time.perf_counter() - started)
+        metrics.observe(record)
+        return {**update, "telemetry": [record]}
+
+    def fail(node_metrics: NodeMetrics, started: float) -> None:
+        metrics.observe(node_metrics.record(time.perf_counter() - started), "error")
+
+    if inspect.iscoroutinefunction(func):
+
+        @functools.wraps(func)
+        async def async_wrapper(state, config):
+            node_metrics = start(state)
+            token = _current_metrics.set(node_metrics)
+            started = time.perf_counter()
+            try:
+                update = await func(state, config)
+            except Exception:
+                fail(node_metrics, started)
+                raise
+            finally:
+                _current_metrics.reset(token)
+            return finish(node_metrics, started, update)
+
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(state, config):
+        node_metrics = start(state)
+        token = _current_metrics.set(node_metrics)
+        started = time.perf_counter()
+        try:
+            update = func(state, config)
+        except Exception:
+            fail(node_metrics, started)
+            raise
+        finally:
+            _current_metrics.reset(token)
+        return finish(node_metrics, started, update)
+
+    return wrapper
+
+
+def summarize_run(records: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """Sum the telemetry records of a run per node."""
+    summary: Dict[str, Dict[str, Any]] = {}
+    for record in records:
+        node = summary.setdefault(
+            record["node"],
+            {
+                "count": 0,
+                "wall_ms": 0.0,
+                "max_wall_ms": 0.0,
+                "queue_ms": 0.0,
+                "input_tokens": 0,
+                "output_tokens": 0,
+                "retries": 0,
+            },
+        )
+        node["count"] += 1
+        node["wall_ms"] += record["wall_ms"]
+        node["max_wall_ms"] = max(node["max_wall_ms"], record["wall_ms"])
+        node["queue_ms"] += record["queue_ms"]
+        node["input_tokens"] += record["input_tokens"]
+        node["output_tokens"] += record["output_tokens"]
+        node["retries"] += record["retries"]
+        if "citation_tokens_saved" in record:
+            node["citation_tokens_saved"] = (
+                node.get("citation_tokens_saved", 0) + record["citation_tokens_saved"]
+            )
+        if "grounding_chunks" in record:
+            node.setdefault("grounding_chunks", {})[record["branch"]] = record[
+                "grounding_chunks"
+            ]
+    return summary
+
+
+class NodeTimer(BaseCallbackHandler):
+    """Callback handler recording the wall time of every graph node execution."""
+
+    def __init__(self) -> None:
+        """Create a timer without recorded timings."""
+        self._lock = threading.Lock()
+        self._started: Dict[Any, tuple] = {}
+        self.timings: Dict[str, List[float]] = defaultdict(list)
+
+    def on_chain_start(
+        self, serialized, inputs, *, run_id, tags=None, metadata=None, **kwargs
+    ):
+        """Start timing the execution of a graph node."""
+        node = (metadata or {}).get("langgraph_node")
+        # Only time the graph task itself, not the runnables nested in the node
+        is_task = any(tag.startswith("graph:step:") for tag in tags or [])
+        if node in NODES and is_task and kwargs.get("name") == node:
+            with self._lock:
+                self._started[run_id] = (node, time.perf_counter())
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        """Record the wall time of a finished graph node execution."""
+        with self._lock:
+            started = self._started.pop(run_id, None)
+            if started is not None:
+                self.timings[started[0]].append(time.perf_counter() - started[1])
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        """Forget a failed graph node execution."""
+        with self._lock:
+            self._started.pop(run_id, None)
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """Summarize the recorded timings per node, in milliseconds."""
+        with self._lock:
+            return {
+                node: {
+                    "count": len(timings),
+                    "total_ms": 1000 * sum(timings),
+                    "max_ms": 1000 * max(timings),
+                }
+                for node, timings in self.timings.items()
+                if timings
+            }
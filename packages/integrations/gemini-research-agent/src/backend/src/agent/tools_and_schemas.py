@@ -21,3 +21,19 @@ class Reflection(BaseModel):
     follow_up_queries: List[str] = Field(
         description="A list of follow-up queries to address the knowledge gap."
     )
+
+
+class RatedSearchQueryList(SearchQueryList):
+    """Search queries with the confidence that they cover the research topic."""
+
+    confidence: float = Field(
+        description="How confident you are, from 0 to 1, that these queries cover what is needed to answer the research topic."
+    )
+
+
+class RatedReflection(Reflection):
+    """Reflection with the confidence in its assessment of the summaries."""
+
+    confidence: float = Field(
+        description="How confident you are, from 0 to 1, in this assessment of the summaries."
+    )
@@ -1,5 +1,12 @@
-from typing import Any, Dict, List
-from langchain_core.messages import AnyMessage, AIMessage, HumanMessage
+"""Research topic extraction and citation helpers of the research graph."""
+
+import re
+from typing import Any, Dict, List, Optional
+
+from langchain_core.messages import AIMessage, AnyMessage, HumanMessage
+
+# Prefix of the short urls that stand in for the (very long) vertex ai search urls
+SHORT_URL_PREFIX = "https://vertexaisearch.cloud.google.com/id/"
 
 
 def get_research_topic(messages: List[AnyMessage]) -> str:
@@ -7,7 +14,7 @@ def get_research_topic(messages: List[AnyMessage]) -> str:
     Get the research topic from the messages.
     """
     # check if request has a history and combine the messages into a single string
-    if len(messages) === 1:
+    if len(messages) == 1:
         research_topic = messages[-1].content
     else:
         research_topic = ""
@@ -24,7 +31,7 @@ def resolve_urls(urls_to_resolve: List[Any], id: int) -> Dict[str, str]:
     Create a map of the vertex ai search urls (very long) to a short url with a unique id for each url.
     Ensures each original URL gets a consistent shortened form while maintaining uniqueness.
     """
-    prefix = f"https://vertexaisearch.cloud.google.com/id/"
+    prefix = SHORT_URL_PREFIX
     urls = [site.web.uri for site in urls_to_resolve]
 
     # Create a dictionary that maps each unique URL to its first occurrence index
@@ -36,43 +43,159 @@ def resolve_urls(urls_to_resolve: List[Any], id: int) -> Dict[str, str]:
     return resolved_map
 
 
+class ShortUrlExpander:
+    """Replaces short urls with their original urls in a single pass.
+
+    All short urls are matched by one compiled alternation, so expanding a text costs
+    a single scan no matter how many sources were gathered. The expander also
+    collects the sources actually cited (once per original url), in order of first
+    appearance, and can work incrementally on a stream of text chunks via `feed` and
+    `flush`.
+    """
+
+    def __init__(
+        self,
+        sources: List[Dict[str, Any]],
+        expansions: Optional[Dict[str, str]] = None,
+    ):
+        """Create an expander for the short urls of `sources`.
+
+        Args:
+            sources: Source dictionaries with `short_url` and `value` (original url) keys.
+                     Only the first source of each short url is used.
+            expansions: The text replacing some of the short urls, instead of their
+                        original url.
+        """
+        self._expansions = expansions or {}
+        self._sources: Dict[str, Dict[str, Any]] = {}
+        for source in sources:
+            if source.get("short_url") and source["short_url"] not in self._sources:
+                self._sources[source["short_url"]] = source
+        # Longest first, and never match the prefix of a longer id ("1-1" in "1-10")
+        short_urls = sorted(self._sources, key=len, reverse=True)
+        self._pattern = (
+            re.compile("(?:" + "|".join(map(re.escape, short_urls)) + r")(?![0-9])")
+            if short_urls
+            else None
+        )
+        self._partial_urls = {
+            short_url[:length]
+            for short_url in short_urls
+            for length in range(1, len(short_url) + 1)
+        }
+        self._max_length = max(map(len, short_urls), default=0)
+        self._buffer = ""
+        self.cited_sources: List[Dict[str, Any]] = []
+        self._cited = set()
+
+    def _replace(self, match: re.Match) -> str:
+        source = self._sources[match.group()]
+        if source["value"] not in self._cited:
+            self._cited.add(source["value"])
+            self.cited_sources.append(source)
+        return self._expansions.get(match.group(), source["value"])
+
+    def expand(self, text: str) -> str:
+        """Replace all short urls of a complete text."""
+        if self._pattern is None:
+            return text
+        return self._pattern.sub(self._replace, text)
+
+    def feed(self, text: str) -> str:
+        """Add a chunk of streamed text and return the expanded text that is safe to emit."""
+        buffer = self._buffer + text
+        if self._pattern is None:
+            return buffer
+        output = []
+        position = 0
+        hold_from = None
+        for match in self._pattern.finditer(buffer):
+            if match.end() == len(buffer):
+                # A longer id might continue in the next chunk
+                hold_from = match.start()
+                break
+            output.append(buffer[position : match.start()])
+            output.append(self._replace(match))
+            position = match.end()
+
+        if hold_from is None:
+            hold_from = len(buffer)
+            # Hold back a tail that might be the start of a short url
+            for start in range(
+                max(position, len(buffer) - self._max_length), len(buffer)
+            ):
+                if buffer[start:] in self._partial_urls:
+                    hold_from = start
+                    break
+        output.append(buffer[position:hold_from])
+        self._buffer = buffer[hold_from:]
+        return "".join(output)
+
+    def flush(self) -> str:
+        """Return the expanded text still held back at the end of the stream."""
+        buffer, self._buffer = self._buffer, ""
+        return self.expand(buffer)
+
+
 def insert_citation_markers(text, citations_list):
     """
     Inserts citation markers into a text string based on start and end indices.
 
+    The output is built in a single pass over the insertion points sorted by
+    position, so the cost is linear in the length of the text plus the markers.
+
     Args:
         text (str): The original text string.
         citations_list (list): A list of dictionaries, where each dictionary
                                contains 'start_index', 'end_index', and
-                               'segment_string' (the marker to insert).
-                               Indices are assumed to be for the original text.
+                               'segments' (the links of the marker to insert).
+                               Indices are UTF-8 byte offsets into the original
+                               text, as returned by the Gemini API.
 
     Returns:
         str: The text with citation markers inserted.
     """
-    # Sort citations by end_index in descending order.
-    # If end_index is the same, secondary sort by start_index descending.
-    # This ensures that insertions at the end of the string don't affect
-    # the indices of earlier parts of the string that still need to be processed.
+    # Markers sharing an end_index are emitted in ascending start_index order,
+    # and in reverse input order when both indices are equal.
     sorted_citations = sorted(
-        citations_list, key=lambda c: (c["end_index"], c["start_index"]), reverse=True
+        enumerate(citations_list),
+        key=lambda item: (item[1]["end_index"], item[1]["start_index"], -item[0]),
     )
 
-    modified_text = text
-    for citation_info in sorted_citations:
-        # These indices refer to positions in the *original* text,
-        # but since we iterate from the end, they remain valid for insertion
-        # relative to the parts of the string already processed.
-        end_idx = citation_info["end_index"]
-        marker_to_insert = ""
-        for segment in citation_info["segments"]:
-            marker_to_insert += f" [{segment['label']}]({segment['short_url']})"
-        # Insert the citation marker at the original end_idx position
-        modified_text = (
-            modified_text[:end_idx] + marker_to_insert + modified_text[end_idx:]
+    # The API reports byte offsets, so work on the encoded text to place markers
+    # correctly in non-ASCII (e.g. Arabic) answers.
+    data = text.encode("utf-8")
+    parts = []
+    position = 0
+    for _, citation_info in sorted_citations:
+        end_idx = min(max(citation_info["end_index"], position), len(data))
+        # Never split a multi-byte character: move to the next character boundary
+        while end_idx < len(data) and data[end_idx] & 0xC0 == 0x80:
+            end_idx += 1
+        parts.append(data[position:end_idx])
+        parts.extend(
+            f" [{segment['label']}]({segment['short_url']})".encode()
+            for segment in citation_info["segments"]
         )
+        position = end_idx
+    parts.append(data[position:])
+
+    return b"".join(parts).decode("utf-8")
+
 
-    return modified_text
+def _chunk_segment(chunk, resolved_urls_map):
+    """Build the citation segment of a grounding chunk, or None if it can't be linked."""
+    try:
+        return {
+            "label": chunk.web.title.split(".")[:-1][0],
+            "short_url": resolved_urls_map.get(chunk.web.uri, None),
+            "value": chunk.web.uri,
+        }
+    except (IndexError, AttributeError, NameError):
+        # Handle cases where chunk, web, uri, or resolved_map might be problematic
+        # For simplicity, we'll just skip adding this particular segment link
+        # In a production system, you might want to log this.
+        return None
 
 
 def get_citations(response, resolved_urls_map):
@@ -83,25 +206,24 @@ def get_citations(response, resolved_urls_map):
     construct a list of citation objects. Each citation object includes the
     start and end indices of the text segment it refers to, and a string
     containing formatted markdown links to the supporting web chunks.
+    The segment of every grounding chunk is built once and shared by all
+    citations referencing it.
 
     Args:
         response: The response object from the Gemini model, expected to have
                   a structure including `candidates[0].grounding_metadata`.
-                  It also relies on a `resolved_map` being available in its
-                  scope to map chunk URIs to resolved URLs.
+        resolved_urls_map: Maps chunk URIs to resolved (short) URLs.
 
     Returns:
         list: A list of dictionaries, where each dictionary represents a citation
               and has the following keys:
-              - "start_index" (int): The starting character index of the cited
+              - "start_index" (int): The starting UTF-8 byte offset of the cited
                                      segment in the original text. Defaults to 0
                                      if not specified.
-              - "end_index" (int): The character index immediately after the
+              - "end_index" (int): The byte offset immediately after the
                                    end of the cited segment (exclusive).
-              - "segments" (list[str]): A list of individual markdown-formatted
-                                        links for each grounding chunk.
-              - "segment_string" (str): A concatenated string of all markdown-
-                                        formatted links for the citation.
+              - "segments" (list[dict]): The label, short url and original url
+                                         of each supporting grounding chunk.
               Returns an empty list if no valid candidates or grounding supports
               are found, or if essential data is missing.
     """
@@ -119,48 +241,35 @@ def get_citations(response, resolved_urls_map):
     ):
         return citations
 
-    for support in candidate.grounding_metadata.grounding_supports:
-        citation = {}
+    # Chunk index -> segment table, None for chunks that can't be linked
+    chunk_segments = [
+        _chunk_segment(chunk, resolved_urls_map)
+        for chunk in candidate.grounding_metadata.grounding_chunks or []
+    ]
 
+    for support in candidate.grounding_metadata.grounding_supports or []:
         # Ensure segment information is present
         if not hasattr(support, "segment") or support.segment is None:
             continue  # Skip this support if segment info is missing
 
+        # Ensure end_index is present to form a valid segment
+        if support.segment.end_index is None:
+            continue  # Skip if end_index is missing, as it's crucial
+
         start_index = (
             support.segment.start_index
             if support.segment.start_index is not None
             else 0
         )
-
-        # Ensure end_index is present to form a valid segment
-        if support.segment.end_index is None:
-            continue  # Skip if end_index is missing, as it's crucial
-
-        # Add 1 to end_index to make it an exclusive end for slicing/range purposes
-        # (assuming the API provides an inclusive end_index)
-        citation["start_index"] = start_index
-        citation["end_index"] = support.segment.end_index
-
-        citation["segments"] = []
-        if (
-            hasattr(support, "grounding_chunk_indices")
-            and support.grounding_chunk_indices
-        ):
-            for ind in support.grounding_chunk_indices:
-                try:
-                    chunk = candidate.grounding_metadata.grounding_chunks[ind]
-                    resolved_url = resolved_urls_map.get(chunk.web.uri, None)
-                    citation["segments"].append(
-                        {
-                            "label": chunk.web.title.split(".")[:-1][0],
-                            "short_url": resolved_url,
-                            "value": chunk.web.uri,
-                        }
-                    )
-                except (IndexError, AttributeError, NameError):
-                    # Handle cases where chunk, web, uri, or resolved_map might be problematic
-                    # For simplicity, we'll just skip adding this particular segment link
-                    # In a production system, you might want to log this.
-                    pass
-        citations.append(citation)
+        segments = []
+        for ind in getattr(support, "grounding_chunk_indices", None) or []:
+            if 0 <= ind < len(chunk_segments) and chunk_segments[ind] is not None:
+                segments.append(chunk_segments[ind])
+        citations.append(
+            {
+                "start_index": start_index,
+                "end_index": support.segment.end_index,
+                "segments": segments,
+            }
+        )
     return citations
@@ -0,0 +1,129 @@
+import sys
+from types import SimpleNamespace
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+
+import agent.graph  # noqa: F401
+from agent import cache as cache_module
+from agent import context as context_module
+from agent.context import build_run_context
+
+graph = sys.modules["agent.graph"]
+
+ANSWER = {
+    "messages": [AIMessage(content="LangGraph is a framework [a](https://a.com).")],
+    "sources_gathered": [{"label": "a", "short_url": "s", "value": "https://a.com"}],
+}
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = SimpleNamespace(value=1_000.0)
+    monkeypatch.setattr(cache_module, "time", SimpleNamespace(time=lambda: now.value))
+    return now
+
+
+@pytest.fixture
+def config(tmp_path):
+    return {"configurable": {"answer_cache_path": str(tmp_path / "answers.sqlite3")}}
+
+
+def _state(question: str = "What is LangGraph?", **values) -> dict:
+    return {"messages": [HumanMessage(content=question)], **values}
+
+
+def _key(state: dict, **configurable) -> str:
+    context = build_run_context(state, {"configurable": configurable})
+    return graph._answer_cache_key(state, context)
+
+
+def _store(state: dict, config: dict) -> None:
+    graph._store_cached_answer(ANSWER, state, build_run_context(state, config))
+
+
+def test_key_ignores_case_and_punctuation_of_question():
+    assert _key(_state("What is LangGraph?")) == _key(_state("  what is langgraph "))
+    assert _key(_state("What is LangGraph?")) != _key(_state("What is LangChain?"))
+
+
+@pytest.mark.parametrize(
+    "configurable",
+    [
+        {"query_generator_model": "other"},
+        {"reflection_model": "other"},
+        {"answer_model": "other"},
+        {"cascade_model": "other"},
+        {"number_of_initial_queries": 7},
+        {"max_research_loops": 7},
+        {"deadline_ms": 30_000},
+        {"citation_tokens": True},
+        {"answer_token_budget": 2_000},
+    ],
+)
+def test_key_changes_with_research_settings(configurable):
+    assert _key(_state(), **configurable) != _key(_state())
+
+
+@pytest.mark.parametrize(
+    "values",
+    [
+        {"reasoning_model": "other"},
+        {"initial_search_query_count": 7},
+        {"max_research_loops": 7},
+    ],
+)
+def test_key_changes_with_run_settings_of_state(values):
+    assert _key(_state(**values)) != _key(_state())
+
+
+def test_key_changes_with_prompts(monkeypatch):
+    key = _key(_state())
+    monkeypatch.setitem(
+        context_module._PROMPTS, "answer", "Answer briefly: {research_topic}"
+    )
+
+    assert _key(_state()) != key
+
+
+def test_hit_ends_run_without_research(config, clock):
+    _store(_state(), config)
+
+    result = graph.graph.invoke(_state(), config)
+
+    assert result["answer_cached"]
+    assert result["messages"][-1].content == ANSWER["messages"][-1].content
+    assert result["sources_gathered"] == ANSWER["sources_gathered"]
+    assert [record["node"] for record in result["telemetry"]] == ["answer_cache"]
+
+
+def test_bypass_researches_cached_question(config, clock):
+    _store(_state(), config)
+    config["configurable"]["bypass_answer_cache"] = True
+    state = _state()
+
+    update = graph._load_cached_answer(state, build_run_context(state, config))
+
+    assert update == {"answer_cached": False}
+    assert graph.route_answer_cache(update) == "generate_query"
+
+
+def test_stale_answer_is_researched_again(config, clock):
+    _store(_state(), config)
+    clock.value += 60 * 60 + 1
+    state = _state()
+
+    update = graph._load_cached_answer(state, build_run_context(state, config))
+
+    assert update == {"answer_cached": False}
+    assert graph.route_answer_cache(update) == "generate_query"
+
+
+def test_cache_is_opt_in(tmp_path):
+    state = _state()
+    context = build_run_context(state, {"configurable": {}})
+
+    graph._store_cached_answer(ANSWER, state, context)
+
+    assert graph._load_cached_answer(state, context) == {"answer_cached": False}
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,186 @@
+import asyncio
+import json
+from typing import Annotated, TypedDict
+
+import pytest
+from fastapi.testclient import TestClient
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage, HumanMessage
+from langgraph.checkpoint.memory import InMemorySaver
+from langgraph.graph import START, StateGraph
+from langgraph.types import Send
+
+from agent.app import app, get_checkpointed_graph, graph, stream_research
+from agent.benchmarks.stub import (
+    LatencyDistribution,
+    StubSettings,
+    install_stub_backend,
+    uninstall_stub_backend,
+)
+from agent.graph import compile_graph
+from agent.sources import merge_source_registries, register_sources
+from agent.utils import SHORT_URL_PREFIX
+
+
+class _State(TypedDict, total=False):
+    messages: list
+    source_registry: Annotated[dict, merge_source_registries]
+    sources_gathered: list
+
+
+def _branch_graph(answer: str, delays: dict):
+    async def web_research(branch: dict) -> dict:
+        await asyncio.sleep(delays[branch["id"]])
+        url = f"https://{branch['id']}.com"
+        fragment = register_sources(
+            [
+                {
+                    "label": branch["id"],
+                    "short_url": f"{SHORT_URL_PREFIX}{branch['id']}-0",
+                    "value": url,
+                }
+            ]
+        )
+        return {"source_registry": fragment}
+
+    async def finalize_answer(state: _State) -> dict:
+        model = GenericFakeChatModel(messages=iter([AIMessage(content=answer)]))
+        result = await model.ainvoke("answer")
+        return {"messages": [result], "sources_gathered": []}
+
+    builder = StateGraph(_State)
+    builder.add_node("web_research", web_research)
+    builder.add_node("finalize_answer", finalize_answer)
+    builder.add_conditional_edges(
+        START,
+        lambda state: [Send("web_research", {"id": key}) for key in delays],
+        ["web_research"],
+    )
+    builder.add_edge("web_research", "finalize_answer")
+    return builder.compile()
+
+
+async def _events(runner) -> list:
+    config = {"configurable": {"thread_id": "t"}}
+    return [
+        (event, data)
+        async for event, data in stream_research(
+            "question", {"messages": []}, config, runner, lambda *event: event
+        )
+    ]
+
+
+def test_stream_expands_citation_tokens_with_graph_registry():
+    # The first branch sent finishes last, but is still registered first
+    runner = _branch_graph("See [S0] and [S1].", {"a": 0.05, "b": 0.0})
+
+    events = asyncio.run(_events(runner))
+
+    tokens = "".join(data["text"] for event, data in events if event == "token")
+    assert tokens == "See [a](https://a.com) and [b](https://b.com)."
+
+
+def test_stream_events_are_json_encoded_by_default():
+    runner = _branch_graph("Done.", {"a": 0.0})
+
+    async def first_event():
+        config = {"configurable": {"thread_id": "t"}}
+        async for event in stream_research("question", {}, config, runner):
+            return event
+
+    event = asyncio.run(first_event())
+    assert event.startswith("event: start\ndata: ")
+    assert json.loads(event.split("data: ")[1]) == {
+        "question": "question",
+        "thread_id": "t",
+    }
+
+
+def test_streaming_endpoint_checkpoints_only_with_checkpoint_path(monkeypatch):
+    monkeypatch.delenv("CHECKPOINT_PATH", raising=False)
+
+    assert asyncio.run(get_checkpointed_graph()) is graph
+
+
+@pytest.fixture
+def stub():
+    no_latency = LatencyDistribution.parse("const:0")
+    install_stub_backend(StubSettings(no_latency, no_latency, no_latency, no_latency))
+    yield
+    uninstall_stub_backend()
+
+
+def _research_events(runner, thread_id: str = "t") -> list:
+    state = {
+        "messages": [HumanMessage(content="What powers the grid?")],
+        "initial_search_query_count": 2,
+        "max_research_loops": 1,
+    }
+    config = {"configurable": {"thread_id": thread_id}}
+
+    async def collect():
+        return [
+            (event, data)
+            async for event, data in stream_research(
+                "What powers the grid?", state, config, runner, lambda *event: event
+            )
+        ]
+
+    return asyncio.run(collect())
+
+
+def test_stream_reports_research_progress(stub):
+    events = _research_events(graph)
+
+    assert [event for event, _ in events if event != "token"] == [
+        "start",
+        "queries",
+        "web_research",
+        "web_research",
+        "reflection",
+        "answer",
+        "telemetry",
+        "end",
+    ]
+    data = dict(events)
+    assert len(data["queries"]["queries"]) == 2
+    assert data["web_research"]["sources"] > 0
+    assert data["reflection"]["research_loop_count"] == 1
+    assert not data["answer"]["cached"]
+    assert data["telemetry"]["web_research"]["count"] == 2
+
+
+def test_finished_run_is_replayed_from_its_checkpoint(stub):
+    runner = compile_graph(checkpointer=InMemorySaver())
+    answer = dict(_research_events(runner))["answer"]
+
+    events = _research_events(runner)
+
+    assert [event for event, _ in events] == ["start", "answer", "telemetry", "end"]
+    assert events[1][1]["content"] == answer["content"]
+    assert events[1][1]["replayed"]
+    assert events[2][1]["web_research"]["count"] == 2
+
+
+def test_streaming_endpoint_sends_server_sent_events(stub, monkeypatch):
+    monkeypatch.delenv("CHECKPOINT_PATH", raising=False)
+    client = TestClient(app)
+
+    response = client.get(
+        "/research/stream",
+        params={
+            "question": "What powers the grid?",
+            "initial_search_query_count": 1,
+            "max_research_loops": 1,
+        },
+    )
+
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert response.text.startswith("event: start\n")
+    assert response.text.endswith("event: end\ndata: {}\n\n")
+    assert (
+        client.get(
+            "/research/stream", params={"question": "q", "codec": "xml"}
+        ).status_code
+        == 400
+    )
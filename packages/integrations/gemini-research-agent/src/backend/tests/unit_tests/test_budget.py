@@ -0,0 +1,119 @@
+from types import SimpleNamespace
+
+import pytest
+
+from agent import budget
+from agent.budget import (
+    MIN_SAMPLES,
+    choose_answer_model,
+    deadline_at,
+    estimate_latency,
+    plan_initial_queries,
+    plan_next_loop,
+    wave_latency,
+)
+from agent.telemetry import LatencyStats, metrics
+
+NOW = 1_000.0
+
+
+@pytest.fixture(autouse=True)
+def latencies(monkeypatch):
+    stats = LatencyStats()
+    monkeypatch.setattr(metrics, "latencies", stats)
+    monkeypatch.setattr(budget, "time", SimpleNamespace(time=lambda: NOW))
+    return stats
+
+
+def _configurable(**overrides):
+    settings = {
+        "deadline_ms": 60_000,
+        "max_concurrent_requests": 0,
+        "query_generator_model": "flash",
+        "reflection_model": "flash",
+        "fast_answer_model": "",
+    }
+    settings.update(overrides)
+    return SimpleNamespace(**settings)
+
+
+def _observe(latencies, node, model, seconds, count=MIN_SAMPLES):
+    for _ in range(count):
+        latencies.observe(node, model, seconds)
+
+
+def test_estimate_latency_defaults_until_enough_samples(latencies):
+    _observe(latencies, "reflection", "flash", 2.0, count=MIN_SAMPLES - 1)
+    assert estimate_latency("reflection", "flash") == (8.0, "default")
+
+    latencies.observe("reflection", "flash", 2.0)
+    assert estimate_latency("reflection", "flash") == (2.0, "observed")
+
+
+def test_estimate_latency_falls_back_to_node_samples(latencies):
+    _observe(latencies, "reflection", "flash", 2.0)
+
+    assert estimate_latency("reflection", "pro") == (2.0, "observed")
+
+
+def test_wave_latency_counts_rounds_beyond_concurrency_limit():
+    assert wave_latency(4, _configurable()) == (10.0, "default")
+    assert wave_latency(4, _configurable(max_concurrent_requests=2)) == (
+        20.0,
+        "default",
+    )
+
+
+def test_wave_latency_plans_for_slowest_branch(latencies):
+    for seconds in range(1, 11):
+        latencies.observe("web_research", None, float(seconds))
+
+    assert wave_latency(1, _configurable())[0] == 9.0
+    assert wave_latency(3, _configurable())[0] == 10.0
+
+
+def test_deadline_at():
+    assert deadline_at(_configurable(deadline_ms=30_000), now=100.0) == 130.0
+    assert deadline_at(_configurable(deadline_ms=30_000)) == NOW + 30
+
+
+def test_plan_initial_queries_fits_queries_to_deadline():
+    # 60s left: 3s to generate, 8s to reflect and 20s to answer leave 29s of research
+    configurable = _configurable(max_concurrent_requests=1)
+    decision = plan_initial_queries(5, "pro", NOW + 60, configurable)
+
+    assert decision["initial_queries"] == 2
+    assert decision["requested"] == 5
+    assert decision["remaining_ms"] == 60_000
+    assert decision["estimated_ms"]["web_research"] == 20_000
+
+
+def test_plan_initial_queries_researches_at_least_one_query():
+    decision = plan_initial_queries(3, "pro", NOW + 5, _configurable())
+
+    assert decision["initial_queries"] == 1
+
+
+def test_plan_next_loop():
+    # One more wave (10s), reflection (8s) and the answer (20s)
+    assert plan_next_loop(1, "pro", NOW + 38, _configurable())["another_loop"]
+    assert not plan_next_loop(1, "pro", NOW + 37, _configurable())["another_loop"]
+
+
+def test_choose_answer_model_falls_back_to_fast_tier(latencies):
+    _observe(latencies, "finalize_answer", "pro", 30.0)
+    _observe(latencies, "finalize_answer", "flash", 5.0)
+    configurable = _configurable(fast_answer_model="flash")
+
+    assert choose_answer_model("pro", NOW + 60, configurable)["answer_model"] == "pro"
+    decision = choose_answer_model("pro", NOW + 20, configurable)
+    assert decision["answer_model"] == "flash"
+    assert decision["requested"] == "pro"
+    assert decision["estimated_ms"] == {"finalize_answer": 5_000}
+
+
+def test_choose_answer_model_without_fast_tier(latencies):
+    _observe(latencies, "finalize_answer", "pro", 30.0)
+
+    decision = choose_answer_model("pro", NOW + 20, _configurable())
+    assert decision["answer_model"] == "pro"
@@ -0,0 +1,73 @@
+from types import SimpleNamespace
+
+import pytest
+
+from agent import cache as cache_module
+from agent.cache import SqliteCache, make_cache_key, normalize_text
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = SimpleNamespace(value=1_000.0)
+    monkeypatch.setattr(cache_module, "time", SimpleNamespace(time=lambda: now.value))
+    return now
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return SqliteCache(str(tmp_path / "cache" / "web_research.sqlite3"))
+
+
+def test_normalize_text_ignores_case_punctuation_and_whitespace():
+    assert normalize_text("  What IS  LangGraph?! ") == "what is langgraph"
+
+
+def test_make_cache_key_depends_on_every_part():
+    assert make_cache_key("web_research", "model", "q") == make_cache_key(
+        "web_research", "model", "q"
+    )
+    assert make_cache_key("web_research", "model", "q") != make_cache_key(
+        "web_research", "other", "q"
+    )
+
+
+def test_get_returns_stored_value_and_counts_hits(cache, clock):
+    cache.set("key", {"sources": ["a"]}, ttl_seconds=60, max_entries=10)
+
+    assert cache.get("key", ttl_seconds=60) == {"sources": ["a"]}
+    assert cache.get("missing", ttl_seconds=60) is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_get_misses_entries_older_than_ttl(cache, clock):
+    cache.set("key", "value", ttl_seconds=60, max_entries=10)
+
+    clock.value += 30
+    assert cache.get("key", ttl_seconds=60) == "value"
+    clock.value += 31
+    assert cache.get("key", ttl_seconds=60) is None
+
+
+def test_set_drops_expired_entries(cache, clock):
+    cache.set("old", "value", ttl_seconds=60, max_entries=10)
+    clock.value += 61
+    cache.set("new", "value", ttl_seconds=60, max_entries=10)
+
+    assert cache.stats()["entries"] == 1
+    assert cache.get("new", ttl_seconds=600) == "value"
+    assert cache.get("old", ttl_seconds=600) is None
+
+
+def test_set_evicts_least_recently_used_entries(cache, clock):
+    for key in ("a", "b", "c"):
+        cache.set(key, key, ttl_seconds=600, max_entries=3)
+        clock.value += 1
+    # Reading "a" makes "b" the least recently used entry
+    cache.get("a", ttl_seconds=600)
+    clock.value += 1
+    cache.set("d", "d", ttl_seconds=600, max_entries=3)
+
+    assert cache.stats()["entries"] == 3
+    assert cache.get("b", ttl_seconds=600) is None
+    assert [cache.get(key, ttl_seconds=600) for key in "acd"] == ["a", "c", "d"]
@@ -0,0 +1,182 @@
+import sys
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import agent.graph  # noqa: F401
+from agent import telemetry
+from agent.budget import MIN_SAMPLES
+from agent.cascade import cascade_stats, escalation_reason, summarize_cascade
+from agent.telemetry import LatencyStats, NodeMetrics, metrics
+
+graph = sys.modules["agent.graph"]
+
+
+@pytest.fixture(autouse=True)
+def call_latencies(monkeypatch):
+    stats = LatencyStats()
+    monkeypatch.setattr(metrics, "call_latencies", stats)
+    return stats
+
+
+@pytest.fixture
+def node_metrics():
+    node_metrics = NodeMetrics("reflection")
+    token = telemetry._current_metrics.set(node_metrics)
+    yield node_metrics
+    telemetry._current_metrics.reset(token)
+
+
+def _configurable(**overrides):
+    settings = {
+        "cascade_model": "cheap",
+        "cascade_min_confidence": 0.7,
+        "answer_model": "pro",
+        "deadline_ms": 0,
+    }
+    settings.update(overrides)
+    return SimpleNamespace(**settings)
+
+
+@pytest.mark.parametrize(
+    ("result", "reason"),
+    [
+        (None, "invalid"),
+        (SimpleNamespace(query=[], confidence=0.9), "invalid"),
+        (SimpleNamespace(query=["q"], confidence=0.5), "low_confidence"),
+        (SimpleNamespace(is_sufficient=False, confidence=0.9), "knowledge_gap"),
+        (SimpleNamespace(is_sufficient=True, confidence=0.7), None),
+        (SimpleNamespace(query=["q"]), None),
+    ],
+)
+def test_escalation_reason(result, reason):
+    assert escalation_reason(result, 0.7) == reason
+
+
+def test_accepted_attempt_is_unmeasured_until_escalation_model_is_observed(
+    call_latencies,
+):
+    assert cascade_stats("reflection", "pro", 0.5, None) == {
+        "reflection.attempts": 1,
+        "reflection.unmeasured": 1,
+    }
+
+    for _ in range(MIN_SAMPLES):
+        call_latencies.observe("reflection", "pro", 2.0)
+    assert cascade_stats("reflection", "pro", 0.5, None) == {
+        "reflection.attempts": 1,
+        "reflection.saved_ms": 1500,
+    }
+
+
+def test_cheap_calls_are_no_baseline_for_escalation_model(call_latencies):
+    for _ in range(MIN_SAMPLES):
+        call_latencies.observe("reflection", "cheap", 0.5)
+
+    assert "reflection.saved_ms" not in cascade_stats("reflection", "pro", 0.5, None)
+
+
+def test_escalated_attempt_wastes_its_latency():
+    assert cascade_stats("generate_query", "pro", 0.25, "low_confidence") == {
+        "generate_query.attempts": 1,
+        "generate_query.escalations": 1,
+        "generate_query.escalations.low_confidence": 1,
+        "generate_query.saved_ms": -250,
+    }
+
+
+def test_summarize_cascade():
+    stats = {
+        "reflection.attempts": 4,
+        "reflection.escalations": 1,
+        "reflection.escalations.knowledge_gap": 1,
+        "reflection.saved_ms": 900,
+        "reflection.unmeasured": 2,
+    }
+
+    assert summarize_cascade(stats) == {
+        "reflection": {
+            "attempts": 4,
+            "escalations": 1,
+            "escalation_rate": 0.25,
+            "escalation_reasons": {"knowledge_gap": 1},
+            "saved_ms": 900,
+            "unmeasured": 2,
+        }
+    }
+
+
+def test_escalated_node_is_recorded_under_escalation_model(node_metrics):
+    call = (None, "prompt", "pro")
+    node_metrics.add_call(0.0, "cheap")
+
+    result, stats = graph._settle_cascade(
+        "reflection", call, None, time.perf_counter(), _configurable()
+    )
+
+    assert result is None
+    assert stats["reflection.escalations.invalid"] == 1
+    assert node_metrics.record(1.0)["model"] == "pro"
+    assert node_metrics.record(1.0)["cascade"] == "escalated:invalid"
+
+
+def test_accepted_node_is_recorded_under_cascade_model(node_metrics):
+    accepted = SimpleNamespace(is_sufficient=True, confidence=0.9)
+    node_metrics.add_call(0.0, "cheap")
+
+    result, _ = graph._settle_cascade(
+        "reflection", (None, "prompt", "pro"), accepted, 0.0, _configurable()
+    )
+
+    assert result is accepted
+    assert node_metrics.record(1.0)["model"] == "cheap"
+
+
+def test_settled_question_is_answered_by_cascade_model():
+    state = {"cascade_settled": True}
+
+    assert graph._answer_tier(state, _configurable()) == ("cheap", {})
+    stats = graph._answer_cascade(state, time.perf_counter(), _configurable())
+    assert stats == {
+        "cascade_stats": {
+            "finalize_answer.attempts": 1,
+            "finalize_answer.unmeasured": 1,
+        }
+    }
+
+
+def test_escalated_question_is_answered_by_answer_model():
+    state = {"cascade_settled": False}
+
+    assert graph._answer_tier(state, _configurable()) == ("pro", {})
+    stats = graph._answer_cascade(state, time.perf_counter(), _configurable())
+    assert stats["cascade_stats"]["finalize_answer.escalations.reflection"] == 1
+
+
+def test_answer_is_not_counted_without_cascade():
+    configurable = _configurable(cascade_model="")
+
+    assert graph._answer_tier({"cascade_settled": True}, configurable) == ("pro", {})
+    assert graph._answer_cascade({"cascade_settled": True}, 0.0, configurable) == {}
+
+
+@pytest.mark.parametrize(
+    ("stats", "settled"),
+    [
+        ({"reflection.attempts": 1}, True),
+        ({"reflection.attempts": 1, "reflection.escalations": 1}, False),
+        # No cascade attempt, e.g. the cascade model is the reflection model
+        (None, False),
+    ],
+)
+def test_reflection_always_sets_cascade_settled(stats, settled):
+    result = SimpleNamespace(is_sufficient=True, knowledge_gap="", follow_up_queries=[])
+    state = {
+        "research_loop_count": 1,
+        "search_query": ["q"],
+        "cascade_settled": True,
+    }
+
+    update = graph._reflection_update(result, state, stats=stats)
+    assert update["cascade_settled"] is settled
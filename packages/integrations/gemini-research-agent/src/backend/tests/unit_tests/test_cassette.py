@@ -0,0 +1,180 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from google.genai import types
+from langchain_core.messages import AIMessage
+from langchain_core.runnables import RunnableLambda
+
+from agent import cassette as cassette_module
+from agent.cassette import (
+    Cassette,
+    CassetteChatModel,
+    CassetteGenaiClient,
+    CassetteMiss,
+    install_cassette_from_env,
+)
+from agent.clients import ClientRegistry
+from agent.prompts import get_current_date
+from agent.tools_and_schemas import SearchQueryList
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    sleeps = []
+    clock = SimpleNamespace(value=0.0)
+
+    def perf_counter():
+        clock.value += 0.25
+        return clock.value
+
+    monkeypatch.setattr(
+        cassette_module,
+        "time",
+        SimpleNamespace(sleep=sleeps.append, perf_counter=perf_counter),
+    )
+    return sleeps
+
+
+def _unavailable(**kwargs):
+    raise AssertionError("a replayed call built the real client")
+
+
+class _ChatModel:
+    def __init__(self, **kwargs) -> None:
+        self.calls = []
+
+    def invoke(self, prompt, *args, **kwargs):
+        self.calls.append(prompt)
+        return AIMessage(
+            content=f"answer to {prompt}",
+            usage_metadata={"input_tokens": 3, "output_tokens": 4, "total_tokens": 7},
+        )
+
+    async def ainvoke(self, prompt, *args, **kwargs):
+        return self.invoke(prompt)
+
+    def with_structured_output(self, schema, **kwargs):
+        def invoke(prompt):
+            self.calls.append(prompt)
+            return schema(query=[prompt], rationale="because")
+
+        return RunnableLambda(invoke)
+
+
+class _GenaiModels:
+    def generate_content(self, model, contents, config=None):
+        return types.GenerateContentResponse(
+            candidates=[
+                types.Candidate(
+                    content=types.Content(
+                        parts=[types.Part(text=f"found {contents}")], role="model"
+                    )
+                )
+            ],
+            usage_metadata=types.GenerateContentResponseUsageMetadata(
+                prompt_token_count=5
+            ),
+        )
+
+
+def test_replay_serves_recorded_response_with_its_latency(tmp_path, sleeps):
+    performed = []
+    recorder = Cassette(str(tmp_path), mode="record")
+    response = recorder.call("key", lambda: performed.append(1) or {"a": 1}, dict, dict)
+
+    player = Cassette(str(tmp_path), mode="replay")
+    assert player.call("key", _unavailable, dict, dict) == response
+    assert Cassette(str(tmp_path), latency="none").call("key", None, dict, dict)
+
+    assert performed == [1]
+    assert sleeps == [0.25, 0.0]
+    assert (recorder.recorded, player.replayed) == (1, 1)
+
+
+def test_replay_of_unknown_request_raises(tmp_path):
+    with pytest.raises(CassetteMiss):
+        Cassette(str(tmp_path)).call("missing", _unavailable, dict, dict)
+
+
+def test_auto_records_what_it_cannot_replay(tmp_path, sleeps):
+    cassette = Cassette(str(tmp_path), mode="auto")
+
+    async def call_twice():
+        first = await cassette.acall("key", _async_value, dict, dict)
+        return first, await cassette.acall("key", _unavailable, dict, dict)
+
+    assert asyncio.run(call_twice()) == ({"a": 1}, {"a": 1})
+    assert (cassette.recorded, cassette.replayed) == (1, 1)
+
+
+async def _async_value():
+    return {"a": 1}
+
+
+def test_request_key_ignores_current_date(tmp_path):
+    cassette = Cassette(str(tmp_path))
+
+    assert cassette.request_key(f"Today is {get_current_date()}.") == (
+        cassette.request_key("Today is {current_date}.")
+    )
+    assert cassette.request_key("a") != cassette.request_key("b")
+
+
+@pytest.mark.parametrize("arguments", [{"mode": "rewind"}, {"latency": "instant"}])
+def test_unknown_settings_are_rejected(tmp_path, arguments):
+    with pytest.raises(ValueError):
+        Cassette(str(tmp_path), **arguments)
+
+
+def test_chat_model_calls_are_replayed_without_real_model(tmp_path, sleeps):
+    recorder = Cassette(str(tmp_path), mode="record")
+    model = CassetteChatModel(recorder, _ChatModel, model="flash", temperature=0.0)
+    message = model.invoke("prompt")
+    queries = model.with_structured_output(SearchQueryList).invoke("topic")
+
+    player = Cassette(str(tmp_path), mode="replay")
+    model = CassetteChatModel(player, _unavailable, model="flash", temperature=0.0)
+
+    assert model.invoke("prompt") == message
+    assert asyncio.run(model.ainvoke("prompt")).usage_metadata["total_tokens"] == 7
+    assert model.with_structured_output(SearchQueryList).invoke("topic") == queries
+    with pytest.raises(CassetteMiss):
+        CassetteChatModel(player, _unavailable, model="pro", temperature=0.0).invoke(
+            "prompt"
+        )
+
+
+def test_grounded_searches_are_replayed(tmp_path, sleeps):
+    def genai_client(**kwargs):
+        return SimpleNamespace(models=_GenaiModels())
+
+    recorder = Cassette(str(tmp_path), mode="record")
+    response = CassetteGenaiClient(recorder, genai_client).models.generate_content(
+        model="flash", contents="query"
+    )
+
+    player = Cassette(str(tmp_path), mode="replay")
+    client = CassetteGenaiClient(player, _unavailable)
+    replayed = asyncio.run(
+        client.aio.models.generate_content(model="flash", contents="query")
+    )
+
+    assert replayed.text == response.text == "found query"
+    assert replayed.usage_metadata.prompt_token_count == 5
+
+
+def test_cassette_of_environment_wraps_registry_factories(tmp_path, monkeypatch):
+    registry = ClientRegistry()
+    registry.configure(chat_model_factory=_ChatModel)
+    monkeypatch.setattr(cassette_module, "registry", registry)
+    monkeypatch.setenv("GEMINI_CASSETTE", str(tmp_path))
+    monkeypatch.setenv("GEMINI_CASSETTE_MODE", "record")
+    monkeypatch.setenv("GEMINI_CASSETTE_LATENCY", "none")
+
+    cassette = install_cassette_from_env()
+    registry.get_chat_model("flash", 0.0).invoke("prompt")
+
+    assert (cassette.mode, cassette.latency, cassette.recorded) == ("record", "none", 1)
+    monkeypatch.delenv("GEMINI_CASSETTE")
+    assert install_cassette_from_env() is None
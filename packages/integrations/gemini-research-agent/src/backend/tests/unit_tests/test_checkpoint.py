@@ -0,0 +1,177 @@
+import asyncio
+import operator
+import sqlite3
+import time
+from typing import Annotated, TypedDict
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+from langgraph.checkpoint.memory import InMemorySaver
+from langgraph.graph import START, StateGraph
+from langgraph.types import Send
+
+from agent.checkpoint import (
+    acheckpointed_graph,
+    arun_or_resume,
+    checkpoint_path,
+    checkpoint_serde,
+    checkpointed_graph,
+    continues_run,
+    run_or_resume,
+)
+from agent.context import build_run_context
+from agent.graph import _store_cached_answer
+
+
+class _State(TypedDict, total=False):
+    messages: Annotated[list, operator.add]
+    summaries: Annotated[list, operator.add]
+
+
+def _research_graph(searches: list, failing: set):
+    def web_research(branch: dict) -> dict:
+        searches.append(branch["query"])
+        if branch["query"] in failing:
+            # Fail once the sibling branches finished and saved their writes
+            time.sleep(0.1)
+            raise RuntimeError("search failed")
+        return {"summaries": [branch["query"]]}
+
+    def finalize_answer(state: _State) -> dict:
+        answer = " ".join(sorted(state["summaries"]))
+        return {"messages": [AIMessage(content=answer)]}
+
+    builder = StateGraph(_State)
+    builder.add_node("web_research", web_research)
+    builder.add_node("finalize_answer", finalize_answer)
+    builder.add_conditional_edges(
+        START,
+        lambda state: [
+            Send("web_research", {"query": f"{state['messages'][-1].content} {i}"})
+            for i in range(3)
+        ],
+        ["web_research"],
+    )
+    builder.add_edge("web_research", "finalize_answer")
+    return builder.compile(checkpointer=InMemorySaver())
+
+
+def _question(text: str) -> dict:
+    return {"messages": [HumanMessage(content=text)]}
+
+
+CONFIG = {"configurable": {"thread_id": "t"}}
+
+
+def test_interrupted_run_resumes_without_repeating_finished_branches():
+    searches = []
+    failing = {"q 1"}
+    graph = _research_graph(searches, failing)
+    with pytest.raises(RuntimeError):
+        run_or_resume(graph, _question("q"), CONFIG)
+
+    failing.clear()
+    result = run_or_resume(graph, _question("q"), CONFIG)
+
+    assert result["messages"][-1].content == "q 0 q 1 q 2"
+    assert sorted(searches[:3]) == ["q 0", "q 1", "q 2"]
+    assert searches[3:] == ["q 1"]
+
+
+def test_finished_run_is_replayed_and_new_question_starts_new_turn():
+    searches = []
+    graph = _research_graph(searches, set())
+    first = run_or_resume(graph, _question("q"), CONFIG)
+
+    assert run_or_resume(graph, None, CONFIG) == first
+    assert run_or_resume(graph, _question("q"), CONFIG) == first
+    assert len(searches) == 3
+
+    result = run_or_resume(graph, _question("r"), CONFIG)
+    assert result["messages"][-1].content.endswith("r 0 r 1 r 2")
+    assert len(searches) == 6
+
+
+def test_async_run_is_replayed():
+    searches = []
+    graph = _research_graph(searches, set())
+
+    async def run_twice():
+        first = await arun_or_resume(graph, _question("q"), CONFIG)
+        return first, await arun_or_resume(graph, _question("q"), CONFIG)
+
+    first, again = asyncio.run(run_twice())
+    assert again == first
+    assert len(searches) == 3
+
+
+def test_continues_run():
+    graph = _research_graph([], set())
+    snapshot = graph.get_state(CONFIG)
+    assert not continues_run(snapshot, None)
+
+    run_or_resume(graph, _question("q"), CONFIG)
+    snapshot = graph.get_state(CONFIG)
+    assert continues_run(snapshot, None)
+    assert continues_run(snapshot, _question("q"))
+    assert not continues_run(snapshot, _question("r"))
+
+
+def test_checkpoint_path_creates_directory(tmp_path):
+    path = str(tmp_path / "runs" / "checkpoints.sqlite3")
+
+    assert checkpoint_path(path) == path
+    assert (tmp_path / "runs").is_dir()
+
+
+def test_unknown_codec_is_rejected():
+    assert checkpoint_serde("msgpack") is None
+    with pytest.raises(ValueError, match="zstd"):
+        checkpoint_serde("json")
+
+
+def _cached_run(tmp_path) -> tuple:
+    # A cached answer ends the research graph without calling any model
+    state = _question("What is LangGraph?")
+    config = {
+        "configurable": {
+            "thread_id": "t",
+            "answer_cache_path": str(tmp_path / "answers.sqlite3"),
+        }
+    }
+    answer = {"messages": [AIMessage(content="A framework.")], "sources_gathered": []}
+    _store_cached_answer(answer, state, build_run_context(state, config))
+    return state, config
+
+
+def _checkpoints(path) -> int:
+    with sqlite3.connect(path) as conn:
+        return conn.execute("SELECT COUNT(*) FROM checkpoints").fetchone()[0]
+
+
+def test_research_graph_is_checkpointed_to_sqlite(tmp_path):
+    state, config = _cached_run(tmp_path)
+    path = str(tmp_path / "checkpoints.sqlite3")
+
+    with checkpointed_graph(path) as graph:
+        first = run_or_resume(graph, state, config)
+    count = _checkpoints(path)
+    with checkpointed_graph(path) as graph:
+        replayed = run_or_resume(graph, state, config)
+
+    assert replayed["messages"] == first["messages"]
+    assert first["answer_cached"]
+    assert count > 0
+    assert _checkpoints(path) == count
+
+
+def test_research_graph_is_checkpointed_async(tmp_path):
+    state, config = _cached_run(tmp_path)
+    path = str(tmp_path / "checkpoints.sqlite3")
+
+    async def run():
+        async with acheckpointed_graph(path) as graph:
+            return await arun_or_resume(graph, state, config)
+
+    assert asyncio.run(run())["answer_cached"]
+    assert _checkpoints(path) > 0
@@ -0,0 +1,102 @@
+import asyncio
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from agent.clients import ClientRegistry, create_chat_model
+
+
+@pytest.fixture
+def registry():
+    registry = ClientRegistry()
+    registry.configure(
+        chat_model_factory=lambda **kwargs: SimpleNamespace(**kwargs),
+        genai_client_factory=lambda **kwargs: SimpleNamespace(**kwargs),
+    )
+    return registry
+
+
+def _pooled_client(connections: int, async_connections: int) -> SimpleNamespace:
+    def transport(count):
+        return SimpleNamespace(_pool=SimpleNamespace(connections=[object()] * count))
+
+    api_client = SimpleNamespace(
+        _httpx_client=SimpleNamespace(_transport=transport(connections)),
+        _async_httpx_client=SimpleNamespace(_transport=transport(async_connections)),
+    )
+    return SimpleNamespace(_api_client=api_client)
+
+
+def test_sync_callers_share_one_client_per_settings(registry):
+    clients = []
+    threads = [
+        threading.Thread(
+            target=lambda: clients.append(registry.get_chat_model("flash", 1.0))
+        )
+        for _ in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert all(client is clients[0] for client in clients)
+    assert clients[0].model == "flash"
+    assert registry.get_chat_model("flash", 0.0) is not clients[0]
+    assert registry.get_chat_model("flash", 1.0, max_retries=0) is not clients[0]
+
+
+def test_async_callers_get_one_client_per_loop(registry):
+    async def get_twice():
+        return registry.get_genai_client(), registry.get_genai_client()
+
+    first, again = asyncio.run(get_twice())
+    second, _ = asyncio.run(get_twice())
+
+    assert first is again
+    assert first is not second
+    shared = registry.get_genai_client()
+    assert shared is not first and shared is not second
+
+
+def test_configure_drops_cached_clients(registry):
+    client = registry.get_genai_client()
+
+    registry.configure(genai_client_factory=lambda **kwargs: "stub")
+
+    assert registry.get_genai_client() == "stub"
+    assert registry.get_genai_client() is not client
+    assert registry.stats()[0]["created"] == 1
+
+
+def test_stats_report_reuse_and_pool_connections(registry):
+    registry.configure(
+        chat_model_factory=lambda **kwargs: SimpleNamespace(**kwargs),
+        genai_client_factory=lambda **kwargs: _pooled_client(2, 3),
+    )
+    for _ in range(3):
+        registry.get_genai_client()
+    registry.get_chat_model("flash", 1.0)
+
+    assert registry.stats() == [
+        {
+            "key": ["genai"],
+            "created": 1,
+            "reused": 2,
+            "sync_connections": 2,
+            "async_connections": 3,
+        },
+        {
+            "key": ["chat", "flash", 1.0, 2],
+            "created": 1,
+            "reused": 0,
+            "sync_connections": 0,
+            "async_connections": 0,
+        },
+    ]
+
+
+def test_real_client_requires_api_key():
+    with pytest.raises(ValueError, match="GEMINI_API_KEY"):
+        create_chat_model(model="flash", api_key=None)
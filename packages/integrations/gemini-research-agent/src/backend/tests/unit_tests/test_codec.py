@@ -0,0 +1,73 @@
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+
+from agent.codec import (
+    EventStreamEncoder,
+    ZstdSerializer,
+    decode_event_stream,
+    decode_state,
+    encode_state,
+)
+
+pytest.importorskip("zstandard")
+
+STATE = {
+    "messages": [HumanMessage(content="What is LangGraph?"), AIMessage(content="A")],
+    "web_research_result": ["LangGraph builds stateful agents. " * 40] * 3,
+    "source_registry": {
+        "urls": ["https://example.com/a"],
+        "labels": ["example"],
+        "refs": {"0-0": 0},
+    },
+    "research_loop_count": 2,
+}
+
+
+def test_serializer_round_trip_compresses_large_blobs():
+    serde = ZstdSerializer()
+    type_, blob = serde.dumps_typed(STATE)
+
+    assert type_.endswith("+zstd")
+    assert len(blob) < len(serde.serde.dumps_typed(STATE)[1])
+    assert serde.loads_typed((type_, blob)) == STATE
+
+
+def test_serializer_keeps_small_blobs_uncompressed():
+    serde = ZstdSerializer()
+    typed = serde.dumps_typed({"research_loop_count": 1})
+
+    assert typed == serde.serde.dumps_typed({"research_loop_count": 1})
+    assert serde.loads_typed(typed) == {"research_loop_count": 1}
+
+
+def test_encode_state_round_trip():
+    assert decode_state(encode_state(STATE)) == STATE
+
+
+def test_event_stream_round_trip():
+    events = [
+        ("updates", {"web_research": {"search_query": ["langgraph"]}}),
+        ("messages", ["token", {"langgraph_node": "finalize_answer"}]),
+        ("end", None),
+    ]
+    encode = EventStreamEncoder()
+    chunks = [encode(event, data) for event, data in events]
+
+    assert list(decode_event_stream(chunks)) == events
+
+
+def test_event_stream_decodes_each_event_as_it_arrives():
+    encode = EventStreamEncoder()
+    chunks = iter([encode("first", 1), encode("second", {"refs": {"0-0": 0}})])
+    decoded = decode_event_stream(chunks)
+
+    assert next(decoded) == ("first", 1)
+    assert next(decoded) == ("second", {"refs": {"0-0": 0}})
+
+
+def test_event_stream_split_across_chunks():
+    encode = EventStreamEncoder()
+    stream = encode("event", "x" * 1000) + encode("end", None)
+    chunks = [stream[start : start + 7] for start in range(0, len(stream), 7)]
+
+    assert list(decode_event_stream(chunks)) == [("event", "x" * 1000), ("end", None)]
@@ -0,0 +1,33 @@
+from agent.compaction import estimate_tokens, needs_compaction, research_summaries
+
+
+def test_estimate_tokens():
+    assert estimate_tokens("") == 1
+    assert estimate_tokens("x" * 400) == 101
+
+
+def test_research_summaries_without_running_summary():
+    state = {"web_research_result": ["first", "second"]}
+
+    assert research_summaries(state) == ["first", "second"]
+
+
+def test_research_summaries_skip_results_folded_into_running_summary():
+    state = {
+        "web_research_result": ["first", "second", "third"],
+        "running_summary": "condensed first and second",
+        "compacted_result_count": 2,
+    }
+
+    assert research_summaries(state) == ["condensed first and second", "third"]
+
+
+def test_needs_compaction_once_summaries_exceed_budget():
+    summaries = ["x" * 200, "x" * 200]
+
+    assert not needs_compaction(summaries, 101)
+    assert needs_compaction(summaries, 100)
+
+
+def test_budget_below_one_disables_compaction():
+    assert not needs_compaction(["x" * 10_000], 0)
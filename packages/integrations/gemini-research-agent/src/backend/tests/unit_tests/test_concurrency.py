@@ -0,0 +1,102 @@
+import asyncio
+import gc
+import inspect
+import sys
+
+import pytest
+
+import agent.graph  # noqa: F401
+from agent import concurrency as concurrency_module
+from agent.concurrency import get_run_key, run_concurrency_slot
+from agent.configuration import Configuration
+from agent.context import build_run_context, with_run_context
+
+graph = sys.modules["agent.graph"]
+
+
+class _SlowModel:
+    def __init__(self) -> None:
+        self.in_flight = 0
+        self.peak = 0
+
+    async def ainvoke(self, prompt):
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        await asyncio.sleep(0.01)
+        self.in_flight -= 1
+        return prompt
+
+
+def _config(thread_id: str) -> dict:
+    return {"configurable": {"thread_id": thread_id}}
+
+
+def test_run_key_prefers_run_context_then_thread_then_run_id():
+    context = build_run_context({}, None)
+    config = with_run_context(_config("thread"), context)
+
+    assert get_run_key(config) == context.values["id"]
+    assert get_run_key(_config("thread")) == "thread"
+    assert get_run_key({"metadata": {"run_id": 7}}) == "7"
+    assert get_run_key(None) == "anonymous"
+
+
+async def _hold(config, limit: int, model: _SlowModel) -> None:
+    async with run_concurrency_slot(config, limit):
+        await model.ainvoke(None)
+
+
+@pytest.mark.parametrize(("limit", "peak"), [(2, 2), (0, 6)])
+def test_slots_limit_requests_of_a_run(limit, peak):
+    model = _SlowModel()
+
+    async def run():
+        await asyncio.gather(*(_hold(_config("a"), limit, model) for _ in range(6)))
+
+    asyncio.run(run())
+    assert model.peak == peak
+
+
+def test_runs_have_their_own_slots():
+    model = _SlowModel()
+
+    async def run():
+        await asyncio.gather(
+            *(_hold(_config(thread), 1, model) for thread in ("a", "b", "c"))
+        )
+
+    asyncio.run(run())
+    assert model.peak == 3
+
+
+def test_semaphores_are_dropped_with_their_run():
+    asyncio.run(_hold(_config("finished"), 2, _SlowModel()))
+    gc.collect()
+
+    assert ("finished", 2) not in concurrency_module._run_semaphores
+
+
+def test_async_model_calls_hold_a_slot_of_the_run():
+    model = _SlowModel()
+    configurable = Configuration.from_runnable_config(
+        {"configurable": {"max_concurrent_requests": 2}}
+    )
+
+    async def run():
+        return await asyncio.gather(
+            *(
+                graph._ainvoke_model(model, "p", "m", configurable, _config("a"))
+                for _ in range(5)
+            )
+        )
+
+    assert asyncio.run(run()) == ["p"] * 5
+    assert model.peak == 2
+
+
+@pytest.mark.parametrize("node", sorted(graph.graph.builder.nodes))
+def test_nodes_have_an_async_implementation(node):
+    runnable = graph.graph.builder.nodes[node].runnable
+
+    assert inspect.iscoroutinefunction(runnable.afunc)
+    assert not inspect.iscoroutinefunction(runnable.func)
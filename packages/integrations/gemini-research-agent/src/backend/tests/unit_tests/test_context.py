@@ -0,0 +1,160 @@
+import sys
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+
+import agent.graph  # noqa: F401
+from agent import context as context_module
+from agent.configuration import Configuration
+from agent.context import (
+    PINNED_SETTINGS,
+    build_run_context,
+    get_run_context,
+    load_run_context,
+    with_run_context,
+)
+
+graph = sys.modules["agent.graph"]
+
+
+@pytest.fixture(autouse=True)
+def contexts(monkeypatch):
+    contexts = context_module.OrderedDict()
+    monkeypatch.setattr(context_module, "_contexts", contexts)
+    return contexts
+
+
+def _state() -> dict:
+    return {
+        "messages": [
+            HumanMessage(content="What is LangGraph?"),
+            AIMessage(content="A framework."),
+            HumanMessage(content="Who maintains it?"),
+        ]
+    }
+
+
+def _config(**configurable) -> dict:
+    return {"configurable": configurable}
+
+
+def test_build_pins_settings_and_resolves_topic():
+    context = build_run_context(_state(), _config(max_research_loops=5))
+
+    assert context.values["max_research_loops"] == 5
+    assert set(PINNED_SETTINGS) <= set(context.values)
+    assert "Who maintains it?" in context.research_topic
+    assert "What is LangGraph?" in context.research_topic
+
+    prompt = context.prompt("query_writer", number_queries=3)
+    assert context.current_date in prompt
+    assert context.research_topic in prompt
+
+
+def test_answer_cites_sources_as_configured():
+    links = build_run_context(_state(), _config()).prompt("answer", summaries="")
+    tokens = build_run_context(_state(), _config(citation_tokens=True)).prompt(
+        "answer", summaries=""
+    )
+
+    assert "[S3]" in tokens and "[S3]" not in links
+
+
+def test_load_returns_context_resolved_in_process():
+    context = build_run_context(_state(), _config())
+
+    # A web research branch only gets its query, not the messages
+    branch = {"search_query": "q", "run_context": context.values}
+    assert load_run_context(branch, _config()) is context
+
+
+def test_load_fills_topic_of_context_built_by_a_branch():
+    branch = {"search_query": "q"}
+    context = build_run_context(branch, _config())
+    assert context.research_topic is None
+
+    state = {**_state(), "run_context": context.values}
+    assert load_run_context(state, _config()).research_topic is not None
+
+
+def test_resumed_run_keeps_pinned_settings(contexts):
+    values = build_run_context(_state(), _config(max_research_loops=5)).values
+    # Resumed in another process with another configuration
+    contexts.clear()
+
+    state = {**_state(), "run_context": values}
+    context = load_run_context(state, _config(max_research_loops=1, answer_model="x"))
+
+    assert context.values is values
+    assert context.configuration.max_research_loops == 5
+    assert context.configuration.answer_model == values["answer_model"]
+
+
+def test_contexts_are_evicted_least_recently_used_first(monkeypatch, contexts):
+    monkeypatch.setattr(context_module, "MAX_CACHED_CONTEXTS", 2)
+    first = build_run_context(_state(), _config())
+    second = build_run_context(_state(), _config())
+    load_run_context({"run_context": first.values}, _config())
+
+    build_run_context(_state(), _config())
+
+    assert first.values["id"] in contexts
+    assert second.values["id"] not in contexts
+
+
+def test_context_is_handed_to_nodes_through_config():
+    context = build_run_context(_state(), _config(max_research_loops=5))
+    config = with_run_context(_config(thread_id="t"), context)
+
+    assert config["configurable"]["thread_id"] == "t"
+    assert Configuration.from_runnable_config(config) is context.configuration
+    assert get_run_context({}, config) is context
+
+
+def test_node_on_its_own_loads_or_builds_context():
+    context = build_run_context(_state(), _config())
+
+    assert get_run_context({"run_context": context.values}, None) is context
+    assert get_run_context(_state(), None).values["id"] != context.values["id"]
+
+
+def test_graph_nodes_are_handed_context_of_state():
+    context = build_run_context(_state(), _config())
+    handed = []
+
+    def node(state, config):
+        handed.append(get_run_context(state, config))
+
+    graph._handing_run_context(node)({"run_context": context.values}, _config())
+    graph._handing_run_context(node)(_state(), _config())
+
+    assert handed[0] is context
+    assert handed[1] is not context
+
+
+def test_routing_uses_configuration_of_run_context(monkeypatch, contexts):
+    values = build_run_context(_state(), _config(max_research_loops=3)).values
+    contexts.clear()
+    state = {
+        "run_context": values,
+        "search_query": ["solar power", "wind power"],
+        "follow_up_queries": ["grid storage"],
+        "is_sufficient": False,
+        "research_loop_count": 1,
+        "next_query_id": 2,
+    }
+    # Resumed with another configuration: the run keeps its own loop limit
+    config = _config(max_research_loops=1)
+
+    sends = graph.continue_to_web_research(state, config)
+    resolved = []
+    monkeypatch.setattr(
+        Configuration,
+        "from_runnable_config",
+        classmethod(lambda cls, config=None: resolved.append(config)),
+    )
+    follow_ups = graph.evaluate_research(state, config)
+
+    assert [send.arg["search_query"] for send in sends] == state["search_query"]
+    assert [send.arg["search_query"] for send in follow_ups] == ["grid storage"]
+    assert resolved == []
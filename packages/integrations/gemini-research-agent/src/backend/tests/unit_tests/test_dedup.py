@@ -0,0 +1,62 @@
+import pytest
+
+from agent.dedup import filter_similar_queries, jaccard_similarity, query_shingles
+
+
+def test_query_shingles_ignore_word_order_and_case():
+    assert query_shingles("Solar panel prices") == query_shingles("prices solar PANEL")
+
+
+def test_query_shingles_keep_short_tokens_whole():
+    assert query_shingles("a AI") == {"#a#", "#ai", "ai#"}
+
+
+def test_jaccard_similarity_of_empty_sets_is_one():
+    assert jaccard_similarity(frozenset(), frozenset()) == 1.0
+
+
+def test_inflections_are_near_duplicates():
+    similarity = jaccard_similarity(
+        query_shingles("solar panel prices 2024"),
+        query_shingles("2024 Solar panel price"),
+    )
+    assert 0.8 < similarity < 1.0
+
+
+@pytest.mark.parametrize(
+    ("threshold", "kept"),
+    [
+        # 0.857 similar: dropped at thresholds up to its similarity
+        (0.8, ["solar panel prices 2024", "wind turbine costs 2024"]),
+        (0.85, ["solar panel prices 2024", "wind turbine costs 2024"]),
+        # Above it, the paraphrase is kept
+        (
+            0.9,
+            [
+                "solar panel prices 2024",
+                "2024 Solar panel price",
+                "wind turbine costs 2024",
+            ],
+        ),
+    ],
+)
+def test_filter_similar_queries_thresholds(threshold, kept):
+    queries = [
+        "solar panel prices 2024",
+        "2024 Solar panel price",
+        "wind turbine costs 2024",
+    ]
+    assert filter_similar_queries(queries, [], threshold) == kept
+
+
+def test_filter_similar_queries_drops_queries_already_run():
+    assert filter_similar_queries(
+        ["Solar panel prices?", "battery storage"], ["solar panel prices"], 0.8
+    ) == ["battery storage"]
+
+
+def test_threshold_above_one_keeps_exact_duplicates():
+    assert filter_similar_queries(["a query", "a query"], ["a query"], 1.01) == [
+        "a query",
+        "a query",
+    ]
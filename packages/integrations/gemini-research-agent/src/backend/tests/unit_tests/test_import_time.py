@@ -0,0 +1,52 @@
+import logging
+
+from agent import telemetry
+from agent.benchmarks.import_time import LAZY_MODULES, profile_import, total_ms
+from agent.clients import ClientRegistry
+
+
+def test_graph_imports_without_credentials_or_gemini_sdks():
+    # Raises if the import fails, e.g. because GEMINI_API_KEY isn't set
+    profile = profile_import("agent.graph")
+    modules = {entry["module"] for entry in profile}
+
+    assert "agent.graph" in modules
+    assert not [module for module in modules if module.startswith(LAZY_MODULES)]
+
+
+def test_total_counts_top_level_imports_only():
+    profile = [
+        {"module": "a", "depth": 0, "self_ms": 1.0, "cumulative_ms": 5.0},
+        {"module": "a.b", "depth": 1, "self_ms": 4.0, "cumulative_ms": 4.0},
+        {"module": "c", "depth": 0, "self_ms": 2.0, "cumulative_ms": 2.0},
+    ]
+
+    assert total_ms(profile) == 7.0
+
+
+def test_registry_loads_environment_on_first_client(monkeypatch):
+    loaded = []
+    monkeypatch.setattr("agent.clients.load_dotenv", lambda: loaded.append(True))
+    registry = ClientRegistry()
+    registry.configure(genai_client_factory=lambda **kwargs: object())
+    assert loaded == []
+
+    registry.get_genai_client()
+    registry.get_genai_client()
+
+    assert loaded == [True]
+
+
+def test_retry_counter_is_installed_by_first_node(monkeypatch):
+    logger = logging.getLogger("google_genai._api_client")
+    monkeypatch.setattr(logger, "filters", [])
+    monkeypatch.setattr(logger, "level", logger.level)
+    monkeypatch.setattr(telemetry, "_retry_counter_installed", False)
+
+    node = telemetry.instrument("reflection", lambda state, config: {})
+    assert logger.filters == []
+
+    node({}, {})
+    node({}, {})
+
+    assert len(logger.filters) == 1
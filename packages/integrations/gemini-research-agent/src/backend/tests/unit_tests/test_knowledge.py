@@ -0,0 +1,130 @@
+from types import SimpleNamespace
+
+import pytest
+
+from agent import knowledge as knowledge_module
+from agent.knowledge import (
+    KnowledgeStore,
+    combine_passages,
+    coverage,
+    query_terms,
+    split_passages,
+)
+from agent.sources import register_sources
+from agent.utils import SHORT_URL_PREFIX
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = SimpleNamespace(value=1_000.0)
+    monkeypatch.setattr(
+        knowledge_module, "time", SimpleNamespace(time=lambda: now.value)
+    )
+    return now
+
+
+@pytest.fixture
+def store(tmp_path):
+    return KnowledgeStore(str(tmp_path / "knowledge" / "passages.sqlite3"))
+
+
+def _result(research_id: int, *passages: str) -> tuple:
+    segments = []
+    lines = []
+    for index, passage in enumerate(passages):
+        ref = f"{research_id}-{index}"
+        segments.append(
+            {
+                "label": f"site{index}",
+                "short_url": f"{SHORT_URL_PREFIX}{ref}",
+                "value": f"https://site{index}.com",
+            }
+        )
+        lines.append(f"{passage} [site{index}]({SHORT_URL_PREFIX}{ref})")
+    return "\n\n".join(lines), register_sources(segments)
+
+
+def test_query_terms_drop_stopwords_and_duplicates():
+    assert query_terms("What is the price of solar, and solar panels?") == [
+        "price",
+        "solar",
+        "panels",
+    ]
+
+
+def test_coverage_is_the_fraction_of_terms_found():
+    passages = [{"plain": "Solar prices fell."}, {"plain": "Wind is cheap."}]
+
+    assert coverage(["solar", "wind", "hydro"], passages) == pytest.approx(2 / 3)
+    assert coverage([], passages) == 0.0
+
+
+def test_split_passages():
+    assert split_passages("First paragraph.\n\n- item one\n  \n- item two\n") == [
+        "First paragraph.",
+        "- item one",
+        "- item two",
+    ]
+
+
+def test_search_ranks_passages_with_bm25(store, clock):
+    text, sources = _result(
+        0,
+        "Solar panel prices fell sharply as solar panel production scaled up.",
+        "Wind turbines are getting larger, and solar farms share their sites.",
+        "Battery storage costs dropped too.",
+    )
+    assert store.add("solar panel prices", text, sources) == 3
+
+    passages = store.search("solar panel prices", max_age_seconds=60, limit=5)
+
+    assert [passage["plain"].split()[0] for passage in passages] == ["Solar", "Wind"]
+    assert passages[0]["score"] < passages[1]["score"]
+    assert "[site0]" not in passages[0]["plain"]
+    assert passages[0]["sources"]["urls"] == ["https://site0.com"]
+
+
+def test_search_matches_word_stems(store, clock):
+    store.add("q", *_result(0, "Prices of panels keep falling."))
+
+    assert len(store.search("panel price", max_age_seconds=60, limit=5)) == 1
+
+
+def test_search_skips_passages_older_than_max_age(store, clock):
+    store.add("q", *_result(0, "Solar panel prices fell."))
+    clock.value += 120
+    store.add("q", *_result(1, "Solar panel installations grew."))
+
+    passages = store.search("solar panel", max_age_seconds=60, limit=5)
+    assert [passage["plain"] for passage in passages] == [
+        "Solar panel installations grew. "
+    ]
+
+
+def test_passage_gathered_again_is_refreshed(store, clock):
+    store.add("q", *_result(0, "Solar panel prices fell."))
+    clock.value += 120
+    assert store.add("q", *_result(3, "Solar panel prices fell.")) == 1
+
+    assert len(store.search("solar", max_age_seconds=60, limit=5)) == 1
+
+
+def test_search_without_content_words(store, clock):
+    store.add("q", *_result(0, "What is it?"))
+
+    assert store.search("what is it", max_age_seconds=60, limit=5) == []
+
+
+def test_combine_passages_renumbers_citations_to_branch(store, clock):
+    store.add(
+        "q",
+        *_result(2, "Solar panel prices fell.", "Solar panel output grew."),
+    )
+    passages = store.search("solar panel", max_age_seconds=60, limit=5)
+
+    text, sources = combine_passages(passages, research_id=7)
+
+    assert f"{SHORT_URL_PREFIX}2-" not in text
+    assert text.count(f"{SHORT_URL_PREFIX}7-") == 2
+    assert sorted(sources["urls"]) == ["https://site0.com", "https://site1.com"]
+    assert set(sources["refs"]) == {"7-0", "7-1"}
@@ -0,0 +1,71 @@
+import pytest
+
+from agent.compaction import estimate_tokens
+from agent.pruning import bm25_scores, prune_summaries
+
+SUMMARIES = [
+    "Solar panel prices fell [a](https://s/0-0).\n\n"
+    "The conference dinner was served on the terrace this year.",
+    "Celebrity gossip filled the sports pages all week long.\n\n"
+    "Solar prices keep dropping [S3].",
+]
+
+RELEVANT = [
+    "Solar panel prices fell [a](https://s/0-0).",
+    "Solar prices keep dropping [S3].",
+]
+
+
+def test_bm25_scores_rank_matching_documents():
+    scores = bm25_scores(
+        ["solar", "prices"],
+        [["solar", "prices", "fell"], ["wind", "costs"], ["solar", "farms"]],
+    )
+
+    assert scores[1] == 0.0
+    assert scores[0] > scores[2] > 0.0
+
+
+def test_bm25_scores_favor_shorter_documents():
+    scores = bm25_scores(["solar"], [["solar", "x"], ["solar", "x", "y", "z", "w"]])
+
+    assert scores[0] > scores[1]
+
+
+def test_bm25_scores_without_documents():
+    assert bm25_scores(["solar"], []) == []
+
+
+@pytest.mark.parametrize("token_budget", [0, -1, estimate_tokens("".join(SUMMARIES))])
+def test_summaries_within_budget_are_unchanged(token_budget):
+    assert prune_summaries(SUMMARIES, "solar prices", token_budget) == (SUMMARIES, [])
+
+
+def test_prune_keeps_relevant_passages_in_order():
+    budget = sum(map(estimate_tokens, RELEVANT))
+
+    pruned, dropped = prune_summaries(SUMMARIES, "solar prices", budget)
+
+    assert pruned == RELEVANT
+    assert [(record["summary"], record["passage"]) for record in dropped] == [
+        (0, 1),
+        (1, 0),
+    ]
+    assert all(record["score"] == 0.0 for record in dropped)
+    assert dropped[0]["preview"].startswith("The conference dinner")
+    assert dropped[0]["tokens"] == estimate_tokens(dropped[0]["preview"])
+
+
+def test_prune_omits_summaries_left_without_passages():
+    pruned, dropped = prune_summaries(
+        ["Celebrity gossip and sports.", "Solar prices fell."], "solar prices", 6
+    )
+
+    assert pruned == ["Solar prices fell."]
+    assert dropped[0]["summary"] == 0
+
+
+def test_prune_keeps_best_passage_even_if_too_long():
+    pruned, _ = prune_summaries(SUMMARIES, "solar panel prices", 1)
+
+    assert pruned == [RELEVANT[0]]
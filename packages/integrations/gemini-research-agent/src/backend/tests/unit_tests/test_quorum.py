@@ -0,0 +1,222 @@
+import sys
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+import agent.graph  # noqa: F401
+from agent import quorum
+from agent.quorum import (
+    Wave,
+    forget_waves,
+    join_wave,
+    quorum_enabled,
+    run_branch,
+    straggler_queries,
+)
+
+graph = sys.modules["agent.graph"]
+
+
+def _configurable(**overrides):
+    settings = {
+        "wave_quorum": 1.0,
+        "wave_deadline_ms": 0,
+        "branch_timeout_ms": 0,
+        "hedge_after_ms": 0,
+    }
+    settings.update(overrides)
+    return SimpleNamespace(**settings)
+
+
+def _config(thread_id: str) -> dict:
+    return {"configurable": {"thread_id": thread_id}}
+
+
+@pytest.fixture(autouse=True)
+def no_waves():
+    yield
+    quorum._waves.clear()
+
+
+def test_quorum_is_rounded_up_and_bounded_by_size():
+    assert Wave(("run", 0), 3, 0.5, 0).required == 2
+    assert Wave(("run", 0), 3, 0.0, 0).required == 1
+    assert Wave(("run", 0), 3, 2.0, 0).required == 3
+
+
+def test_wave_is_cut_once_quorum_has_returned():
+    wave = Wave(("run", 0), 4, 0.5, 0)
+    wave.finish()
+    assert not wave.is_cut()
+    wave.finish()
+    assert wave.is_cut()
+
+
+def test_wave_is_cut_at_deadline(monkeypatch):
+    clock = SimpleNamespace(value=100.0)
+    monkeypatch.setattr(quorum, "time", SimpleNamespace(monotonic=lambda: clock.value))
+    wave = Wave(("run", 0), 4, 1.0, deadline_s=2)
+
+    clock.value += 1.9
+    assert not wave.is_cut()
+    clock.value += 0.1
+    assert wave.is_cut()
+
+
+def test_wave_is_shared_per_run_and_forgotten_by_last_branch():
+    configurable = _configurable(wave_quorum=0.5)
+    with join_wave(_config("a"), 1, 2, configurable) as first:
+        with join_wave(_config("a"), 1, 2, configurable) as second:
+            with join_wave(_config("b"), 1, 2, configurable) as other:
+                assert first is second
+                assert other is not first
+        assert ("a", 1) in quorum._waves
+
+    assert ("a", 1) not in quorum._waves
+    assert ("b", 1) in quorum._waves
+
+
+def test_forget_waves_only_forgets_the_waves_of_the_run():
+    configurable = _configurable()
+    for thread_id in ("a", "b"):
+        with join_wave(_config(thread_id), 1, 2, configurable):
+            pass
+
+    forget_waves(_config("a"))
+
+    assert list(quorum._waves) == [("b", 1)]
+
+
+def test_quorum_enabled():
+    assert not quorum_enabled(_configurable())
+    assert quorum_enabled(_configurable(wave_quorum=0.8))
+    assert quorum_enabled(_configurable(hedge_after_ms=500))
+
+
+def test_run_branch_returns_result_and_counts_it():
+    wave = Wave(("run", 0), 2, 1.0, 0)
+    outcome = run_branch(wave, lambda: "result", _configurable())
+
+    assert outcome.result == "result"
+    assert not outcome.straggled
+    assert not outcome.hedged
+    assert wave.returned == 1
+
+
+def test_run_branch_straggles_once_wave_is_cut():
+    wave = Wave(("run", 0), 2, 0.5, 0)
+    wave.finish()
+    release = threading.Event()
+
+    outcome = run_branch(wave, release.wait, _configurable())
+    release.set()
+
+    assert outcome.straggled
+    assert wave.returned == 1
+
+
+def test_run_branch_straggles_after_branch_timeout():
+    wave = Wave(("run", 0), 1, 1.0, 0)
+    release = threading.Event()
+
+    outcome = run_branch(wave, release.wait, _configurable(branch_timeout_ms=50))
+    release.set()
+
+    assert outcome.straggled
+
+
+def test_run_branch_hedges_slow_search():
+    wave = Wave(("run", 0), 1, 1.0, 0)
+    release = threading.Event()
+    calls = []
+
+    def search():
+        calls.append(None)
+        # The first request hangs, the hedged one returns right away
+        if len(calls) == 1:
+            release.wait()
+        return "hedged result"
+
+    outcome = run_branch(wave, search, _configurable(hedge_after_ms=50))
+    release.set()
+
+    assert outcome.result == "hedged result"
+    assert outcome.hedged
+
+
+def test_run_branch_raises_search_error():
+    def search():
+        raise ValueError("search failed")
+
+    with pytest.raises(ValueError):
+        run_branch(Wave(("run", 0), 1, 1.0, 0), search, _configurable())
+
+
+def test_straggler_queries_of_last_wave():
+    state = {
+        "research_loop_count": 2,
+        "deferred_queries": [
+            {"query": "first wave", "wave": 0},
+            {"query": "last wave", "wave": 1},
+            {"query": "last wave", "wave": 1},
+        ],
+    }
+
+    assert straggler_queries(state) == ["last wave"]
+
+
+def _ids(sends) -> list:
+    return [send.arg["id"] for send in sends]
+
+
+def test_branch_ids_are_never_reused_after_stragglers():
+    state = {
+        "search_query": ["solar prices", "wind costs", "battery storage"],
+        "next_query_id": 0,
+    }
+    first_wave = _ids(graph.continue_to_web_research(state, {}))
+    assert first_wave == [0, 1, 2]
+
+    # The last branch straggled: its query is deferred, but it still takes its id
+    straggler = graph._straggler_update(
+        {"search_query": "battery storage", "wave": 0},
+        SimpleNamespace(straggler_policy="defer"),
+    )
+    state = {
+        "is_sufficient": False,
+        "research_loop_count": 1,
+        "max_research_loops": 3,
+        "search_query": ["solar prices", "wind costs"],
+        "follow_up_queries": ["heat pump efficiency"],
+        "deferred_queries": straggler["deferred_queries"],
+        "next_query_id": 2 + straggler["next_query_id"],
+    }
+    sends = graph.evaluate_research(state, {})
+    second_wave = _ids(sends)
+
+    assert [send.arg["search_query"] for send in sends] == [
+        "battery storage",
+        "heat pump efficiency",
+    ]
+    assert second_wave == [3, 4]
+    assert not set(first_wave) & set(second_wave)
+
+
+def test_stragglers_dont_delay_new_searches():
+    cut_wave = Wave(("run", 0), 2, 0.5, 0)
+    cut_wave.finish()
+    release = threading.Event()
+    # More abandoned searches than a default thread pool has workers
+    for _ in range(64):
+        assert run_branch(cut_wave, release.wait, _configurable()).straggled
+
+    wave = Wave(("run", 1), 1, 1.0, 0)
+    try:
+        outcome = run_branch(
+            wave, lambda: "result", _configurable(branch_timeout_ms=500)
+        )
+    finally:
+        release.set()
+
+    assert outcome.result == "result"
@@ -0,0 +1,165 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from agent.compaction import estimate_tokens
+from agent.rate_limit import (
+    AdaptiveConcurrency,
+    MemoryBuckets,
+    RateLimiter,
+    SqliteBuckets,
+    is_rate_limit_error,
+    output_tokens,
+    parse_rate_limits,
+)
+from agent.tools_and_schemas import Reflection
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def buckets(request, tmp_path):
+    if request.param == "memory":
+        return MemoryBuckets()
+    return SqliteBuckets(str(tmp_path / "rate_limits.sqlite3"))
+
+
+def test_bucket_starts_full_and_waits_for_refill(buckets):
+    # 2 requests of capacity, refilled at one per second
+    request = [("model:requests", 1, 2, 1.0)]
+
+    assert buckets.take(request, now=0.0) == 0
+    assert buckets.take(request, now=0.0) == 0
+    assert buckets.take(request, now=0.0) == pytest.approx(1.0)
+    assert buckets.take(request, now=0.5) == pytest.approx(0.5)
+    assert buckets.take(request, now=1.0) == 0
+
+
+def test_take_is_all_or_nothing(buckets):
+    requests = [("model:requests", 1, 10, 1.0), ("model:tokens", 50, 100, 10.0)]
+    assert buckets.take(requests, now=0.0) == 0
+    assert buckets.take(requests, now=0.0) == 0
+
+    # The token bucket is empty: no request is taken either
+    assert buckets.take(requests, now=0.0) == pytest.approx(5.0)
+    assert buckets.take([("model:requests", 8, 10, 1.0)], now=0.0) == 0
+
+
+def test_call_larger_than_capacity_waits_for_full_bucket(buckets):
+    assert buckets.take([("model:tokens", 60, 100, 10.0)], now=0.0) == 0
+    assert buckets.take([("model:tokens", 500, 100, 10.0)], now=0.0) == (
+        pytest.approx(6.0)
+    )
+    assert buckets.take([("model:tokens", 500, 100, 10.0)], now=6.0) == 0
+
+
+def test_adjust_debits_the_actual_usage(buckets):
+    assert buckets.take([("model:tokens", 10, 100, 1.0)], now=0.0) == 0
+    # The call used 90 tokens instead of the 10 estimated
+    buckets.adjust(("model:tokens", 80, 100, 1.0), now=0.0)
+
+    assert buckets.take([("model:tokens", 20, 100, 1.0)], now=0.0) == (
+        pytest.approx(10.0)
+    )
+
+
+def test_aimd_grows_by_one_slot_per_window_of_calls():
+    concurrency = AdaptiveConcurrency(initial=2, maximum=8, latency_target_s=0)
+    # +1/limit per call: 2 -> 2.5 -> 2.9
+    for _ in range(2):
+        concurrency.acquire()
+        concurrency.release(latency_s=0.1, throttled=False)
+
+    assert concurrency.limit == pytest.approx(2.9)
+    assert concurrency.in_flight == 0
+
+
+def test_aimd_halves_on_429_and_shrinks_on_slow_calls():
+    concurrency = AdaptiveConcurrency(initial=8, maximum=8, latency_target_s=1.0)
+    concurrency.acquire()
+    concurrency.release(latency_s=0.1, throttled=True)
+    assert concurrency.limit == 4
+    assert concurrency.throttled == 1
+
+    concurrency.acquire()
+    concurrency.release(latency_s=2.0, throttled=False)
+    assert concurrency.limit == pytest.approx(3.6)
+
+
+def test_aimd_limit_stays_within_bounds():
+    concurrency = AdaptiveConcurrency(initial=1, maximum=2, latency_target_s=0)
+    for _ in range(10):
+        concurrency.acquire()
+        concurrency.release(latency_s=0.1, throttled=True)
+    assert concurrency.limit == 1
+
+    for _ in range(10):
+        concurrency.acquire()
+        concurrency.release(latency_s=0.1, throttled=False)
+    assert concurrency.limit == 2
+
+
+def test_limiter_counts_429s_and_releases_the_slot():
+    limiter = RateLimiter(MemoryBuckets())
+    configurable = SimpleNamespace(
+        rate_limits={"model": {"rpm": 60}},
+        adaptive_concurrency_max=8,
+        adaptive_latency_target_ms=0,
+    )
+
+    with pytest.raises(RuntimeError):
+        with limiter.limit("model", "prompt", configurable):
+            raise RuntimeError("429 RESOURCE_EXHAUSTED")
+
+    assert limiter.stats() == {"model": {"limit": 1, "in_flight": 0, "throttled": 1}}
+
+
+def test_is_rate_limit_error():
+    assert is_rate_limit_error(SimpleNamespace(code=429))
+    assert is_rate_limit_error(RuntimeError("RESOURCE_EXHAUSTED: quota"))
+    assert not is_rate_limit_error(RuntimeError("500 internal"))
+
+
+def test_parse_rate_limits():
+    assert parse_rate_limits('{"model": {"rpm": 10}}') == {"model": {"rpm": 10}}
+    assert parse_rate_limits(" ") == {}
+    assert parse_rate_limits(None) == {}
+
+
+def _tpm_limiter():
+    configurable = SimpleNamespace(
+        rate_limits={"model": {"tpm": 6_000}},
+        adaptive_concurrency_max=0,
+        adaptive_latency_target_ms=0,
+    )
+    return RateLimiter(MemoryBuckets()), configurable
+
+
+def test_slot_reconciles_reported_usage():
+    limiter, configurable = _tpm_limiter()
+    result = SimpleNamespace(usage_metadata={"total_tokens": 1_000})
+
+    with limiter.limit("model", "x" * 400, configurable) as slot:
+        slot.record(result)
+
+    # 1000 of the 6000 tokens per minute were used: 5000 are left, not 5001
+    tokens = [("model:tokens", 5_000, 6_000, 100.0)]
+    assert limiter.buckets.take(tokens, time.time()) == 0
+    assert limiter.buckets.take([("model:tokens", 1, 6_000, 1e-6)], time.time()) > 0
+
+
+def test_slot_charges_output_estimate_of_structured_output():
+    limiter, configurable = _tpm_limiter()
+    result = Reflection(
+        is_sufficient=False,
+        knowledge_gap="x" * 396,
+        follow_up_queries=["y" * 400],
+    )
+
+    with limiter.limit("model", "x" * 400, configurable) as slot:
+        slot.record(result)
+
+    used = estimate_tokens("x" * 400) + output_tokens(result)
+    assert output_tokens(result) > 200
+    tokens = [("model:tokens", 6_000 - used, 6_000, 100.0)]
+    assert limiter.buckets.take(tokens, time.time()) == 0
+    assert limiter.buckets.take([("model:tokens", 1, 6_000, 1e-6)], time.time()) > 0
@@ -0,0 +1,157 @@
+import time
+
+from langgraph.graph import START, StateGraph
+from langgraph.types import Send
+
+from agent.sources import (
+    citation_expander,
+    cited_sources,
+    empty_registry,
+    merge_source_registries,
+    register_sources,
+    registry_sources,
+    renumber_refs,
+    tokenize_citations,
+)
+from agent.state import OverallState
+from agent.utils import SHORT_URL_PREFIX
+
+
+def _segment(ref: str, url: str, label: str) -> dict:
+    return {"label": label, "short_url": f"{SHORT_URL_PREFIX}{ref}", "value": url}
+
+
+def test_register_sources_interns_urls():
+    registry = register_sources(
+        [
+            _segment("0-0", "https://example.com/a", "example"),
+            _segment("0-1", "https://other.org/b", "other"),
+            _segment("0-2", "https://example.com/a", "example"),
+            {"label": "no short url", "value": "https://ignored.net"},
+        ]
+    )
+
+    assert registry == {
+        "urls": ["https://example.com/a", "https://other.org/b"],
+        "labels": ["example", "other"],
+        "refs": {"0-0": 0, "0-1": 1, "0-2": 0},
+    }
+
+
+def test_merge_source_registries_reuses_ids_of_known_urls():
+    left = register_sources(
+        [
+            _segment("0-0", "https://example.com/a", "example"),
+            _segment("0-1", "https://other.org/b", "other"),
+        ]
+    )
+    right = register_sources(
+        [
+            _segment("1-0", "https://new.net/c", "new"),
+            _segment("1-1", "https://other.org/b", "other"),
+        ]
+    )
+
+    assert merge_source_registries(left, right) == {
+        "urls": ["https://example.com/a", "https://other.org/b", "https://new.net/c"],
+        "labels": ["example", "other", "new"],
+        "refs": {"0-0": 0, "0-1": 1, "1-0": 2, "1-1": 1},
+    }
+
+
+def test_merge_source_registries_with_empty_side():
+    registry = register_sources([_segment("0-0", "https://example.com/a", "ex")])
+
+    assert merge_source_registries(None, registry) is registry
+    assert merge_source_registries(registry, empty_registry()) is registry
+    assert merge_source_registries(None, None) == empty_registry()
+
+
+def test_renumber_refs_moves_refs_of_a_branch():
+    registry = register_sources([_segment("3-0", "https://example.com/a", "ex")])
+
+    assert renumber_refs(registry, "3-", "7-")["refs"] == {"7-0": 0}
+
+
+def test_registry_sources_round_trip():
+    segments = [
+        _segment("0-0", "https://example.com/a", "example"),
+        _segment("0-1", "https://other.org/b", "other"),
+    ]
+
+    assert registry_sources(register_sources(segments)) == segments
+    assert registry_sources(None) == []
+
+
+def test_citation_tokens_expand_back_to_links():
+    registry = merge_source_registries(
+        register_sources([_segment("0-0", "https://example.com/a", "example")]),
+        register_sources(
+            [
+                _segment("1-0", "https://example.com/a", "example"),
+                _segment("1-1", "https://other.org/b", "other"),
+            ]
+        ),
+    )
+    summary = (
+        f"Claim [example]({SHORT_URL_PREFIX}1-0) and "
+        f"[other]({SHORT_URL_PREFIX}1-1), unknown [x]({SHORT_URL_PREFIX}9-9)"
+    )
+
+    tokenized = tokenize_citations(summary, registry)
+    assert tokenized == f"Claim [S0] and [S1], unknown [x]({SHORT_URL_PREFIX}9-9)"
+
+    expander = citation_expander(registry)
+    assert expander.expand(f"{tokenized} [other]({SHORT_URL_PREFIX}1-1)") == (
+        "Claim [example](https://example.com/a) and [other](https://other.org/b), "
+        f"unknown [x]({SHORT_URL_PREFIX}9-9) [other](https://other.org/b)"
+    )
+    assert [source["value"] for source in expander.cited_sources] == [
+        "https://example.com/a",
+        "https://other.org/b",
+    ]
+
+
+def test_cited_sources_in_order_of_first_appearance():
+    sources = [
+        {"label": "a", "value": "https://a.com"},
+        {"label": "b", "value": "https://b.com"},
+        {"label": "a", "value": "https://a.com"},
+        {"label": "c", "value": "https://c.com"},
+    ]
+    answer = "First [b](https://b.com), then [a](https://a.com) and [b](https://b.com)."
+
+    assert cited_sources(answer, sources) == [sources[1], sources[0]]
+
+
+def test_graph_merges_branch_registries_in_order_they_were_sent():
+    delays = {0: 0.1, 1: 0.05, 2: 0.0}
+    finished = []
+
+    def web_research(branch: dict) -> dict:
+        time.sleep(delays[branch["id"]])
+        finished.append(branch["id"])
+        # Every branch finds a new source and the one all of them share
+        segments = [
+            _segment(f"{branch['id']}-0", f"https://{branch['id']}.com", "own"),
+            _segment(f"{branch['id']}-1", "https://shared.com", "shared"),
+        ]
+        return {"source_registry": register_sources(segments)}
+
+    builder = StateGraph(OverallState)
+    builder.add_node("web_research", web_research)
+    builder.add_conditional_edges(
+        START,
+        lambda state: [Send("web_research", {"id": key}) for key in delays],
+        ["web_research"],
+    )
+    registry = builder.compile().invoke({"messages": []})["source_registry"]
+
+    assert finished == [2, 1, 0]
+    assert registry["urls"] == [
+        "https://0.com",
+        "https://shared.com",
+        "https://1.com",
+        "https://2.com",
+    ]
+    assert registry["refs"]["2-1"] == registry["refs"]["0-1"] == 1
@@ -0,0 +1,102 @@
+import asyncio
+import random
+
+import pytest
+from langchain_core.messages import HumanMessage
+
+from agent.benchmarks.research_graph import percentiles
+from agent.benchmarks.stub import (
+    LatencyDistribution,
+    StubSettings,
+    install_stub_backend,
+    uninstall_stub_backend,
+)
+from agent.clients import create_chat_model, get_chat_model, registry
+from agent.graph import graph
+from agent.tools_and_schemas import RatedReflection, SearchQueryList
+
+
+@pytest.fixture
+def stub():
+    no_latency = LatencyDistribution.parse("const:0")
+    settings = StubSettings(
+        no_latency, no_latency, no_latency, no_latency, grounding_chunks=3, seed=0
+    )
+    install_stub_backend(settings)
+    yield settings
+    uninstall_stub_backend()
+
+
+def _state(queries: int = 2, loops: int = 2) -> dict:
+    return {
+        "messages": [HumanMessage(content="What powers the grid?")],
+        "initial_search_query_count": queries,
+        "max_research_loops": loops,
+    }
+
+
+@pytest.mark.parametrize(
+    ("spec", "low", "high"),
+    [("const:250", 0.25, 0.25), ("uniform:100:200", 0.1, 0.2), ("const:-5", 0, 0)],
+)
+def test_latency_distribution_samples_seconds(spec, low, high):
+    distribution = LatencyDistribution.parse(spec)
+    rng = random.Random(0)
+
+    assert all(low <= distribution.sample(rng) <= high for _ in range(20))
+
+
+def test_unknown_latency_distribution_is_rejected():
+    with pytest.raises(ValueError, match="Unknown latency distribution"):
+        LatencyDistribution.parse("normal:1:2")
+
+
+def test_structured_outputs_follow_prompt_and_settings(stub):
+    model = get_chat_model("stub", 1.0)
+
+    queries = model.with_structured_output(SearchQueryList).invoke(
+        "Don't produce more than 4 queries."
+    )
+    reflection = model.with_structured_output(RatedReflection).invoke("reflect")
+
+    assert len(queries.query) == 4
+    assert len(reflection.follow_up_queries) == stub.follow_up_queries
+    assert 0.5 <= reflection.confidence <= 1.0
+
+
+def test_graph_researches_with_stub_backend(stub):
+    result = graph.invoke(_state(), {"configurable": {}})
+
+    nodes = [record["node"] for record in result["telemetry"]]
+    # The stub reflection never finds the research sufficient
+    assert nodes.count("reflection") == 2
+    assert nodes.count("web_research") == 2 + stub.follow_up_queries
+    assert nodes[-1] == "finalize_answer"
+    assert result["sources_gathered"]
+    assert all(
+        source["value"] in result["messages"][-1].content
+        for source in result["sources_gathered"]
+    )
+
+
+def test_async_graph_researches_with_stub_backend(stub):
+    result = asyncio.run(graph.ainvoke(_state(1, 1), {"configurable": {}}))
+
+    assert result["research_loop_count"] == 1
+    assert result["messages"][-1].content
+
+
+def test_uninstall_restores_gemini_clients(stub):
+    uninstall_stub_backend()
+
+    assert registry.chat_model_factory is create_chat_model
+
+
+def test_percentiles_in_milliseconds():
+    assert percentiles([0.3, 0.1, 0.2]) == {
+        "count": 3,
+        "p50_ms": 200.0,
+        "p95_ms": 300.0,
+        "p99_ms": 300.0,
+    }
+    assert percentiles([]) == {}
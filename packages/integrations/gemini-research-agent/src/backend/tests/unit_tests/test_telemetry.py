@@ -0,0 +1,185 @@
+import asyncio
+import logging
+from types import SimpleNamespace
+
+import pytest
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, LLMResult
+
+from agent import telemetry
+from agent.telemetry import (
+    Counter,
+    Histogram,
+    LatencyStats,
+    MetricsRegistry,
+    NodeMetrics,
+    instrument,
+    record_genai_usage,
+    summarize_run,
+)
+
+
+@pytest.fixture(autouse=True)
+def metrics(monkeypatch):
+    metrics = MetricsRegistry()
+    monkeypatch.setattr(telemetry, "metrics", metrics)
+    monkeypatch.setattr(telemetry, "_retry_counter_installed", True)
+    return metrics
+
+
+def _record(node: str = "reflection", wall_ms: float = 200.0, **fields) -> dict:
+    return {
+        "node": node,
+        "wall_ms": wall_ms,
+        "queue_ms": 10.0,
+        "calls": 1,
+        "input_tokens": 100,
+        "output_tokens": 20,
+        "retries": 0,
+        **fields,
+    }
+
+
+def test_histogram_counts_values_in_bucket_of_their_upper_bound():
+    histogram = Histogram("latency", "Latency.", "node", (0.1, 1))
+    for value in (0.05, 0.1, 0.5, 1, 3):
+        histogram.observe("a", value)
+
+    assert histogram.render() == [
+        "# HELP latency Latency.",
+        "# TYPE latency histogram",
+        'latency_bucket{node="a",le="0.1"} 2',
+        'latency_bucket{node="a",le="1"} 4',
+        'latency_bucket{node="a",le="+Inf"} 5',
+        'latency_sum{node="a"} 4.65',
+        'latency_count{node="a"} 5',
+    ]
+
+
+def test_histogram_series_are_rendered_per_label_value():
+    histogram = Histogram("latency", "Latency.", "node", (1,))
+    histogram.observe("b", 2)
+    histogram.observe("a", 0.5)
+
+    series = [line for line in histogram.render() if "_count" in line]
+    assert series == ['latency_count{node="a"} 1', 'latency_count{node="b"} 1']
+
+
+def test_counter_renders_label_values():
+    counter = Counter("tokens_total", "Tokens.", ("node", "direction"))
+    counter.inc(("reflection", "input"), 100)
+    counter.inc(("reflection", "input"), 50)
+
+    assert counter.render()[-1] == (
+        'tokens_total{node="reflection",direction="input"} 150.0'
+    )
+
+
+def test_latency_quantiles_of_recent_window():
+    stats = LatencyStats(window=4)
+    for seconds in (10.0, 1.0, 2.0, 3.0, 4.0):
+        stats.observe("reflection", "flash", seconds)
+
+    assert stats.quantile("reflection", "flash", 0.5) == (2.0, 4)
+    assert stats.quantile("reflection", None, 1.0) == (4.0, 4)
+    assert stats.quantile("reflection", "pro", 0.5) == (None, 0)
+
+
+def test_registry_renders_records_and_skips_failures_in_latencies(metrics):
+    metrics.observe(_record(grounding_chunks=3, model="flash"))
+    metrics.observe(_record(wall_ms=90_000.0), "error")
+
+    text = metrics.render()
+    assert (
+        'research_node_duration_seconds_bucket{node="reflection",le="0.25"} 1' in text
+    )
+    assert 'research_node_duration_seconds_bucket{node="reflection",le="120"} 2' in text
+    assert 'research_grounding_chunks_count{node="reflection"} 1' in text
+    assert 'research_node_executions_total{node="reflection",status="error"} 1' in text
+    assert 'research_node_tokens_total{node="reflection",direction="input"} 200' in text
+    assert metrics.latencies.quantile("reflection", "flash", 1.0) == (0.2, 1)
+
+
+def test_instrumented_node_returns_and_aggregates_its_record(metrics):
+    def node(state, config):
+        node_metrics = telemetry.current_metrics()
+        node_metrics.add_call(0.5, "flash")
+        node_metrics.add_tokens(10, 2)
+        return {"answer": 1}
+
+    update = instrument("web_research", node)({"id": 3}, {})
+
+    assert update["answer"] == 1
+    [record] = update["telemetry"]
+    assert record["branch"] == 3
+    assert record["model"] == "flash"
+    assert record["queue_ms"] == 500
+    assert (record["input_tokens"], record["output_tokens"]) == (10, 2)
+    assert metrics.latencies.quantile("web_research", "flash", 0.5)[1] == 1
+
+
+def test_failed_async_node_is_counted_as_error(metrics):
+    async def node(state, config):
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(instrument("reflection", node)({}, {}))
+
+    assert 'status="error"} 1' in metrics.render()
+    assert telemetry.current_metrics() is None
+
+
+def test_chat_model_usage_and_genai_usage_are_counted():
+    node_metrics = NodeMetrics("web_research")
+    message = AIMessage(
+        content="",
+        usage_metadata={"input_tokens": 7, "output_tokens": 3, "total_tokens": 10},
+    )
+    node_metrics.on_llm_end(LLMResult(generations=[[ChatGeneration(message=message)]]))
+    response = SimpleNamespace(
+        usage_metadata=SimpleNamespace(
+            prompt_token_count=5, candidates_token_count=None
+        ),
+        candidates=[
+            SimpleNamespace(grounding_metadata=SimpleNamespace(grounding_chunks=[1, 2]))
+        ],
+    )
+    token = telemetry._current_metrics.set(node_metrics)
+    try:
+        record_genai_usage(response)
+    finally:
+        telemetry._current_metrics.reset(token)
+
+    assert (node_metrics.input_tokens, node_metrics.output_tokens) == (12, 3)
+    assert node_metrics.grounding_chunks == 2
+
+
+def test_retry_counter_counts_retries_of_current_node():
+    counter = telemetry._RetryCounter(logging.WARNING)
+    node_metrics = NodeMetrics("web_research")
+    token = telemetry._current_metrics.set(node_metrics)
+    try:
+        retry = logging.makeLogRecord({"msg": "Retrying in 1s", "levelno": 20})
+        # Counted, but not emitted below the level the logger had before
+        assert not counter.filter(retry)
+        assert counter.filter(logging.makeLogRecord({"msg": "x", "levelno": 30}))
+    finally:
+        telemetry._current_metrics.reset(token)
+
+    assert node_metrics.retries == 1
+
+
+def test_summarize_run_sums_records_per_node():
+    records = [
+        _record("web_research", 100.0, branch=0, grounding_chunks=4),
+        _record("web_research", 300.0, branch=1, grounding_chunks=2),
+        _record("reflection", citation_tokens_saved=5),
+    ]
+
+    summary = summarize_run(records)
+
+    assert summary["web_research"]["count"] == 2
+    assert summary["web_research"]["wall_ms"] == 400.0
+    assert summary["web_research"]["max_wall_ms"] == 300.0
+    assert summary["web_research"]["grounding_chunks"] == {0: 4, 1: 2}
+    assert summary["reflection"]["citation_tokens_saved"] == 5
@@ -0,0 +1,163 @@
+from types import SimpleNamespace
+
+import pytest
+
+from agent.utils import ShortUrlExpander, get_citations, insert_citation_markers
+
+
+def _citation(start: int, end: int, label: str) -> dict:
+    return {
+        "start_index": start,
+        "end_index": end,
+        "segments": [{"label": label, "short_url": f"https://s/{label}"}],
+    }
+
+
+def _byte_offset(text: str, substring: str) -> int:
+    return len(text[: text.index(substring) + len(substring)].encode("utf-8"))
+
+
+def test_insert_citation_markers_ascii():
+    text = "First claim. Second claim."
+
+    assert insert_citation_markers(
+        text, [_citation(13, 26, "b"), _citation(0, 12, "a")]
+    ) == ("First claim. [a](https://s/a) Second claim. [b](https://s/b)")
+
+
+def test_insert_citation_markers_uses_utf8_byte_offsets():
+    text = "الطاقة الشمسية رخيصة. Wind is cheap too."
+    end = _byte_offset(text, "رخيصة.")
+
+    assert insert_citation_markers(text, [_citation(0, end, "ar")]) == (
+        "الطاقة الشمسية رخيصة. [ar](https://s/ar) Wind is cheap too."
+    )
+
+
+def test_insert_citation_markers_never_splits_a_character():
+    text = "Café au lait"
+    # One byte into the two-byte "é"
+    end = len("Caf".encode("utf-8")) + 1
+
+    assert insert_citation_markers(text, [_citation(0, end, "c")]) == (
+        "Café [c](https://s/c) au lait"
+    )
+
+
+def test_insert_citation_markers_orders_markers_sharing_an_end():
+    text = "Claim."
+    citations = [_citation(3, 6, "late"), _citation(0, 6, "early")]
+
+    assert insert_citation_markers(text, citations) == (
+        "Claim. [early](https://s/early) [late](https://s/late)"
+    )
+
+
+def test_insert_citation_markers_clamps_offsets_past_the_end():
+    assert insert_citation_markers("Claim.", [_citation(0, 99, "a")]) == (
+        "Claim. [a](https://s/a)"
+    )
+
+
+def test_get_citations_builds_segments_from_grounding_metadata():
+    chunks = [
+        SimpleNamespace(web=SimpleNamespace(title="example.com", uri="https://v/0")),
+        SimpleNamespace(web=SimpleNamespace(title="other.org", uri="https://v/1")),
+    ]
+    supports = [
+        SimpleNamespace(
+            segment=SimpleNamespace(start_index=None, end_index=6),
+            grounding_chunk_indices=[0, 1],
+        ),
+        SimpleNamespace(segment=None, grounding_chunk_indices=[0]),
+    ]
+    response = SimpleNamespace(
+        candidates=[
+            SimpleNamespace(
+                grounding_metadata=SimpleNamespace(
+                    grounding_chunks=chunks, grounding_supports=supports
+                )
+            )
+        ]
+    )
+
+    assert get_citations(response, {"https://v/0": "s0", "https://v/1": "s1"}) == [
+        {
+            "start_index": 0,
+            "end_index": 6,
+            "segments": [
+                {"label": "example", "short_url": "s0", "value": "https://v/0"},
+                {"label": "other", "short_url": "s1", "value": "https://v/1"},
+            ],
+        }
+    ]
+
+
+SOURCES = [
+    {"short_url": "https://s/1-1", "value": "https://example.com/a", "label": "a"},
+    {"short_url": "https://s/1-10", "value": "https://example.com/b", "label": "b"},
+    {"short_url": "https://s/2-0", "value": "https://example.com/a", "label": "a"},
+]
+
+
+def test_short_url_expander_expands_in_one_pass():
+    expander = ShortUrlExpander(SOURCES)
+
+    assert expander.expand("[a](https://s/1-1) [b](https://s/1-10)") == (
+        "[a](https://example.com/a) [b](https://example.com/b)"
+    )
+
+
+def test_short_url_expander_collects_each_cited_url_once():
+    expander = ShortUrlExpander(SOURCES)
+    expander.expand("https://s/2-0 https://s/1-10 https://s/1-1")
+
+    assert [source["value"] for source in expander.cited_sources] == [
+        "https://example.com/a",
+        "https://example.com/b",
+    ]
+
+
+def test_short_url_expander_uses_expansions():
+    expander = ShortUrlExpander(SOURCES, {"https://s/1-1": "[S1]"})
+
+    assert expander.expand("see https://s/1-1.") == "see [S1]."
+
+
+def test_short_url_expander_without_sources_keeps_text():
+    expander = ShortUrlExpander([])
+
+    assert expander.expand("https://s/1-1") == "https://s/1-1"
+    assert expander.feed("https://s/1-1") + expander.flush() == "https://s/1-1"
+
+
+def test_short_url_expander_feed_holds_back_partial_urls():
+    expander = ShortUrlExpander(SOURCES)
+
+    assert expander.feed("Solar [a](https://s/1") == "Solar [a]("
+    assert expander.feed("-1") == ""
+    # "1-1" could still continue as "1-10"
+    assert expander.feed("0) done") == "https://example.com/b) done"
+    assert expander.flush() == ""
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 5, 8, 13])
+def test_short_url_expander_chunked_stream_matches_expand(chunk_size):
+    text = (
+        "Claim [a](https://s/1-1), another [b](https://s/1-10) and "
+        "https://s/2-0 at the end https://s/1-1"
+    )
+    expected = ShortUrlExpander(SOURCES).expand(text)
+
+    expander = ShortUrlExpander(SOURCES)
+    streamed = "".join(
+        expander.feed(text[start : start + chunk_size])
+        for start in range(0, len(text), chunk_size)
+    )
+    streamed += expander.flush()
+
+    assert streamed == expected
+    assert [source["value"] for source in expander.cited_sources] == [
+        "https://example.com/a",
+        "https://example.com/b",
+    ]
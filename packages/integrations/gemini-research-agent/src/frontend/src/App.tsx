@@ -35,11 +35,9 @@ export default function App() {
           data: event.generate_query?.search_query?.join(", ") || "",
         };
       } else if (event.web_research) {
-        const sources = event.web_research.sources_gathered || [];
-        const numSources = sources.length;
-        const uniqueLabels = [
-          ...new Set(sources.map((s: any) => s.label).filter(Boolean)),
-        ];
+        const labels: string[] = event.web_research.source_registry?.labels || [];
+        const numSources = labels.length;
+        const uniqueLabels = [...new Set(labels.filter(Boolean))];
         const exampleLabels = uniqueLabels.slice(0, 3).join(", ");
         processedEvent = {
           title: "Web Research",